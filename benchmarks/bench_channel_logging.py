@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Channel Logging Benchmark
+Measures request throughput of an in-process calculator server with runtime
+logging silenced versus fully enabled at debug level
+
+Usage:
+    python benchmarks/bench_channel_logging.py [--requests 5000] [--mode threads]
+"""
+
+import argparse
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.runner import MiniparRunner
+from src.channels import ClientConnection
+from src.runtime_log import configure
+
+
+SERVER_SOURCE = """
+func calcular(op: string, v1: number, v2: number) -> number {{
+    if (op == "+") {{
+        return v1 + v2
+    }}
+    return v1 * v2
+}}
+s_channel calc {{calcular, "bench", "localhost", {port}, {{"mode": "{mode}"}}}}
+"""
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def run(level: str, requests: int, mode: str, log_file) -> float:
+    """Start a fresh server at the given log level and return requests/second"""
+    configure(level, stream=log_file)
+    port = free_port()
+    MiniparRunner().run_source(SERVER_SOURCE.format(port=port, mode=mode))
+
+    client = ClientConnection.connect("localhost", port)
+    start = time.perf_counter()
+    for i in range(requests):
+        client.request(f"+,{i},1")
+    elapsed = time.perf_counter() - start
+    client.close()
+    return requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark channel logging overhead")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--mode", choices=["threads", "selector"], default="threads")
+    args = parser.parse_args()
+
+    # Left open: server threads may still log while the process exits
+    log_file = open(os.devnull, 'w')
+    quiet = run("warning", args.requests, args.mode, log_file)
+    logged = run("debug", args.requests, args.mode, log_file)
+
+    print(f"{'logging':<10} {'req/s':>12}")
+    print(f"{'off':<10} {quiet:>12.0f}")
+    print(f"{'debug':<10} {logged:>12.0f}")
+    print(f"overhead: {(1 - logged / quiet) * 100:.1f}%")
+
+
+if __name__ == '__main__':
+    main()
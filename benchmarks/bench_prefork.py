@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Pre-forked Server Benchmark
+Measures calculator server throughput served by one process versus several
+processes sharing the port, with a client process per connection
+
+Usage:
+    python benchmarks/bench_prefork.py [--processes 4] [--clients 8] [--seconds 3]
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.runner import MiniparRunner
+from src.channels import ClientConnection
+
+
+SERVER_SOURCE = """
+func calcular(op: string, v1: number, v2: number) -> number {{
+    if (op == "+") {{
+        return v1 + v2
+    }}
+    return v1 * v2
+}}
+s_channel calc {{calcular, "bench", "localhost", {port}, {{"processes": {processes}}}}}
+"""
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def client(port: int, seconds: float, counts, index: int):
+    conn = ClientConnection.connect("localhost", port)
+    deadline = time.perf_counter() + seconds
+    done = 0
+    while time.perf_counter() < deadline:
+        conn.request(f"+,{done},1")
+        done += 1
+    conn.close()
+    counts[index] = done
+
+
+def run(processes: int, clients: int, seconds: float) -> float:
+    """Start a server with the given process count and return requests/second"""
+    port = free_port()
+    runner = MiniparRunner()
+    runner.run_source(SERVER_SOURCE.format(port=port, processes=processes))
+    try:
+        counts = multiprocessing.Array('q', clients)
+        workers = [multiprocessing.Process(target=client, args=(port, seconds, counts, i))
+                   for i in range(clients)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return sum(counts) / seconds
+    finally:
+        runner.cleanup()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pre-forked server channels")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    args = parser.parse_args()
+
+    single = run(0, args.clients, args.seconds)
+    forked = run(max(args.processes, 2), args.clients, args.seconds)
+
+    print(f"{os.cpu_count()} CPUs, {args.clients} client processes")
+    print(f"{'processes':<10} {'req/s':>12}")
+    print(f"{1:<10} {single:>12.0f}")
+    print(f"{max(args.processes, 2):<10} {forked:>12.0f}")
+    print(f"speedup: {forked / single:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Channel Telemetry Benchmark
+Measures request throughput of an in-process calculator server with channel
+telemetry disabled versus enabled
+
+Usage:
+    python benchmarks/bench_telemetry.py [--requests 5000] [--mode threads]
+"""
+
+import argparse
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.runner import MiniparRunner
+from src.channels import ClientConnection
+from src.telemetry import telemetry
+
+
+SERVER_SOURCE = """
+func calcular(op: string, v1: number, v2: number) -> number {{
+    if (op == "+") {{
+        return v1 + v2
+    }}
+    return v1 * v2
+}}
+s_channel calc {{calcular, "bench", "localhost", {port}, {{"mode": "{mode}"}}}}
+"""
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def run(enabled: bool, requests: int, mode: str) -> float:
+    """Start a fresh server with telemetry on or off and return requests/second"""
+    telemetry.enabled = enabled
+    port = free_port()
+    MiniparRunner().run_source(SERVER_SOURCE.format(port=port, mode=mode))
+
+    client = ClientConnection.connect("localhost", port)
+    client.bind_stats(telemetry.channel("bench", "client"))
+    start = time.perf_counter()
+    for i in range(requests):
+        client.request(f"+,{i},1")
+    elapsed = time.perf_counter() - start
+    client.close()
+    return requests / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark channel telemetry overhead")
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--mode", choices=["threads", "selector"], default="threads")
+    args = parser.parse_args()
+
+    # Alternate to even out warm-up effects
+    off = max(run(False, args.requests, args.mode), run(False, args.requests, args.mode))
+    on = max(run(True, args.requests, args.mode), run(True, args.requests, args.mode))
+
+    print(f"{'telemetry':<10} {'req/s':>12}")
+    print(f"{'off':<10} {off:>12.0f}")
+    print(f"{'on':<10} {on:>12.0f}")
+    print(f"overhead: {(1 - on / off) * 100:.1f}%")
+
+
+if __name__ == '__main__':
+    main()
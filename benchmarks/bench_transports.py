@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Channel Transport Benchmark
+Measures request round-trip latency between two processes on the same host
+over TCP loopback, a Unix domain socket and shared memory
+
+Usage:
+    python benchmarks/bench_transports.py [--requests 5000]
+"""
+
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.runner import MiniparRunner
+from src.channels import ClientConnection
+
+
+SERVER_SOURCE = """
+func echo(msg: string) -> string {{
+    return msg
+}}
+s_channel bench {{echo, "bench", "{host}", {port}}}
+"""
+
+
+def free_port() -> int:
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def serve(host: str, port: int):
+    MiniparRunner().run_source(SERVER_SOURCE.format(host=host, port=port))
+    while True:
+        time.sleep(3600)
+
+
+def run(host: str, port: int, requests: int) -> float:
+    """Serve from a child process and return the mean round trip in microseconds"""
+    server = multiprocessing.Process(target=serve, args=(host, port), daemon=True)
+    server.start()
+    try:
+        deadline = time.time() + 10
+        while True:
+            try:
+                client = ClientConnection.connect(host, port)
+                break
+            except OSError:
+                if time.time() > deadline:
+                    raise
+                time.sleep(0.05)
+        for _ in range(100):
+            client.request("warmup")
+        start = time.perf_counter()
+        for i in range(requests):
+            client.request(str(i))
+        elapsed = time.perf_counter() - start
+        client.close()
+    finally:
+        server.terminate()
+        server.join()
+    return elapsed / requests * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark channel transports")
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    tag = os.getpid()
+    transports = [
+        ("tcp", "localhost", free_port()),
+        ("unix", f"unix:{tempfile.gettempdir()}/minipar-bench-{tag}.sock", 0),
+        ("shm", f"shm:bench_{tag}", 0),
+    ]
+
+    print(f"{os.cpu_count()} CPUs (shm: polls only with a spare core)")
+    print(f"{'transport':<10} {'rtt (us)':>10} {'speedup':>8}")
+    baseline = None
+    for name, host, port in transports:
+        rtt = run(host, port, args.requests)
+        baseline = baseline or rtt
+        print(f"{name:<10} {rtt:>10.1f} {baseline / rtt:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
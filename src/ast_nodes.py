@@ -2,8 +2,8 @@
 Abstract Syntax Tree Node Definitions for Minipar Language
 """
 
-from dataclasses import dataclass
-from typing import List, Optional, Any
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Any, Tuple
 
 
 @dataclass
@@ -161,6 +161,22 @@ class SeqBlock(ASTNode):
 class ParBlock(ASTNode):
     """Parallel execution block - PAR { stmts }"""
     statements: List[ASTNode]
+    # Set by the semantic analyzer: the variables some branch writes while
+    # another reads or writes them, with the branches (0-based) using each;
+    # whether two branches share a channel; and whether the branches are
+    # independent (neither), so they can run anywhere, in any order, unlocked
+    races: Dict[str, List[int]] = field(default_factory=dict)
+    communicates: bool = False
+    independent: bool = False
+
+
+@dataclass
+class ParForStmt(ASTNode):
+    """Parallel for loop - par for (var x in iterable) reduce(sum: total) { body }"""
+    variable: VarDecl  # Loop variable declaration
+    iterable: ASTNode  # Expression to iterate over
+    body: ASTNode  # Loop body, run once per element in any order
+    reductions: List[Tuple[str, str]] = field(default_factory=list)  # (operator, variable)
 
 
 @dataclass
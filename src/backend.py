@@ -7,7 +7,7 @@ import subprocess
 import os
 import sys
 import platform
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 from pathlib import Path
 
 
@@ -60,8 +60,9 @@ class Backend:
         if not os.path.exists(c_file):
             return False, f"Input file not found: {c_file}"
         
-        # Build GCC command
-        cmd = [self.gcc_path, f"-O{optimization}"]
+        # Build GCC command, with the threading flags only for code that
+        # needs them, so plain programs still build without OpenMP
+        cmd = [self.gcc_path, f"-O{optimization}"] + self.thread_flags(c_file)
         
         # Add input/output files
         cmd.extend([c_file, "-o", output_exe])
@@ -85,6 +86,18 @@ class Backend:
         except Exception as e:
             return False, f"Compilation error: {str(e)}"
     
+    @staticmethod
+    def thread_flags(c_file: str) -> List[str]:
+        """-pthread for PAR blocks and channels, -fopenmp for par for loops"""
+        with open(c_file, 'r', encoding='utf-8') as f:
+            code = f.read()
+        flags = []
+        if "#include <pthread.h>" in code:
+            flags.append("-pthread")
+        if "#pragma omp" in code:
+            flags.append("-fopenmp")
+        return flags
+    
     def get_info(self) -> dict:
         """Get backend information"""
         info = {
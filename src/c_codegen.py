@@ -3,6 +3,7 @@ C Code Generator for Minipar Language
 Translates Three-Address Code (TAC) to C code
 """
 
+import re
 from typing import List, Dict, Set, Optional
 try:
     from src.codegen import TAC, CodeGenerator
@@ -10,6 +11,102 @@ except ImportError:
     from codegen import TAC, CodeGenerator
 
 
+# OpenMP reduction operator for each par for reduction
+OPENMP_REDUCTIONS = {'sum': '+', 'product': '*', 'min': 'min', 'max': 'max'}
+
+# Channel handles index a fixed table, so a channel is an int like every other value
+CHANNEL_RUNTIME = r"""// Bounded channels between PAR branches
+#define __CHAN_MAX 64
+typedef struct {
+    int* items;
+    int capacity, head, count, closed;
+    pthread_mutex_t lock;
+    pthread_cond_t not_empty, not_full;
+} __chan_t;
+__chan_t __chans[__CHAN_MAX];
+int __chan_count = 0;
+pthread_mutex_t __chan_table_lock = PTHREAD_MUTEX_INITIALIZER;
+
+__chan_t* __chan_at(int id) {
+    if (id < 0 || id >= __chan_count) {
+        fprintf(stderr, "invalid channel %d\n", id);
+        exit(1);
+    }
+    return &__chans[id];
+}
+
+int __chan_new(int capacity) {
+    if (capacity < 1) {
+        fprintf(stderr, "channel() capacity must be at least 1, got %d\n", capacity);
+        exit(1);
+    }
+    pthread_mutex_lock(&__chan_table_lock);
+    if (__chan_count == __CHAN_MAX) {
+        fprintf(stderr, "too many channels (at most %d)\n", __CHAN_MAX);
+        exit(1);
+    }
+    int id = __chan_count;
+    __chan_t* ch = &__chans[id];
+    ch->items = (int*)malloc(sizeof(int) * capacity);
+    ch->capacity = capacity;
+    ch->head = 0;
+    ch->count = 0;
+    ch->closed = 0;
+    pthread_mutex_init(&ch->lock, NULL);
+    pthread_cond_init(&ch->not_empty, NULL);
+    pthread_cond_init(&ch->not_full, NULL);
+    __chan_count++;
+    pthread_mutex_unlock(&__chan_table_lock);
+    return id;
+}
+
+int __chan_put(int id, int value) {
+    __chan_t* ch = __chan_at(id);
+    pthread_mutex_lock(&ch->lock);
+    while (ch->count == ch->capacity && !ch->closed) {
+        pthread_cond_wait(&ch->not_full, &ch->lock);
+    }
+    if (ch->closed) {
+        fprintf(stderr, "put() on a closed channel\n");
+        exit(1);
+    }
+    ch->items[(ch->head + ch->count) % ch->capacity] = value;
+    ch->count++;
+    pthread_cond_signal(&ch->not_empty);
+    pthread_mutex_unlock(&ch->lock);
+    return 0;
+}
+
+int __chan_get(int id) {
+    __chan_t* ch = __chan_at(id);
+    pthread_mutex_lock(&ch->lock);
+    while (ch->count == 0 && !ch->closed) {
+        pthread_cond_wait(&ch->not_empty, &ch->lock);
+    }
+    if (ch->count == 0) {
+        fprintf(stderr, "get() on a closed channel with no values left\n");
+        exit(1);
+    }
+    int value = ch->items[ch->head];
+    ch->head = (ch->head + 1) % ch->capacity;
+    ch->count--;
+    pthread_cond_signal(&ch->not_full);
+    pthread_mutex_unlock(&ch->lock);
+    return value;
+}
+
+int __chan_close(int id) {
+    __chan_t* ch = __chan_at(id);
+    pthread_mutex_lock(&ch->lock);
+    ch->closed = 1;
+    pthread_cond_broadcast(&ch->not_empty);
+    pthread_cond_broadcast(&ch->not_full);
+    pthread_mutex_unlock(&ch->lock);
+    return 0;
+}
+"""
+
+
 class CCodeGenerator:
     """Generates C code from Three-Address Code"""
     
@@ -28,6 +125,17 @@ class CCodeGenerator:
         self.par_thread_funcs: List[str] = []
         self.par_thread_code: Dict[int, List[str]] = {}
         self.current_thread_id: Optional[int] = None
+        self.par_depth = 0
+        self.par_serial = False  # The global-scope PAR block being generated races
+        self.par_threads: List[str] = []  # Thread functions of the PAR block being generated
+        self.thread_temps: Set[str] = set()
+        self.saved_indent = 0
+        self.uses_threads = False
+        self.uses_channels = False
+        self.channel_vars: Set[str] = set()
+        self.pending_method: Optional[tuple] = None
+        self.pending_reductions: List[tuple] = []
+        self.parfor_private: Dict[int, tuple] = {}  # id(PARFOR_BEGIN) -> (temps, variables)
         self.pending_params: List[str] = []
         self.last_label: Optional[str] = None
         self.current_local_vars: Dict[str, str] = {}  # Track local variable types in current function
@@ -38,7 +146,9 @@ class CCodeGenerator:
     
     def emit(self, line: str):
         """Emit a line of C code"""
-        if self.current_function:
+        if self.current_thread_id is not None:
+            self.par_thread_code[self.current_thread_id].append(self.indent() + line)
+        elif self.current_function:
             self.function_code.append(self.indent() + line)
         else:
             self.c_code.append(self.indent() + line)
@@ -61,6 +171,9 @@ class CCodeGenerator:
         self.temp_vars = set()
         self.global_vars = {}
         self.function_signatures = {}
+        self.par_thread_funcs = []
+        self.par_thread_code = {}
+        self.channel_vars = set()
         
         # First pass: collect information about functions and variables
         self._analyze_tac(tac_instructions)
@@ -92,6 +205,49 @@ class CCodeGenerator:
                         count += 1
                     j -= 1
         
+        # PAR blocks at global scope run their branches on pthreads; channels
+        # need the runtime, and method calls on their variables become chan calls
+        depth = 0
+        self.uses_threads = False
+        channel_temps = set()
+        for instr in instructions:
+            if instr.op == 'FUNC_BEGIN':
+                depth += 1
+            elif instr.op == 'FUNC_END':
+                depth -= 1
+            elif instr.op == 'PAR_BEGIN' and depth == 0 and instr.arg1 != 'serial':
+                self.uses_threads = True
+            elif instr.op == 'CALL' and instr.arg1 == 'channel':
+                channel_temps.add(instr.result)
+            elif instr.op == 'ASSIGN' and instr.arg1 in channel_temps:
+                self.channel_vars.add(instr.result)
+        self.uses_channels = bool(channel_temps)
+        
+        # Everything a par for body assigns, except its reductions, is private
+        # to one iteration, so it is declared inside the loop
+        self.parfor_private = {}
+        reduced = set()
+        for i, instr in enumerate(instructions):
+            if instr.op == 'PARFOR_REDUCE':
+                reduced.add(instr.arg2)
+            elif instr.op == 'PARFOR_BEGIN':
+                temps, variables = set(), set()
+                depth = 0
+                for inner in instructions[i + 1:]:
+                    if inner.op == 'PARFOR_BEGIN':
+                        depth += 1
+                    elif inner.op == 'PARFOR_END':
+                        if depth == 0:
+                            break
+                        depth -= 1
+                    if self._is_temp(inner.result):
+                        temps.add(inner.result)
+                    elif inner.op == 'ASSIGN' and inner.result not in reduced:
+                        variables.add(inner.result)
+                variables.discard(instr.result)
+                self.parfor_private[id(instr)] = (temps, variables)
+                reduced = set()
+        
         # Build a map of temp variables to their eventual destinations
         # This helps with polymorphic input() typing
         temp_destinations = {}  # temp_var -> destination_var
@@ -148,7 +304,7 @@ class CCodeGenerator:
                 current_func = None
             elif current_func is None:
                 # Global scope - collect global variables and infer types
-                if instr.op == 'ASSIGN' and instr.result and not instr.result.startswith('t'):
+                if instr.op == 'ASSIGN' and instr.result and not self._is_temp(instr.result):
                     # Only infer type on first assignment (don't overwrite)
                     if instr.result not in self.global_vars:
                         # Check if this variable comes from input
@@ -167,6 +323,11 @@ class CCodeGenerator:
         # Store temp destinations for use during code generation
         self.temp_destinations = temp_destinations
     
+    @staticmethod
+    def _is_temp(name) -> bool:
+        """Whether name is a TAC temporary (t0, t1, ...) rather than a variable"""
+        return isinstance(name, str) and re.fullmatch(r't\d+', name) is not None
+    
     def _infer_type(self, value) -> str:
         """Infer C type from a value"""
         if value is None:
@@ -197,12 +358,17 @@ class CCodeGenerator:
         self.emit("#include <string.h>")
         self.emit("#include <stdbool.h>")
         
-        # Add pthread if we have PAR blocks
-        if any(instr.op in ['PAR_BEGIN', 'THREAD_START'] for instr in []):
+        # Add pthread if we have PAR blocks or channels
+        if self.uses_threads or self.uses_channels:
             self.emit("#include <pthread.h>")
         
         self.emit_blank()
         
+        if self.uses_channels:
+            for line in CHANNEL_RUNTIME.splitlines():
+                self.emit(line)
+            self.emit_blank()
+        
         # Add input buffer and helper functions
         self.emit("// Input handling")
         self.emit("#define INPUT_BUFFER_SIZE 1024")
@@ -392,6 +558,8 @@ class CCodeGenerator:
     
     def _generate_main_function(self, instructions: List[TAC]):
         """Generate main function with global scope code"""
+        # Thread functions of PAR blocks are spliced in here, before main
+        main_start = len(self.c_code)
         self.emit("int main() {")
         self.indent_level += 1
         self.last_label = None
@@ -409,7 +577,7 @@ class CCodeGenerator:
                     elif check_instr.op == 'FUNC_END':
                         in_function = False
                 
-                if not in_function and instr.result and instr.result.startswith('t'):
+                if not in_function and self._is_temp(instr.result):
                     global_temps.add(instr.result)
         
         if global_temps:
@@ -437,6 +605,12 @@ class CCodeGenerator:
         self.emit("return 0;")
         self.indent_level -= 1
         self.emit("}")
+        
+        thread_code = []
+        for thread_id in range(len(self.par_thread_funcs)):
+            thread_code.extend(self.par_thread_code[thread_id])
+            thread_code.append("")
+        self.c_code[main_start:main_start] = thread_code
     
     def _generate_instruction(self, instr: TAC):
         """Generate C code for a single TAC instruction"""
@@ -446,6 +620,9 @@ class CCodeGenerator:
         if op in ['FUNC_BEGIN', 'FUNC_END']:
             return
         
+        if self.current_thread_id is not None and self._is_temp(instr.result):
+            self.thread_temps.add(instr.result)
+        
         # Handle PARAM instructions - collect them for the next CALL
         if op == 'PARAM':
             self.pending_params.append(instr.arg1)
@@ -460,6 +637,15 @@ class CCodeGenerator:
             self.indent_level += 1
             return
         
+        # End of a par for body (its continue label may come right before)
+        if op == 'PARFOR_END':
+            if self.last_label:
+                self.emit(";  // Empty statement after label")
+            self.last_label = None
+            self.indent_level -= 1
+            self.emit("}")
+            return
+        
         # If we're generating a non-label instruction, reset last_label
         self.last_label = None
         
@@ -527,7 +713,13 @@ class CCodeGenerator:
             self.pending_params = self.pending_params[:-n_args] if n_args > 0 else []
             
             # Special handling for built-in functions
-            if func_name == 'print':
+            if func_name == 'channel':
+                capacity = self._format_value(call_params[0]) if call_params else "0"
+                if result:
+                    self.emit(f"{result} = __chan_new({capacity});")
+                else:
+                    self.emit(f"__chan_new({capacity});")
+            elif func_name == 'print':
                 # Generate proper printf with actual arguments
                 if call_params:
                     # Build format string and args based on parameter types
@@ -604,7 +796,9 @@ class CCodeGenerator:
         
         # Return
         if op == 'RETURN':
-            if instr.arg1:
+            if self.current_thread_id is not None:
+                self.emit("return NULL;")
+            elif instr.arg1:
                 self.emit(f"return {self._format_value(instr.arg1)};")
             else:
                 self.emit("return 0;")
@@ -623,44 +817,132 @@ class CCodeGenerator:
             return
         
         # PAR blocks - generate pthread code
+        # Only PAR blocks in global scope get threads: their branches become
+        # thread functions over the global variables. Blocks inside functions
+        # or other PAR branches would need their locals captured, so they
+        # still run their branches in order.
         if op == 'PAR_BEGIN':
-            self.emit("// Parallel block (simplified - sequential execution)")
+            self.par_depth += 1
+            if self.par_depth == 1:
+                self.par_serial = instr.arg1 == 'serial'
+            if self._threaded_par():
+                self.emit("// Parallel block: one thread per branch")
+                self.in_par_block = True
+                self.par_threads = []
+            elif self.par_serial and self.par_depth == 1:
+                self.emit("// Parallel block (branches race on shared variables - sequential execution)")
+            else:
+                self.emit("// Parallel block (simplified - sequential execution)")
             self.emit("{")
             self.indent_level += 1
-            self.in_par_block = True
             return
         
         if op == 'PAR_END':
+            if self._threaded_par() and self.par_threads:
+                block = f"__par{len(self.par_thread_funcs) - len(self.par_threads)}"
+                self.emit(f"pthread_t {block}[{len(self.par_threads)}];")
+                for k, thread_func in enumerate(self.par_threads):
+                    self.emit(f"pthread_create(&{block}[{k}], NULL, {thread_func}, NULL);")
+                for k in range(len(self.par_threads)):
+                    self.emit(f"pthread_join({block}[{k}], NULL);")
+                self.in_par_block = False
             self.indent_level -= 1
             self.emit("}")
-            self.in_par_block = False
+            self.par_depth -= 1
             return
         
         if op == 'THREAD_START':
+            if self.in_par_block and self.current_thread_id is None and self._threaded_par():
+                thread_id = len(self.par_thread_funcs)
+                thread_func = f"__par_thread{thread_id}"
+                self.par_thread_funcs.append(thread_func)
+                self.par_threads.append(thread_func)
+                self.par_thread_code[thread_id] = []
+                self.current_thread_id = thread_id
+                self.thread_temps = set()
+                self.saved_indent = self.indent_level
+                self.indent_level = 1
+                return
             self.emit(f"// Thread {instr.arg1 if instr.arg1 else 0} start")
             return
         
         if op == 'THREAD_END':
+            if self.current_thread_id is not None and self.par_depth == 1:
+                if self.last_label:
+                    self.emit(";  // Empty statement after label")
+                    self.last_label = None
+                self.emit("return NULL;")
+                thread_id = self.current_thread_id
+                self.current_thread_id = None
+                self.indent_level = self.saved_indent
+                header = [f"void* {self.par_thread_funcs[thread_id]}(void* __arg) {{"]
+                header.extend(f"    int {temp} = 0;" for temp in sorted(self.thread_temps))
+                self.par_thread_code[thread_id] = header + self.par_thread_code[thread_id] + ["}"]
+                return
             self.emit(f"// Thread {instr.arg1 if instr.arg1 else 0} end")
             return
         
+        # par for over a range: an OpenMP loop whose iterations share the work
+        # of all cores; without OpenMP the pragma is ignored and it runs in order
+        if op == 'PARFOR_REDUCE':
+            self.pending_reductions.append((instr.arg1, instr.arg2))
+            return
+        
+        if op == 'PARFOR_BEGIN':
+            var = instr.result
+            clauses = "".join(f" reduction({OPENMP_REDUCTIONS[operator]}:{name})"
+                              for operator, name in self.pending_reductions)
+            self.pending_reductions = []
+            start, end = self._format_value(instr.arg1), self._format_value(instr.arg2)
+            self.emit(f"#pragma omp parallel for{clauses}")
+            self.emit(f"for (int __{var} = {start}; __{var} < {end}; __{var}++) {{")
+            self.indent_level += 1
+            self.emit(f"int {var} = __{var};")
+            temps, variables = self.parfor_private.get(id(instr), (set(), set()))
+            for temp in sorted(temps):
+                self.emit(f"int {temp} = 0;")
+            for name in sorted(variables):
+                var_type = self.current_local_vars.get(name) or self.global_vars.get(name, 'int')
+                self.emit(f"{var_type} {name} = {'NULL' if var_type == 'char*' else 0};")
+            return
+        
         # Channel operations
         if op == 'CHANNEL_CREATE':
             self.emit(f"// Channel {instr.arg2} created ({instr.arg1})")
             return
         
+        # The arguments are known at METHOD_ARGS, which follows METHOD_CALL
         if op == 'METHOD_CALL':
-            self.emit(f"// Method call: {instr.arg1}.{instr.arg2}()")
-            if instr.result:
-                self.emit(f"{instr.result} = 0;  // Method result")
+            self.pending_method = (instr.arg1, instr.arg2, instr.result)
             return
         
         if op == 'METHOD_ARGS':
-            return  # Skip - already handled in METHOD_CALL
+            obj, method, result = self.pending_method
+            self.pending_method = None
+            n_args = int(instr.arg1) if instr.arg1 else 0
+            call_params = self.pending_params[-n_args:] if n_args > 0 else []
+            self.pending_params = self.pending_params[:-n_args] if n_args > 0 else []
+            
+            if obj in self.channel_vars and method in ('put', 'get', 'close'):
+                args_str = ", ".join([obj] + [self._format_value(p) for p in call_params])
+                if result:
+                    self.emit(f"{result} = __chan_{method}({args_str});")
+                else:
+                    self.emit(f"__chan_{method}({args_str});")
+            else:
+                self.emit(f"// Method call: {obj}.{method}()")
+                if result:
+                    self.emit(f"{result} = 0;  // Method result")
+            return
         
         # Default: comment out unknown instructions
         self.emit(f"// TAC: {instr}")
     
+    def _threaded_par(self) -> bool:
+        """Whether the innermost PAR block runs its branches on threads"""
+        return (self.par_depth == 1 and self.uses_threads and not self.current_function
+                and not self.par_serial)
+    
     def _format_value(self, value) -> str:
         """Format a value for C code"""
         if value is None:
@@ -0,0 +1,1573 @@
+"""
+Channel Runtime Support for Minipar
+Server configuration, wire framing, worker pools and server loops used by
+the runner's channels
+"""
+
+import os
+import pickle
+import queue
+import re
+import select
+import selectors
+import socket
+import logging
+import subprocess
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, fields
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+try:
+    from src.transports import parse_address, describe, connect as connect_transport, tune_socket
+    from src.telemetry import ChannelStats
+except ImportError:
+    from transports import parse_address, describe, connect as connect_transport, tune_socket
+    from telemetry import ChannelStats
+
+
+SERVER_MODES = ('threads', 'selector')
+
+BALANCE_POLICIES = ('round_robin', 'least_outstanding')
+
+# Largest frame a peer may send before the connection is dropped
+MAX_FRAME_SIZE = 16 * 1024 * 1024
+
+RECV_SIZE = 65536
+
+# Selector mode: stop reading from a client whose unsent replies exceed this
+MAX_OUTBUF = 1024 * 1024
+
+# Initial receive buffer of each selector-mode client (grows for large frames)
+SELECTOR_RECV_SIZE = 4096
+
+# Complete frames are decoded in runs of up to this many bytes at a time
+BATCH_DECODE_SIZE = 16384
+
+log = logging.getLogger('minipar.channels')
+
+
+class ChannelError(Exception):
+    """A server answered a request with an error frame instead of a reply"""
+    pass
+
+
+class ChannelTimeoutError(ChannelError, TimeoutError):
+    """A channel call did not complete within its timeout or deadline"""
+    pass
+
+
+@dataclass
+class ServerConfig:
+    """Tuning options for a server channel (5th argument of s_channel)"""
+    workers: int = 8        # Worker threads (selector mode: 0 runs handlers inline)
+    backlog: int = 128      # Kernel listen() backlog
+    queue_size: int = 64    # Jobs waiting for a free worker
+    mode: str = 'threads'   # 'threads' or 'selector'
+    processes: int = 0      # Server processes sharing the port (0: this process only)
+    max_pending: int = 64   # Selector mode: requests read ahead per connection
+    send_timeout: float = 0.0   # Threads mode: seconds a reply may block (0: no limit)
+    cache: int = 0          # Cached responses of a pure handler (0: no cache)
+    cache_ttl: float = 0.0  # Seconds a cached response stays valid (0: until evicted)
+    multiplex: int = 1      # Selector mode: tagged requests of one connection run at once
+
+    @classmethod
+    def from_options(cls, options: Optional[Dict[str, Any]]) -> 'ServerConfig':
+        """Build a config from a Minipar dict literal, validating every key"""
+        config = cls()
+        if not options:
+            return config
+
+        known = {f.name for f in fields(cls)}
+        for key, value in options.items():
+            if key not in known:
+                raise ValueError(f"Unknown server channel option: '{key}'")
+            if key == 'mode':
+                if value not in SERVER_MODES:
+                    raise ValueError(
+                        f"Server channel mode must be one of {', '.join(SERVER_MODES)}, got '{value}'"
+                    )
+                config.mode = value
+                continue
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                raise ValueError(f"Server channel option '{key}' must be a non-negative number")
+            # Keep each option's type: counts are ints, durations floats
+            setattr(config, key, type(getattr(config, key))(value))
+
+        if config.mode == 'threads' and config.workers < 1:
+            raise ValueError("Server channel option 'workers' must be at least 1 in threads mode")
+        if (config.backlog < 1 or config.queue_size < 1 or config.max_pending < 1
+                or config.multiplex < 1):
+            raise ValueError(
+                "Server channel options 'backlog', 'queue_size', 'max_pending' and 'multiplex' "
+                "must be at least 1"
+            )
+        if config.multiplex > 1 and (config.mode != 'selector' or not config.workers):
+            raise ValueError("Server channel option 'multiplex' needs selector mode with workers")
+        return config
+
+
+# ========== Wire Framing ==========
+#
+# Every message is one line of UTF-8 text terminated by '\n'. Backslashes and
+# newlines inside the payload are escaped so any string survives the trip.
+# A frame may start with a header, "@id=7 payload", whose fields let several
+# requests share a connection; a payload that itself starts with '@' is
+# escaped as "\@".
+#
+# Header fields: "id" correlates a reply with its request, "dl" is the
+# request's remaining time budget in milliseconds, "fn" names the function
+# to call on a multi-function server and "err" marks a reply as an error
+# frame (e.g. "@id=7;err=deadline deadline exceeded"). A request with
+# "stream" is answered by items marked "more", then an ordinary reply.
+
+_ESCAPE_RE = re.compile(r'\\(.)', re.DOTALL)
+
+
+class Frame:
+    """One decoded message, its header fields and its size on the wire"""
+    __slots__ = ('text', 'headers', 'size', 'deadline')
+
+    def __init__(self, text: str, headers: Optional[Dict[str, str]] = None, size: int = 0):
+        self.text = text
+        self.headers = headers
+        self.size = size
+        # Monotonic time by which a server must answer (0: no deadline)
+        self.deadline = 0.0
+
+    @property
+    def id(self) -> Optional[str]:
+        return self.headers.get('id') if self.headers else None
+
+    @property
+    def fn(self) -> Optional[str]:
+        """Function a request is addressed to (None: the server's default)"""
+        return self.headers.get('fn') if self.headers else None
+
+    def __eq__(self, other):
+        return (isinstance(other, Frame) and self.text == other.text
+                and (self.headers or None) == (other.headers or None))
+
+    def __repr__(self):
+        return f"Frame({self.text!r}, {self.headers!r})"
+
+
+def encode_frame(text: str, headers: Optional[Dict[str, Any]] = None) -> bytes:
+    """Encode a message (and optional header fields) as a newline-terminated frame"""
+    if '\\' in text or '\n' in text:
+        text = text.replace('\\', '\\\\').replace('\n', '\\n')
+    if headers:
+        fields_str = ';'.join(f"{key}={value}" for key, value in headers.items())
+        text = f"@{fields_str} {text}"
+    elif text.startswith('@'):
+        text = '\\' + text
+    return text.encode('utf-8') + b'\n'
+
+
+def decode_frame(raw: bytes) -> Frame:
+    """Decode one frame (without its terminator)"""
+    return _decode_text(raw.decode('utf-8'), len(raw) + 1)
+
+
+def _parse_headers(header: str) -> Dict[str, str]:
+    if ';' not in header:
+        # Common case: a lone correlation id
+        key, sep, value = header.partition('=')
+        return {key: value} if sep else {}
+    return dict(field.split('=', 1) for field in header.split(';') if '=' in field)
+
+
+def _decode_text(line: str, size: int) -> Frame:
+    """Build a frame from one decoded line (size: its bytes on the wire)"""
+    headers = None
+    if line[:1] == '@':
+        space = line.find(' ')
+        if space < 0:
+            headers, line = _parse_headers(line[1:]), ''
+        else:
+            headers, line = _parse_headers(line[1:space]), line[space + 1:]
+    return _payload_frame(line, headers, size)
+
+
+def _payload_frame(text: str, headers: Optional[Dict[str, str]], size: int) -> Frame:
+    if '\\' in text:
+        text = _ESCAPE_RE.sub(lambda m: '\n' if m.group(1) == 'n' else m.group(1), text)
+    return Frame(text, headers, size)
+
+
+def _decode_span(buf: bytearray, view: memoryview, start: int, end: int) -> Frame:
+    """Decode the frame in buf[start:end], reading the payload through view in one copy"""
+    headers = None
+    payload = start
+    if start < end and buf[start] == 0x40:  # '@'
+        space = buf.find(b' ', start + 1, end)
+        if space < 0:
+            space = end
+        headers = _parse_headers(str(view[start + 1:space], 'utf-8'))
+        payload = min(space + 1, end)
+    return _payload_frame(str(view[payload:end], 'utf-8'), headers, end - start + 1)
+
+
+def encode_reply(request: Frame, text: str) -> bytes:
+    """Encode a response to request, echoing its correlation id if it had one"""
+    return encode_frame(text, {'id': request.id} if request.id is not None else None)
+
+
+def encode_error(request: Frame, kind: str, text: str) -> bytes:
+    """Encode an error frame answering request"""
+    headers = {'id': request.id} if request.id is not None else {}
+    headers['err'] = kind
+    return encode_frame(text, headers)
+
+
+def encode_item(request: Frame, text: str) -> bytes:
+    """Encode one item of a streamed response to request (the reply itself ends the stream)"""
+    headers = {'id': request.id} if request.id is not None else {}
+    headers['more'] = 1
+    return encode_frame(text, headers)
+
+
+def wants_stream(frame: Frame) -> bool:
+    """True if the client asked for the response as a stream of items"""
+    return frame.headers is not None and 'stream' in frame.headers
+
+
+def stamp_deadline(frame: Frame, received: float) -> float:
+    """Turn a request's 'dl' budget into a deadline counted from when it was received"""
+    budget = frame.headers.get('dl') if frame.headers else None
+    if budget is not None:
+        try:
+            frame.deadline = received + int(budget) / 1000
+        except ValueError:
+            pass
+    return frame.deadline
+
+
+def deadline_passed(frame: Frame) -> bool:
+    """True if the request's deadline expired before its handler could start"""
+    return bool(frame.deadline) and time.monotonic() >= frame.deadline
+
+
+class FrameReader:
+    """
+    Per-connection receive buffer that splits the byte stream into frames.
+    Bytes are received with recv_into() straight into one reusable bytearray
+    and decoded through a memoryview: a run of small frames is decoded in a
+    single call, a large frame directly from its span with no intermediate
+    copy. The buffer is compacted in place and only grows for frames larger
+    than itself.
+    """
+
+    def __init__(self, sock: Optional[socket.socket] = None, size: int = RECV_SIZE):
+        self.sock = sock
+        self.size = size
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.start = 0      # First byte not yet decoded
+        self.end = 0        # End of the received bytes
+        self.scanned = 0    # Bytes before this hold no newline
+        # Frames decoded but not yet returned by read_frame()
+        self.ready: Deque[Frame] = deque()
+        # Monotonic time of the last read_frame() recv (start of deadline budgets)
+        self.received = 0.0
+
+    def buffered(self) -> int:
+        """Bytes received but not yet returned as frames"""
+        return self.end - self.start + sum(frame.size for frame in self.ready)
+
+    def _reserve(self, needed: Optional[int] = None):
+        """Make room for needed more bytes after end (default: room for one recv)"""
+        if self.start == self.end:
+            self.start = self.end = self.scanned = 0
+            if len(self.buf) > 4 * self.size:
+                # Give back the room a large frame needed
+                self.buf = bytearray(self.size)
+                self.view = memoryview(self.buf)
+        if needed is None:
+            needed = min(len(self.buf) // 4, RECV_SIZE // 4)
+        if len(self.buf) - self.end >= needed:
+            return
+        pending = self.end - self.start
+        if pending > MAX_FRAME_SIZE:
+            raise ValueError("Channel frame exceeds maximum size")
+        if pending + needed <= len(self.buf):
+            # Slide the partial frame to the front (memoryview copies overlap safely)
+            self.view[:pending] = self.view[self.start:self.end]
+        else:
+            buf = bytearray(max(2 * len(self.buf), pending + needed))
+            buf[:pending] = self.view[self.start:self.end]
+            self.buf, self.view = buf, memoryview(buf)
+        self.scanned -= self.start
+        self.start, self.end = 0, pending
+
+    def _decode_ready(self) -> bool:
+        """Decode every complete frame in the buffer onto the ready queue"""
+        last = self.buf.rfind(b'\n', max(self.start, self.scanned), self.end)
+        if last < 0:
+            self.scanned = self.end
+            return False
+        start = self.start
+        while start <= last:
+            cut = self.buf.rfind(b'\n', start, min(start + BATCH_DECODE_SIZE, last + 1))
+            if cut >= 0:
+                # Run of small frames: one decode for the batch, then split the text
+                text = str(self.view[start:cut], 'utf-8')
+                ascii = text.isascii()
+                for line in text.split('\n'):
+                    size = len(line) + 1 if ascii else len(line.encode('utf-8')) + 1
+                    self.ready.append(_decode_text(line, size))
+            else:
+                # A large frame: decode it straight from the buffer
+                cut = self.buf.find(b'\n', start, last + 1)
+                self.ready.append(_decode_span(self.buf, self.view, start, cut))
+            start = cut + 1
+        self.start = self.scanned = last + 1
+        return True
+
+    def recv_from(self, sock: Any) -> int:
+        """Receive once from sock into the buffer; returns the byte count (0: peer closed)"""
+        self._reserve()
+        count = sock.recv_into(self.view[self.end:])
+        self.end += count
+        return count
+
+    def frames(self) -> List[Frame]:
+        """Every complete frame buffered so far"""
+        self._decode_ready()
+        if self.end - self.start > MAX_FRAME_SIZE:
+            raise ValueError("Channel frame exceeds maximum size")
+        frames = list(self.ready)
+        self.ready.clear()
+        return frames
+
+    def feed(self, data: bytes) -> List[Frame]:
+        """Append received bytes and return every complete frame"""
+        self._reserve(len(data))
+        self.view[self.end:self.end + len(data)] = data
+        self.end += len(data)
+        return self.frames()
+
+    def has_frame(self) -> bool:
+        """True if a complete frame is already buffered"""
+        return bool(self.ready) or self.buf.find(b'\n', max(self.start, self.scanned), self.end) >= 0
+
+    def read_frame(self) -> Optional[Frame]:
+        """Block until a full frame arrives; returns None when the peer closes"""
+        while not self.ready:
+            if self._decode_ready():
+                break
+            if not self.recv_from(self.sock):
+                return None
+            self.received = time.monotonic()
+        return self.ready.popleft()
+
+
+@dataclass
+class ClientConfig:
+    """Options for a client channel (last argument of c_channel)"""
+    pool: bool = True                   # Borrow the connection from the process-wide pool
+    policy: str = 'round_robin'         # How sends are spread over several endpoints
+    retry_backoff: float = 0.5          # Seconds before a failed endpoint is retried
+    max_backoff: float = 30.0           # Cap for the doubling retry delay
+    send_timeout: float = 0.0           # Seconds a send may block (0: no limit)
+    recv_timeout: float = 0.0           # Seconds to wait for each reply (0: no limit)
+    deadline: float = 0.0               # Time budget of each call, told to the server (0: none)
+    max_inflight: int = 256             # Unanswered requests before sends wait for replies
+
+    @classmethod
+    def from_options(cls, options: Optional[Dict[str, Any]]) -> 'ClientConfig':
+        """Build a config from a Minipar dict literal, validating every key"""
+        config = cls()
+        if not options:
+            return config
+
+        known = {f.name for f in fields(cls)}
+        for key, value in options.items():
+            if key not in known:
+                raise ValueError(f"Unknown client channel option: '{key}'")
+            default = getattr(cls, key)
+            if isinstance(default, bool):
+                if not isinstance(value, bool):
+                    raise ValueError(f"Client channel option '{key}' must be true or false")
+            elif key == 'policy':
+                if value not in BALANCE_POLICIES:
+                    raise ValueError(
+                        f"Client channel policy must be one of {', '.join(BALANCE_POLICIES)}"
+                    )
+            else:
+                # Options that default to 0 are off by default and may be set back to 0
+                kind = 'non-negative' if default == 0 else 'positive'
+                if isinstance(value, bool) or not isinstance(value, (int, float)):
+                    raise ValueError(f"Client channel option '{key}' must be a {kind} number")
+                value = type(default)(value)
+                if value < 0 or (value == 0 and default != 0):
+                    raise ValueError(f"Client channel option '{key}' must be a {kind} number")
+            setattr(config, key, value)
+        return config
+
+
+class ChannelFuture:
+    """Handle for a reply that has been requested but not yet read"""
+    __slots__ = ('conn', 'request_id')
+
+    def __init__(self, conn: 'ClientConnection', request_id: int):
+        self.conn = conn
+        self.request_id = request_id
+
+    def result(self) -> str:
+        """Block until the server's reply for this request arrives"""
+        return self.conn.wait(self.request_id)
+
+    def __repr__(self):
+        return f"<channel reply #{self.request_id}>"
+
+
+class ChannelStream:
+    """
+    Items of a streamed response, read from the connection as they are
+    iterated, so a large result never has to be held at once. The server's
+    ordinary reply after the last item ends the stream; closing the stream
+    early discards the items still to come.
+    """
+    __slots__ = ('conn', 'request_id', 'done')
+
+    def __init__(self, conn: 'ClientConnection', request_id: int):
+        self.conn = conn
+        self.request_id = request_id
+        self.done = False
+
+    def __iter__(self) -> 'ChannelStream':
+        return self
+
+    def __next__(self) -> str:
+        if not self.done:
+            item = self.conn.next_item(self.request_id)
+            if item is not None:
+                return item
+            self.done = True
+        raise StopIteration
+
+    def close(self):
+        if not self.done:
+            self.done = True
+            self.conn.abandon(self.request_id)
+
+    def __repr__(self):
+        return f"<channel stream #{self.request_id}>"
+
+
+class _StreamBuffer:
+    """Items of one stream read off the socket but not yet iterated"""
+    __slots__ = ('items', 'size')
+
+    def __init__(self):
+        self.items: Deque[str] = deque()
+        self.size = 0
+
+
+class ClientConnection:
+    """
+    Client side of a channel: a connected socket plus its frame reader.
+    Every request carries a correlation id so many can be in flight at once;
+    replies are read on demand and filed by id until someone waits for them.
+    """
+
+    def __init__(self, sock: socket.socket, address: Tuple[str, int] = None,
+                 max_inflight: int = 256):
+        self.sock = sock
+        self.address = address
+        self.reader = FrameReader(sock)
+        self.description: Optional[str] = None
+        self.last_used = time.monotonic()
+        self.broken = False
+        self.pool: Optional['ClientPool'] = None
+        self.max_inflight = max_inflight
+        self.send_timeout: Optional[float] = None
+        self.recv_timeout: Optional[float] = None
+        self.deadline: Optional[float] = None
+        self.next_id = 0
+        # Request id -> (send time, bytes sent, monotonic deadline or 0) until its reply is read
+        self.inflight: Dict[int, Tuple[float, int, float]] = {}
+        self.replies: Dict[int, Any] = {}
+        self.streams: Dict[int, _StreamBuffer] = {}
+        # Requests given up on whose late replies must be discarded
+        self.abandoned: set = set()
+        self.stats: Optional[ChannelStats] = None
+        self._timeout: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def connect(cls, host: str, port: int, keepalive: bool = True) -> 'ClientConnection':
+        """Connect to a server channel and read its welcome description"""
+        transport, target = parse_address(host, port)
+        sock = connect_transport(transport, target, keepalive)
+        conn = cls(sock, (host, port))
+        welcome = conn.reader.read_frame()
+        if welcome is None:
+            sock.close()
+            raise ConnectionError(f"Server {describe(transport, target)} closed the connection")
+        conn.description = welcome.text
+        return conn
+
+    def configure(self, config: Optional[ClientConfig]):
+        """Apply a channel's timeouts and in-flight limit (None restores the defaults)"""
+        config = config or ClientConfig()
+        self.send_timeout = config.send_timeout or None
+        self.recv_timeout = config.recv_timeout or None
+        self.deadline = config.deadline or None
+        self.max_inflight = config.max_inflight
+
+    def submit(self, message: str, deadline: Optional[float] = None,
+               stream: bool = False, fn: Optional[str] = None) -> ChannelFuture:
+        """
+        Send a request without waiting for its reply. deadline (seconds,
+        default: the channel's) bounds the whole call and is sent along so
+        the server can skip work nobody will wait for. stream asks for the
+        response as items, read with next_item(); fn names the server
+        function to call (default: the server's first).
+        """
+        with self._lock:
+            # Bound the replies the server may have queued for us
+            while len(self.inflight) >= self.max_inflight:
+                try:
+                    self._read_reply(self.recv_timeout)
+                except socket.timeout:
+                    raise ChannelTimeoutError(
+                        f"{len(self.inflight)} requests in flight and no reply within "
+                        f"{self.recv_timeout:g}s"
+                    ) from None
+            request_id = self.next_id
+            self.next_id += 1
+            headers = {'id': request_id}
+            if fn is not None:
+                headers['fn'] = fn
+            budget = deadline if deadline is not None else self.deadline
+            expires = 0.0
+            if budget:
+                headers['dl'] = max(int(budget * 1000), 1)
+                expires = time.monotonic() + budget
+            if stream:
+                headers['stream'] = 1
+            data = encode_frame(message, headers)
+            try:
+                self._set_timeout(self.send_timeout)
+                self.sock.sendall(data)
+            except socket.timeout:
+                # Part of the frame may have been written: the stream is unusable
+                self._fail()
+                raise ChannelTimeoutError(
+                    f"Request not sent within {self.send_timeout:g}s") from None
+            except OSError:
+                self._fail()
+                raise
+            self.inflight[request_id] = (time.perf_counter(), len(data), expires)
+            if stream:
+                self.streams[request_id] = _StreamBuffer()
+        return ChannelFuture(self, request_id)
+
+    def wait(self, request_id: int) -> str:
+        """Return the reply for request_id, reading replies until it arrives"""
+        with self._lock:
+            while request_id not in self.replies:
+                self._read_for(request_id)
+            self.last_used = time.monotonic()
+            reply = self.replies.pop(request_id)
+        if isinstance(reply, ChannelError):
+            raise reply
+        return reply
+
+    def request(self, message: str, deadline: Optional[float] = None,
+                fn: Optional[str] = None) -> str:
+        """Send one message and wait for the server's response"""
+        return self.wait(self.submit(message, deadline, fn=fn).request_id)
+
+    def stream(self, message: str, deadline: Optional[float] = None,
+               fn: Optional[str] = None) -> ChannelStream:
+        """Send one message and iterate the items the server streams back"""
+        return ChannelStream(self, self.submit(message, deadline, True, fn).request_id)
+
+    def next_item(self, request_id: int) -> Optional[str]:
+        """Next item of a streamed response, or None once the stream has ended"""
+        with self._lock:
+            buffer = self.streams.get(request_id)
+            if buffer is None:
+                raise ValueError(f"Request #{request_id} is not an open stream")
+            while not buffer.items and request_id not in self.replies:
+                self._read_for(request_id)
+            self.last_used = time.monotonic()
+            if buffer.items:
+                return buffer.items.popleft()
+            del self.streams[request_id]
+            reply = self.replies.pop(request_id)
+        if isinstance(reply, ChannelError):
+            raise reply
+        return None
+
+    def abandon(self, request_id: int):
+        """Give up on a request; its reply (or the rest of its stream) is discarded"""
+        with self._lock:
+            self.streams.pop(request_id, None)
+            if request_id in self.replies:
+                del self.replies[request_id]
+            elif self.inflight.pop(request_id, None) is not None:
+                self.abandoned.add(request_id)
+
+    def _read_for(self, request_id: int):
+        """Read one reply on behalf of request_id within its timeouts (lock held)"""
+        entry = self.inflight.get(request_id)
+        if entry is None:
+            raise ValueError(f"Reply #{request_id} was already received")
+        timeout = self.recv_timeout
+        if entry[2]:
+            remaining = entry[2] - time.monotonic()
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        try:
+            if timeout is not None and timeout <= 0:
+                raise socket.timeout("timed out")
+            self._read_reply(timeout)
+        except socket.timeout:
+            # The connection stays usable; the late reply is dropped on arrival
+            del self.inflight[request_id]
+            self.streams.pop(request_id, None)
+            self.abandoned.add(request_id)
+            if self.stats is not None:
+                self.stats.error()
+            raise ChannelTimeoutError(
+                f"No reply to request #{request_id} within "
+                f"{time.perf_counter() - entry[0]:.3g}s") from None
+
+    def _set_timeout(self, timeout: Optional[float]):
+        # Sockets stay blocking (and untouched) unless a timeout is in use
+        if timeout != self._timeout:
+            self.sock.settimeout(timeout)
+            self._timeout = timeout
+
+    def _read_reply(self, timeout: Optional[float] = None):
+        try:
+            self._set_timeout(timeout)
+            frame = self.reader.read_frame()
+        except socket.timeout:
+            raise
+        except OSError:
+            self._fail()
+            raise
+        if frame is None:
+            self._fail()
+            raise ConnectionError("Server closed the connection")
+        try:
+            request_id = int(frame.id)
+        except (TypeError, ValueError):
+            self._fail()
+            raise ConnectionError(f"Unexpected reply from server: {frame.text!r}")
+        more = 'more' in frame.headers
+        if request_id in self.abandoned:
+            # Only the final reply ends an abandoned stream
+            if not more:
+                self.abandoned.discard(request_id)
+            return
+        buffer = self.streams.get(request_id)
+        if more:
+            if buffer is None:
+                self._fail()
+                raise ConnectionError(f"Unexpected stream item from server: {frame.text!r}")
+            buffer.items.append(frame.text)
+            buffer.size += frame.size
+            return
+        sent = self.inflight.pop(request_id, None)
+        error = frame.headers.get('err')
+        if error is not None:
+            exc_type = ChannelTimeoutError if error == 'deadline' else ChannelError
+            self.replies[request_id] = exc_type(f"Server error ({error}): {frame.text}")
+            if self.stats is not None:
+                self.stats.error()
+            return
+        self.replies[request_id] = frame.text
+        if self.stats is not None and sent is not None:
+            received = frame.size + (buffer.size if buffer is not None else 0)
+            self.stats.record(time.perf_counter() - sent[0], received, sent[1])
+
+    def _fail(self):
+        self.broken = True
+        if self.stats is not None:
+            self.stats.error()
+
+    def bind_stats(self, stats: Optional[ChannelStats]):
+        """Report this connection's requests to a channel's stats (None to stop)"""
+        if self.stats is not None:
+            self.stats.connection(-1)
+        self.stats = stats
+        if stats is not None:
+            stats.connection(1)
+
+    def is_healthy(self) -> bool:
+        """True if the idle connection is still open and has no stray data"""
+        if (self.broken or self.sock.fileno() < 0 or self.reader.buffered()
+                or self.inflight or self.replies or self.streams or self.abandoned):
+            return False
+        # An idle socket must not be readable: readable means EOF or garbage
+        readable, _, _ = select.select([self.sock], [], [], 0)
+        return not readable
+
+    def release(self):
+        """Give the connection back to its pool, or close it if unpooled"""
+        self.bind_stats(None)
+        self.configure(None)
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            self.close()
+
+    def close(self):
+        self.bind_stats(None)
+        self.sock.close()
+
+
+class ClientPool:
+    """
+    Process-wide pool of handshaken client connections keyed by host:port.
+    Idle connections are health-checked before reuse and closed after
+    idle_timeout seconds; at most max_per_host connections exist per server.
+    """
+
+    def __init__(self, max_per_host: int = 8, idle_timeout: float = 60.0,
+                 acquire_timeout: float = 10.0, keepalive: bool = True):
+        self.max_per_host = max_per_host
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+        self.keepalive = keepalive
+        self._idle: Dict[Tuple[str, int], List[ClientConnection]] = {}
+        self._open: Dict[Tuple[str, int], int] = {}
+        self._cond = threading.Condition()
+
+    def acquire(self, host: str, port: int) -> ClientConnection:
+        """Hand out an idle connection or open a new one within the cap"""
+        key = (host, int(port))
+        deadline = time.monotonic() + self.acquire_timeout
+        with self._cond:
+            while True:
+                self._evict_idle_locked()
+                idle = self._idle.get(key)
+                while idle:
+                    conn = idle.pop()
+                    if conn.is_healthy():
+                        return conn
+                    self._discard_locked(conn)
+
+                if self._open.get(key, 0) < self.max_per_host:
+                    self._open[key] = self._open.get(key, 0) + 1
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise ConnectionError(
+                        f"Connection pool exhausted for {describe(*parse_address(host, port))} "
+                        f"({self.max_per_host} connections in use)"
+                    )
+                self._cond.wait(remaining)
+
+        # Connect outside the lock so other hosts are not held up
+        try:
+            conn = ClientConnection.connect(host, int(port), self.keepalive)
+            conn.pool = self
+            return conn
+        except Exception:
+            with self._cond:
+                self._open[key] -= 1
+                self._cond.notify()
+            raise
+
+    def release(self, conn: ClientConnection):
+        """Return a connection to the pool, closing it if it is unusable"""
+        with self._cond:
+            if conn.is_healthy():
+                conn.last_used = time.monotonic()
+                self._idle.setdefault(conn.address, []).append(conn)
+            else:
+                self._discard_locked(conn)
+            self._cond.notify()
+
+    def evict_idle(self):
+        """Close connections that have been idle longer than idle_timeout"""
+        with self._cond:
+            self._evict_idle_locked()
+
+    def close_all(self):
+        """Close every idle connection (connections in use are unaffected)"""
+        with self._cond:
+            for conns in self._idle.values():
+                for conn in conns:
+                    self._discard_locked(conn)
+            self._idle.clear()
+            self._cond.notify_all()
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """Open and idle connection counts per server address"""
+        with self._cond:
+            return {
+                describe(*parse_address(host, port)): {
+                    'open': count,
+                    'idle': len(self._idle.get((host, port), [])),
+                }
+                for (host, port), count in self._open.items()
+            }
+
+    def _evict_idle_locked(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        for key, conns in self._idle.items():
+            stale = [c for c in conns if c.last_used < cutoff]
+            if stale:
+                conns[:] = [c for c in conns if c.last_used >= cutoff]
+                for conn in stale:
+                    self._discard_locked(conn)
+
+    def _discard_locked(self, conn: ClientConnection):
+        conn.close()
+        self._open[conn.address] = self._open.get(conn.address, 1) - 1
+        self._cond.notify()
+
+
+# Shared by every runner in the process
+client_pool = ClientPool()
+
+
+class _Endpoint:
+    """One server replica behind a BalancedClient"""
+    __slots__ = ('host', 'port', 'conn', 'failures', 'retry_at')
+
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.conn: Optional[ClientConnection] = None
+        self.failures = 0
+        self.retry_at = 0.0
+
+    @property
+    def label(self) -> str:
+        return describe(*parse_address(self.host, self.port))
+
+
+class _BalancedFuture(ChannelFuture):
+    """Reply handle that ejects its endpoint if the reply never arrives"""
+    __slots__ = ('client', 'endpoint')
+
+    def __init__(self, client: 'BalancedClient', endpoint: _Endpoint, future: ChannelFuture):
+        super().__init__(future.conn, future.request_id)
+        self.client = client
+        self.endpoint = endpoint
+
+    def result(self) -> str:
+        try:
+            return super().result()
+        except OSError:
+            self.client._fail(self.endpoint, self.conn)
+            raise
+
+
+class BalancedClient:
+    """
+    Client channel spread over several server replicas. Each request goes to
+    the next live endpoint (round_robin) or to the one with the fewest
+    replies pending (least_outstanding). An endpoint that fails is ejected and
+    retried after retry_backoff seconds, doubling per consecutive failure up
+    to max_backoff. A request that cannot be sent is retried on another
+    endpoint; once sent it is never repeated, as the server may have run it.
+    """
+
+    def __init__(self, endpoints: List[Tuple[str, int]], config: ClientConfig,
+                 pool: Optional[ClientPool] = None, log: Optional[logging.Logger] = None,
+                 stats: Optional[ChannelStats] = None):
+        if not endpoints:
+            raise ValueError("A client channel needs at least one endpoint")
+        self.endpoints = [_Endpoint(host, port) for host, port in endpoints]
+        self.config = config
+        self.pool = pool
+        self.log = log if log is not None else logging.getLogger('minipar.channels')
+        self.channel_stats = stats
+        self.description: Optional[str] = None
+        self._next = 0
+        self._lock = threading.Lock()
+
+        with self._lock:
+            for endpoint in self.endpoints:
+                self._open(endpoint)
+        if not any(endpoint.conn for endpoint in self.endpoints):
+            raise ConnectionRefusedError(
+                f"No server running on any of {', '.join(e.label for e in self.endpoints)}"
+            )
+
+    def submit(self, message: str, fn: Optional[str] = None) -> ChannelFuture:
+        """Send a request to the endpoint chosen by the policy"""
+        tried: set = set()
+        while True:
+            endpoint, conn = self._pick(tried)
+            try:
+                return _BalancedFuture(self, endpoint, conn.submit(message, fn=fn))
+            except OSError:
+                self._fail(endpoint, conn)
+                tried.add(id(endpoint))
+
+    def request(self, message: str, fn: Optional[str] = None) -> str:
+        """Send one message and wait for the chosen server's response"""
+        return self.submit(message, fn).result()
+
+    def stream(self, message: str, fn: Optional[str] = None) -> ChannelStream:
+        """Stream the chosen server's response; the stream stays on that server"""
+        tried: set = set()
+        while True:
+            endpoint, conn = self._pick(tried)
+            try:
+                return conn.stream(message, fn=fn)
+            except OSError:
+                self._fail(endpoint, conn)
+                tried.add(id(endpoint))
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Health of each endpoint, in declaration order"""
+        with self._lock:
+            return [
+                {'endpoint': e.label, 'up': e.conn is not None, 'failures': e.failures,
+                 'outstanding': len(e.conn.inflight) if e.conn else 0}
+                for e in self.endpoints
+            ]
+
+    def release(self):
+        """Give every endpoint connection back to the pool (or close it)"""
+        with self._lock:
+            for endpoint in self.endpoints:
+                if endpoint.conn is not None:
+                    endpoint.conn.release()
+                    endpoint.conn = None
+
+    close = release
+
+    def _pick(self, exclude: set) -> Tuple[_Endpoint, ClientConnection]:
+        with self._lock:
+            # Ejected endpoints whose backoff has expired get another chance
+            now = time.monotonic()
+            for endpoint in self.endpoints:
+                if endpoint.conn is None and endpoint.retry_at <= now:
+                    self._open(endpoint)
+
+            count = len(self.endpoints)
+            live = [
+                endpoint for endpoint in
+                (self.endpoints[(self._next + i) % count] for i in range(count))
+                if endpoint.conn is not None and id(endpoint) not in exclude
+            ]
+            if not live:
+                raise ConnectionError(
+                    f"No healthy endpoint among {', '.join(e.label for e in self.endpoints)}"
+                )
+            self._next = (self._next + 1) % count
+            if self.config.policy == 'least_outstanding':
+                # min() keeps the first of equals, so ties still rotate
+                endpoint = min(live, key=lambda e: len(e.conn.inflight))
+            else:
+                endpoint = live[0]
+            return endpoint, endpoint.conn
+
+    def _open(self, endpoint: _Endpoint):
+        """Connect an endpoint, ejecting it again on failure (lock held)"""
+        try:
+            if self.pool is not None:
+                endpoint.conn = self.pool.acquire(endpoint.host, endpoint.port)
+            else:
+                endpoint.conn = ClientConnection.connect(endpoint.host, endpoint.port)
+        except OSError as e:
+            self._eject(endpoint, str(e))
+            return
+        endpoint.conn.bind_stats(self.channel_stats)
+        endpoint.conn.configure(self.config)
+        if endpoint.failures:
+            self.log.info("endpoint restored", extra={'fields': {'endpoint': endpoint.label}})
+        endpoint.failures = 0
+        if self.description is None:
+            self.description = endpoint.conn.description
+
+    def _fail(self, endpoint: _Endpoint, conn: ClientConnection):
+        with self._lock:
+            # Another thread may already have replaced the failed connection
+            if endpoint.conn is conn:
+                conn.broken = True
+                conn.release()
+                endpoint.conn = None
+                self._eject(endpoint, "request failed")
+
+    def _eject(self, endpoint: _Endpoint, reason: str):
+        endpoint.failures += 1
+        delay = min(self.config.retry_backoff * 2 ** (endpoint.failures - 1),
+                    self.config.max_backoff)
+        endpoint.retry_at = time.monotonic() + delay
+        self.log.warning("endpoint ejected", extra={'fields': {
+            'endpoint': endpoint.label, 'reason': reason, 'retry_in': round(delay, 3)}})
+
+
+class ServerMetrics:
+    """Thread-safe counters for one server channel"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.active = 0
+        self.completed = 0
+        self.expired = 0
+        self._queue_depth: Callable[[], int] = lambda: 0
+        self.cache: Optional['ResponseCache'] = None
+
+    def bind_queue(self, depth: Callable[[], int]):
+        """Attach the callable used to sample the current queue depth"""
+        self._queue_depth = depth
+
+    def bind_cache(self, cache: 'ResponseCache'):
+        """Report this response cache's counters with the server's"""
+        self.cache = cache
+
+    def incr(self, counter: str, amount: int = 1):
+        """Atomically add amount to one of the counters"""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue_depth()
+
+    def snapshot(self) -> Dict[str, int]:
+        """Return a consistent copy of all metrics"""
+        with self._lock:
+            result = {
+                'accepted': self.accepted,
+                'rejected': self.rejected,
+                'active': self.active,
+                'completed': self.completed,
+                'expired': self.expired,
+                'queue_depth': self.queue_depth,
+            }
+        if self.cache is not None:
+            result.update(self.cache.snapshot())
+        return result
+
+
+class ResponseCache:
+    """
+    Least-recently-used responses of a side-effect-free handler, keyed by
+    its decoded arguments. Thread-safe; entries older than ttl seconds are
+    treated as missing.
+    """
+
+    def __init__(self, max_entries: int, ttl: float = 0.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        # key -> (expiry time or 0, response); most recently used last
+        self._entries: 'OrderedDict[Any, Tuple[float, str]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Optional[str]:
+        """Cached response for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, response = entry
+                if not expires or time.monotonic() < expires:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Any, response: str):
+        expires = time.monotonic() + self.ttl if self.ttl else 0.0
+        with self._lock:
+            self._entries[key] = (expires, response)
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {'cache_entries': len(self._entries),
+                    'cache_hits': self.hits, 'cache_misses': self.misses}
+
+
+class WorkerPool:
+    """
+    Fixed set of worker threads consuming a bounded queue of jobs. The queue
+    depth is reported in metrics; so are active, completed and rejected jobs
+    when count_jobs is set, for pools whose jobs are whole connections.
+    """
+
+    def __init__(self, name: str, workers: int, queue_size: int,
+                 handler: Callable[..., None], metrics: Optional[ServerMetrics] = None,
+                 count_jobs: bool = True):
+        self.name = name
+        self.handler = handler
+        self.metrics = metrics or ServerMetrics()
+        self.count_jobs = count_jobs
+        self.jobs: queue.Queue = queue.Queue(maxsize=queue_size)
+        self.threads: List[threading.Thread] = []
+        self.metrics.bind_queue(self.jobs.qsize)
+
+        for i in range(workers):
+            thread = threading.Thread(
+                target=self._worker, name=f"{name}-worker-{i}", daemon=True
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, *job) -> bool:
+        """Queue a job without blocking; returns False if the queue is full"""
+        try:
+            self.jobs.put_nowait(job)
+            return True
+        except queue.Full:
+            if self.count_jobs:
+                self.metrics.incr('rejected')
+            return False
+
+    def shutdown(self):
+        """Ask every worker to exit once the queued jobs are done"""
+        for _ in self.threads:
+            self.jobs.put(None)
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            if not self.count_jobs:
+                try:
+                    self.handler(*job)
+                except Exception:
+                    log.exception("worker %s: unhandled error", self.name)
+                continue
+            self.metrics.incr('active')
+            try:
+                self.handler(*job)
+            except Exception:
+                log.exception("worker %s: unhandled error", self.name)
+            finally:
+                self.metrics.incr('active', -1)
+                self.metrics.incr('completed')
+
+
+# Run by each server process: receives sys.path, the entry point and its
+# pickled arguments on stdin, and reports readiness on the file descriptor
+# given as its first argument
+_PREFORK_BOOTSTRAP = """\
+import importlib, os, pickle, sys
+path, module, function, args = pickle.loads(sys.stdin.buffer.read())
+sys.path[:0] = path
+target = getattr(importlib.import_module(module), function)
+target(*pickle.loads(args), os.fdopen(int(sys.argv[1]), 'w'))
+"""
+
+
+class PreforkSupervisor:
+    """
+    Keeps a fixed number of server processes running for one server channel.
+    Each process binds its own listener to the shared port and the kernel
+    spreads connections between them. Processes are started fresh rather
+    than forked, because forking the multithreaded runtime would copy locks
+    held by other threads; a process that dies is replaced, after a growing
+    delay if it keeps dying right after starting.
+
+    target(*args, ready) runs in each process and must write one line to
+    ready: "ready" once it is listening, otherwise the reason it failed.
+    """
+
+    # A process that lived shorter than this counts as a failed start
+    MIN_UPTIME = 1.0
+    MAX_RESTART_DELAY = 30.0
+    POLL_INTERVAL = 0.5
+
+    def __init__(self, name: str, processes: int, target: Callable, args: tuple,
+                 start_timeout: float = 30.0, log: Optional[logging.Logger] = None):
+        self.name = name
+        self.start_timeout = start_timeout
+        self.log = log if log is not None else logging.getLogger('minipar.channels')
+        self.payload = pickle.dumps(
+            (sys.path, _module_name(target), target.__name__, pickle.dumps(args)))
+        self.workers: List[Optional[subprocess.Popen]] = [None] * processes
+        self.started_at = [0.0] * processes
+        self.failures = [0] * processes
+        self.restarts = 0
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Start every process and wait until all of them are listening"""
+        try:
+            for slot in range(len(self.workers)):
+                self._spawn(slot)
+        except Exception:
+            self.stop()
+            raise
+
+    def supervise(self):
+        """Replace processes as they exit; runs until stop()"""
+        while not self._stopped.wait(self.POLL_INTERVAL):
+            for slot, worker in enumerate(self.workers):
+                if worker.poll() is None or self._stopped.is_set():
+                    continue
+                self.log.warning("server process exited", extra={'fields': {
+                    'pid': worker.pid, 'exitcode': worker.returncode}})
+
+                if time.monotonic() - self.started_at[slot] < self.MIN_UPTIME:
+                    self.failures[slot] += 1
+                    delay = min(2 ** (self.failures[slot] - 1), self.MAX_RESTART_DELAY)
+                    if self._stopped.wait(delay):
+                        return
+                else:
+                    self.failures[slot] = 0
+                try:
+                    self._spawn(slot)
+                    self.restarts += 1
+                except Exception as e:
+                    # The dead process stays in its slot and is retried next round
+                    self.log.error("could not restart server process: %s", e)
+
+    def pids(self) -> List[int]:
+        """Process ids of the running server processes"""
+        return [worker.pid for worker in self.workers
+                if worker is not None and worker.poll() is None]
+
+    def stop(self):
+        self._stopped.set()
+        for worker in self.workers:
+            if worker is not None and worker.poll() is None:
+                worker.terminate()
+        for worker in self.workers:
+            if worker is not None:
+                try:
+                    worker.wait(5)
+                except subprocess.TimeoutExpired:
+                    worker.kill()
+
+    def _spawn(self, slot: int):
+        ready_r, ready_w = os.pipe()
+        self.started_at[slot] = time.monotonic()
+        try:
+            worker = subprocess.Popen(
+                [sys.executable, '-c', _PREFORK_BOOTSTRAP, str(ready_w)],
+                stdin=subprocess.PIPE, pass_fds=(ready_w,)
+            )
+        finally:
+            os.close(ready_w)
+        self.workers[slot] = worker
+
+        with os.fdopen(ready_r) as ready:
+            worker.stdin.write(self.payload)
+            worker.stdin.close()
+            readable, _, _ = select.select([ready], [], [], self.start_timeout)
+            if not readable:
+                worker.kill()
+                raise TimeoutError(f"Server process for '{self.name}' did not start")
+            status = ready.readline().strip()
+        if status != 'ready':
+            worker.wait()
+            reason = status or f"exited with code {worker.returncode}"
+            raise OSError(f"Server process for '{self.name}' failed: {reason}")
+
+
+def _module_name(function: Callable) -> str:
+    """Importable name of the module defining function, even for __main__"""
+    module = function.__module__
+    if module == '__main__':
+        main = sys.modules['__main__']
+        spec = getattr(main, '__spec__', None)
+        module = spec.name if spec else os.path.splitext(os.path.basename(main.__file__))[0]
+    return module
+
+
+class _SelectorConnection:
+    """State kept for each client of a SelectorServer"""
+    __slots__ = ('sock', 'reader', 'outbuf', 'pending', 'running', 'events')
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+        self.reader = FrameReader(size=SELECTOR_RECV_SIZE)
+        self.outbuf = bytearray()
+        self.pending: Deque[Frame] = deque()
+        self.running = 0    # Requests handed to the pool and not yet answered
+        self.events = selectors.EVENT_READ
+
+
+class SelectorServer:
+    """
+    Single-threaded event loop serving every connection of a server channel.
+    Sockets are non-blocking and each idle client only costs its socket and a
+    small buffer object. Handlers run inline on the loop thread or, when a
+    pool is given, on its workers; requests of one connection stay in order
+    unless multiplex lets that many tagged requests run at once (their
+    replies then go out as they complete). Requests asking for a stream go
+    to stream_handler, which is given a function to emit each item with.
+    Requests naming a function ("fn") are looked up in routes, which maps
+    names to (handler, stream_handler) pairs.
+    """
+
+    def __init__(self, listener: socket.socket, description: str,
+                 handler: Callable[[str], str], metrics: ServerMetrics,
+                 workers: int = 0, queue_size: int = 64, name: str = 'selector',
+                 log: Optional[logging.Logger] = None, stats: Optional[ChannelStats] = None,
+                 max_pending: int = 64,
+                 stream_handler: Optional[Callable[[str, Callable[[str], None]], None]] = None,
+                 routes: Optional[Dict[str, Tuple[Callable, Optional[Callable]]]] = None,
+                 multiplex: int = 1):
+        self.listener = listener
+        self.log = log or logging.getLogger(f"minipar.channel.{name}")
+        self.welcome = encode_frame(description)
+        self.handler = handler
+        self.stream_handler = stream_handler
+        self.routes = routes or {}
+        self.multiplex = multiplex
+        self.metrics = metrics
+        self.stats = stats
+        self.max_pending = max_pending
+        self.selector = selectors.DefaultSelector()
+        self.connections: Dict[int, _SelectorConnection] = {}
+        self.completions: Deque[tuple] = deque()
+        self.stalled: Deque[_SelectorConnection] = deque()
+        self.pool: Optional[WorkerPool] = None
+        if workers:
+            # Jobs are requests: connections are counted by the loop itself
+            self.pool = WorkerPool(name, workers, queue_size, self._run_job, metrics,
+                                   count_jobs=False)
+
+        # Worker threads wake the loop through a socket pair
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+
+        listener.setblocking(False)
+        self.selector.register(listener, selectors.EVENT_READ, None)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, 'wake')
+
+    def serve_forever(self):
+        """Run the event loop until the listener is closed"""
+        while True:
+            timeout = 0.01 if self.stalled else None
+            for key, events in self.selector.select(timeout):
+                if key.data is None:
+                    self._accept()
+                elif key.data == 'wake':
+                    self._drain_completions()
+                else:
+                    conn = key.data
+                    if events & selectors.EVENT_READ:
+                        self._read(conn)
+                    if events & selectors.EVENT_WRITE and conn.sock.fileno() >= 0:
+                        self._flush(conn)
+
+            for _ in range(len(self.stalled)):
+                conn = self.stalled.popleft()
+                if conn.sock.fileno() >= 0:
+                    self._pump(conn)
+
+    def _accept(self):
+        while True:
+            try:
+                sock, _ = self.listener.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setblocking(False)
+            tune_socket(sock)
+            conn = _SelectorConnection(sock)
+            self.connections[sock.fileno()] = conn
+            self.selector.register(sock, conn.events, conn)
+            self.metrics.incr('accepted')
+            self.metrics.incr('active')
+            self._write(conn, self.welcome)
+
+    def _read(self, conn: _SelectorConnection):
+        try:
+            count = conn.reader.recv_from(conn.sock)
+        except (BlockingIOError, InterruptedError):
+            return
+        except (OSError, ValueError):
+            count = 0
+        if not count:
+            self._close(conn)
+            return
+        try:
+            frames = conn.reader.frames()
+        except (ValueError, UnicodeDecodeError):
+            self._close(conn)
+            return
+        received = time.monotonic()
+        for frame in frames:
+            if frame.headers is not None:
+                stamp_deadline(frame, received)
+        conn.pending.extend(frames)
+        self._pump(conn)
+
+    def _pump(self, conn: _SelectorConnection):
+        """Start the next request of a connection if none is in flight"""
+        while conn.pending and conn.sock.fileno() >= 0:
+            frame = conn.pending[0]
+            # Untagged requests are answered in order, so they never overlap
+            if conn.running and (conn.running >= self.multiplex or frame.id is None):
+                break
+            if self.pool is None:
+                conn.pending.popleft()
+                try:
+                    response = self._respond(frame, lambda data: self._stream_inline(conn, data))
+                except Exception:
+                    self.log.exception("error handling request")
+                    if self.stats is not None:
+                        self.stats.error()
+                    self._close(conn)
+                    return
+                self._write(conn, response)
+            elif self.pool.submit(conn, frame):
+                conn.pending.popleft()
+                conn.running += 1
+            else:
+                # Pool saturated: retry on the next loop iteration
+                self.stalled.append(conn)
+                break
+        if conn.sock.fileno() >= 0:
+            self._update_events(conn)
+
+    def _respond(self, frame: Frame, write: Callable[[bytes], None]) -> bytes:
+        """Run the handler and encode its reply; streamed items go to write"""
+        if frame.deadline and deadline_passed(frame):
+            # The client has given up on this request: do not spend time on it
+            self.metrics.incr('expired')
+            return encode_error(frame, 'deadline', 'deadline exceeded')
+        handler, stream_handler = self.handler, self.stream_handler
+        if frame.fn is not None:
+            route = self.routes.get(frame.fn)
+            if route is None:
+                return encode_error(frame, 'fn', f"unknown function '{frame.fn}'")
+            handler, stream_handler = route
+        start = time.perf_counter()
+        if stream_handler is not None and wants_stream(frame):
+            streamed = [0]
+
+            def emit(text: str):
+                data = encode_item(frame, text)
+                streamed[0] += len(data)
+                write(data)
+
+            stream_handler(frame.text, emit)
+            data = encode_reply(frame, '')
+            if self.stats is not None:
+                self.stats.record(time.perf_counter() - start, frame.size,
+                                  streamed[0] + len(data))
+            return data
+        response = handler(frame.text)
+        if self.log.isEnabledFor(logging.DEBUG):
+            self.log.debug("request", extra={'fields': {
+                'id': frame.id, 'received': frame.text, 'sent': response}})
+        data = encode_reply(frame, response)
+        if self.stats is not None:
+            self.stats.record(time.perf_counter() - start, frame.size, len(data))
+        return data
+
+    def _run_job(self, conn: _SelectorConnection, frame: Frame):
+        """Executed on a pool worker"""
+        try:
+            response = self._respond(frame, lambda data: self._stream_item(conn, data))
+        except Exception:
+            self.log.exception("error handling request")
+            if self.stats is not None:
+                self.stats.error()
+            response = None
+        self._complete(conn, response, True)
+
+    def _stream_item(self, conn: _SelectorConnection, data: bytes):
+        """Pass one streamed item to the loop, waiting while the client lags (pool worker)"""
+        while len(conn.outbuf) >= MAX_OUTBUF and conn.sock.fileno() >= 0:
+            time.sleep(0.001)
+        if conn.sock.fileno() < 0:
+            raise ConnectionAbortedError("client disconnected during a stream")
+        self._complete(conn, data, False)
+
+    def _stream_inline(self, conn: _SelectorConnection, data: bytes):
+        """Send one streamed item from the loop thread, waiting while the client lags"""
+        self._write(conn, data)
+        while len(conn.outbuf) >= MAX_OUTBUF and conn.sock.fileno() >= 0:
+            # The handler holds the loop, so wait on this socket alone
+            select.select([], [conn.sock], [], 0.1)
+            self._flush(conn)
+        if conn.sock.fileno() < 0:
+            raise ConnectionAbortedError("client disconnected during a stream")
+
+    def _complete(self, conn: _SelectorConnection, response: Optional[bytes], done: bool):
+        self.completions.append((conn, response, done))
+        try:
+            self._wake_w.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _drain_completions(self):
+        try:
+            while self._wake_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        while self.completions:
+            conn, response, done = self.completions.popleft()
+            if done:
+                conn.running -= 1
+            if conn.sock.fileno() < 0:
+                continue
+            if response is None:
+                self._close(conn)
+                continue
+            self._write(conn, response)
+            if done:
+                self._pump(conn)
+
+    def _write(self, conn: _SelectorConnection, data: bytes):
+        conn.outbuf += data
+        self._flush(conn)
+
+    def _flush(self, conn: _SelectorConnection):
+        try:
+            while conn.outbuf:
+                sent = conn.sock.send(conn.outbuf)
+                del conn.outbuf[:sent]
+        except (BlockingIOError, InterruptedError):
+            pass
+        except OSError:
+            self._close(conn)
+            return
+        self._update_events(conn)
+
+    def _update_events(self, conn: _SelectorConnection):
+        """
+        Watch for replies to flush and, unless too much of this client's work
+        is already queued, for more requests. A client that is not read from
+        fills its socket buffers and is pushed back by the kernel.
+        """
+        events = selectors.EVENT_WRITE if conn.outbuf else 0
+        if len(conn.pending) < self.max_pending and len(conn.outbuf) < MAX_OUTBUF:
+            events |= selectors.EVENT_READ
+        if events == conn.events:
+            return
+        if not conn.events:
+            self.selector.register(conn.sock, events, conn)
+        elif not events:
+            self.selector.unregister(conn.sock)
+        else:
+            self.selector.modify(conn.sock, events, conn)
+        conn.events = events
+
+    def _close(self, conn: _SelectorConnection):
+        if conn.sock.fileno() < 0:
+            return
+        self.connections.pop(conn.sock.fileno(), None)
+        if conn.events:
+            self.selector.unregister(conn.sock)
+        conn.sock.close()
+        self.metrics.incr('active', -1)
+        self.metrics.incr('completed')
@@ -31,9 +31,15 @@ class TAC:
         elif self.op == 'METHOD_CALL':
             # METHOD_CALL object method result
             return f"{self.op} {self.arg1}.{self.arg2} {self.result}"
+        elif self.op == 'PARFOR_BEGIN':
+            # PARFOR_BEGIN start end variable
+            return f"{self.op} {self.result} = {self.arg1} .. {self.arg2}"
+        elif self.op == 'PARFOR_REDUCE':
+            # PARFOR_REDUCE operator variable
+            return f"{self.op} {self.arg1} {self.arg2}"
         elif self.op in ['LABEL', 'GOTO', 'PARAM', 'RETURN', 'FUNC_BEGIN', 'FUNC_END',
                          'SEQ_BEGIN', 'SEQ_END', 'PAR_BEGIN', 'PAR_END',
-                         'THREAD_START', 'THREAD_END', 'METHOD_ARGS']:
+                         'THREAD_START', 'THREAD_END', 'METHOD_ARGS', 'PARFOR_END']:
             if self.arg1:
                 return f"{self.op} {self.arg1}"
             return self.op
@@ -329,8 +335,12 @@ class CodeGenerator:
         self.emit('SEQ_END')
     
     def gen_ParBlock(self, node: 'ParBlock') -> None:
-        """Generate code for PAR block - parallel execution with threads"""
-        self.emit('PAR_BEGIN')
+        """
+        Generate code for PAR block - parallel execution with threads.
+        Branches that race on a variable and share no channel are marked
+        serial: running them in order is the one safe schedule.
+        """
+        self.emit('PAR_BEGIN', 'serial' if node.races and not node.communicates else None)
         for i, stmt in enumerate(node.statements):
             # Each statement in PAR block will be executed in a separate thread
             self.emit('THREAD_START', i)
@@ -338,6 +348,32 @@ class CodeGenerator:
             self.emit('THREAD_END', i)
         self.emit('PAR_END')
     
+    def gen_ParForStmt(self, node: 'ParForStmt') -> None:
+        """
+        Generate code for parallel for. A loop over range(start, end) becomes
+        PARFOR_REDUCE* PARFOR_BEGIN body PARFOR_END, which the C backend turns
+        into a multi-threaded loop; other iterables get a plain for loop.
+        """
+        iterable = node.iterable
+        if not (isinstance(iterable, FuncCall) and iterable.name == 'range'
+                and len(iterable.arguments) == 2):
+            self.gen_ForStmt(ForStmt(node.variable, node.iterable, node.body))
+            return
+        
+        start = self.generate(iterable.arguments[0])
+        end = self.generate(iterable.arguments[1])
+        next_label = self.new_label()
+        
+        # continue ends the current iteration (break is rejected by the analyzer)
+        self.loop_stack.append((next_label, next_label))
+        for operator, name in node.reductions:
+            self.emit('PARFOR_REDUCE', operator, name)
+        self.emit('PARFOR_BEGIN', start, end, node.variable.name)
+        self.generate(node.body)
+        self.emit('LABEL', next_label)
+        self.emit('PARFOR_END', node.variable.name)
+        self.loop_stack.pop()
+    
     def gen_MethodCall(self, node: 'MethodCall') -> str:
         """Generate code for method call - obj.method(args)"""
         # Generate code for arguments
@@ -57,15 +57,17 @@ def compile_source(source: str, show_tokens: bool = False, show_ast: bool = Fals
         # Lexical Analysis
         print("=== Lexical Analysis ===")
         lexer = Lexer(source)
-        tokens = lexer.tokenize()
-        
         if show_tokens:
+            tokens = lexer.tokenize()
             print("\nTokens:")
             for token in tokens:
                 if token.type.name != 'EOF':
                     print(f"  {token}")
-        
-        print(f"✓ Tokenization complete: {len(tokens)} tokens generated\n")
+            print(f"✓ Tokenization complete: {len(tokens)} tokens generated\n")
+        else:
+            # Lexing happens as the parser pulls tokens, keeping only a few
+            tokens = lexer.iter_tokens()
+            print("✓ Tokens streamed to the parser\n")
         
         # Syntax Analysis
         print("=== Syntax Analysis ===")
@@ -92,6 +94,7 @@ def compile_source(source: str, show_tokens: bool = False, show_ast: bool = Fals
             raise Exception("Semantic analysis failed")
         
         print(f"✓ Semantic analysis complete: No errors found\n")
+        semantic.print_warnings()
         
         # Code Generation (TAC)
         print("=== Code Generation (TAC) ===")
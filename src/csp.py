@@ -0,0 +1,104 @@
+"""
+In-process CSP Channels for Minipar
+Bounded queues connecting the concurrent branches of a PAR block:
+
+    var q: chan = channel(64)
+    par {
+        { q.put(item)  ...  q.close() }
+        { for (var x: number in q) { ... } }
+    }
+
+put() blocks while the channel is full and get() while it is empty, so a
+fast producer is paced by its consumer and memory stays bounded.
+"""
+
+import threading
+from collections import deque
+from typing import Any, Deque, Iterator, Tuple
+
+
+class ChannelClosedError(RuntimeError):
+    """put() on a closed channel, or get() on one that is closed and drained"""
+
+
+class LocalChannel:
+    """Thread-safe bounded FIFO queue with blocking put/get and close"""
+
+    def __init__(self, capacity: int):
+        if capacity < 1:
+            raise ValueError(f"channel() capacity must be at least 1, got {capacity}")
+        self.capacity = capacity
+        self.items: Deque[Any] = deque()
+        self.closed = False
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+
+    def put(self, value: Any):
+        """Append value, waiting while the channel is full"""
+        with self._lock:
+            while len(self.items) >= self.capacity and not self.closed:
+                self._not_full.wait()
+            if self.closed:
+                raise ChannelClosedError("put() on a closed channel")
+            self.items.append(value)
+            self._not_empty.notify()
+
+    def get(self) -> Any:
+        """Take the oldest value, waiting while the channel is empty"""
+        with self._lock:
+            while not self.items and not self.closed:
+                self._not_empty.wait()
+            if not self.items:
+                raise ChannelClosedError("get() on a closed channel with no values left")
+            value = self.items.popleft()
+            self._not_full.notify()
+            return value
+
+    def try_put(self, value: Any) -> bool:
+        """Append value unless the channel is full; False if it is"""
+        with self._lock:
+            if self.closed:
+                raise ChannelClosedError("put() on a closed channel")
+            if len(self.items) >= self.capacity:
+                return False
+            self.items.append(value)
+            self._not_empty.notify()
+            return True
+
+    def try_get(self) -> Tuple[bool, Any]:
+        """(True, oldest value), or (False, None) while the channel is empty"""
+        with self._lock:
+            if not self.items:
+                if self.closed:
+                    raise ChannelClosedError("get() on a closed channel with no values left")
+                return False, None
+            value = self.items.popleft()
+            self._not_full.notify()
+            return True, value
+
+    def close(self):
+        """No more values: waiting consumers drain the channel, then stop"""
+        with self._lock:
+            self.closed = True
+            self._not_empty.notify_all()
+            self._not_full.notify_all()
+
+    def __iter__(self) -> Iterator[Any]:
+        """Values until the channel is closed and drained"""
+        while True:
+            with self._lock:
+                while not self.items and not self.closed:
+                    self._not_empty.wait()
+                if not self.items:
+                    return
+                value = self.items.popleft()
+                self._not_full.notify()
+            yield value
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __repr__(self):
+        state = ", closed" if self.closed else ""
+        return f"<channel {len(self.items)}/{self.capacity}{state}>"
@@ -0,0 +1,228 @@
+"""
+Distributed PAR Execution for Minipar
+Ships PAR branches to worker daemons on other machines (or other processes)
+over the channel wire protocol:
+
+    python src/runner.py --par-worker 0.0.0.0:7000          # on each node
+    python src/runner.py --par-node node1:7000 --par-node node2:7000 prog.minipar
+
+Each shipped branch travels as one request: its AST, the functions it can
+call and the current values of the variables it names. The worker runs it
+and answers with the variables the branch changed and what it printed.
+Branches are spread over the workers with the fewest replies pending; a
+worker that fails is ejected (and retried after a growing delay) and the
+branch is sent to another one. When no worker can take it, the branch runs
+locally. Shipped branches work on copies, so branches should write
+different variables, as they would in a forked par for.
+
+Payloads are pickles: only run worker daemons on networks you trust.
+"""
+
+import base64
+import builtins
+import contextlib
+import io
+import logging
+import pickle
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    from src import ast_nodes
+    from src.channels import (ClientConfig, BalancedClient, ChannelError, SelectorServer,
+                              ServerMetrics)
+    from src.transports import parse_address, parse_endpoint, describe, create_listener
+except ImportError:
+    import ast_nodes
+    from channels import (ClientConfig, BalancedClient, ChannelError, SelectorServer,
+                          ServerMetrics)
+    from transports import parse_address, parse_endpoint, describe, create_listener
+
+
+PAR_WORKER_DESCRIPTION = "minipar par worker"
+
+# Times a branch is sent to a worker before it runs locally instead
+DEFAULT_ATTEMPTS = 3
+
+# Seconds to wait for a worker's reply before treating the worker as hung
+BRANCH_TIMEOUT = 300.0
+
+# Non-AST classes a payload may name; anything else is refused when unpickling
+_SAFE_BUILTINS = frozenset({'range', 'set', 'frozenset', 'slice', 'complex'})
+
+log = logging.getLogger('minipar.distributed')
+
+
+class _PayloadUnpickler(pickle.Unpickler):
+    """
+    Loads branch payloads. AST classes resolve to this process's ast_nodes
+    whichever name the sender imported it under (src.ast_nodes when run as a
+    package, ast_nodes when run as a script); other classes are refused.
+    """
+
+    def find_class(self, module: str, name: str) -> Any:
+        if module in ('ast_nodes', 'src.ast_nodes'):
+            cls = getattr(ast_nodes, name, None)
+            if isinstance(cls, type) and issubclass(cls, ast_nodes.ASTNode):
+                return cls
+        elif module == 'builtins' and name in _SAFE_BUILTINS:
+            return getattr(builtins, name)
+        raise pickle.UnpicklingError(f"payload may not contain {module}.{name}")
+
+
+def _dumps(value: Any) -> str:
+    # Base64 keeps the pickle on one line of the newline-framed protocol
+    return base64.b64encode(pickle.dumps(value, pickle.HIGHEST_PROTOCOL)).decode('ascii')
+
+
+def _loads(text: str) -> Any:
+    return _PayloadUnpickler(io.BytesIO(base64.b64decode(text))).load()
+
+
+def encode_branch(functions: Dict[str, ast_nodes.FuncDecl], statement: ast_nodes.ASTNode,
+                  values: Dict[str, Any]) -> str:
+    """Request text shipping one branch"""
+    return _dumps((functions, statement, values))
+
+
+def decode_branch(text: str) -> Tuple[Dict[str, ast_nodes.FuncDecl], ast_nodes.ASTNode,
+                                      Dict[str, Any]]:
+    return _loads(text)
+
+
+def encode_result(changes: Optional[Dict[str, Any]] = None, output: str = '',
+                  error: Optional[BaseException] = None) -> str:
+    """Reply text: the changed variables and printed output, or the branch's error"""
+    if error is not None:
+        return _dumps(('error', type(error).__name__, str(error), output))
+    return _dumps(('ok', changes or {}, output))
+
+
+def decode_result(text: str) -> Tuple[Dict[str, Any], str, Optional[Exception]]:
+    """(changed variables, printed output, the error the branch failed with or None)"""
+    result = _loads(text)
+    if result[0] == 'ok':
+        return result[1], result[2], None
+    _, kind, message, output = result
+    # Built-in error types come back as themselves, runtime ones as RuntimeError
+    exc_type = getattr(builtins, kind, None)
+    if not (isinstance(exc_type, type) and issubclass(exc_type, Exception)):
+        exc_type, message = RuntimeError, f"{kind}: {message}"
+    return {}, output, exc_type(message)
+
+
+def serve_par_worker(address: str,
+                     execute: Callable[[Dict[str, Any], ast_nodes.ASTNode, Dict[str, Any]],
+                                       Dict[str, Any]],
+                     backlog: int = 128, on_ready: Optional[Callable[[str], None]] = None):
+    """
+    Run a worker daemon on address (host:port) until it is interrupted.
+    execute(functions, statement, values) runs one branch and returns the
+    variables it changed. Branches run one at a time on the event loop
+    thread, which is what lets their output be captured.
+    """
+    host, port = parse_endpoint(address)
+    transport, target = parse_address(host, port)
+    listener = create_listener(transport, target, backlog)
+
+    def handle(payload: str) -> str:
+        output = io.StringIO()
+        try:
+            functions, statement, values = decode_branch(payload)
+            with contextlib.redirect_stdout(output):
+                changes = execute(functions, statement, values)
+        except Exception as e:
+            return encode_result(output=output.getvalue(), error=e)
+        return encode_result(changes, output.getvalue())
+
+    if on_ready is not None:
+        on_ready(describe(transport, target))
+    SelectorServer(listener, PAR_WORKER_DESCRIPTION, handle, ServerMetrics(),
+                   name='par-worker', log=log).serve_forever()
+
+
+class DistributedScheduler:
+    """
+    Runs PAR branches on registered worker daemons. Sending, connection
+    and timeout failures eject the worker and retry the branch on another
+    one, up to attempts times; an error raised by the branch itself is the
+    program's and is never retried.
+    """
+
+    def __init__(self, nodes: Optional[List[str]] = None, attempts: int = DEFAULT_ATTEMPTS,
+                 config: Optional[ClientConfig] = None):
+        if attempts < 1:
+            raise ValueError(f"attempts must be at least 1, got {attempts}")
+        self.nodes: List[Tuple[str, int]] = []
+        self.attempts = attempts
+        self.config = config or ClientConfig(pool=False, policy='least_outstanding',
+                                             recv_timeout=BRANCH_TIMEOUT)
+        self.client: Optional[BalancedClient] = None
+        self.shipped = 0
+        self.retries = 0
+        self.fallbacks = 0
+        self._lock = threading.Lock()
+        for node in nodes or []:
+            self.register(node)
+
+    def register(self, node: str):
+        """Add a worker daemon (host:port); it takes branches from the next PAR block on"""
+        endpoint = parse_endpoint(node)
+        with self._lock:
+            if endpoint in self.nodes:
+                return
+            self.nodes.append(endpoint)
+            if self.client is not None:
+                self.client.release()
+                self.client = None
+
+    def run(self, functions: Dict[str, ast_nodes.FuncDecl], statement: ast_nodes.ASTNode,
+            values: Dict[str, Any]) -> Optional[Tuple[Dict[str, Any], str, Optional[Exception]]]:
+        """
+        Run statement on a worker and return decode_result() of its reply,
+        or None when no worker could run it and it should run locally
+        """
+        payload = encode_branch(functions, statement, values)
+        for attempt in range(1, self.attempts + 1):
+            try:
+                reply = self._client().request(payload)
+            except (OSError, ChannelError) as e:
+                # ChannelTimeoutError is both; the client ejected the worker
+                log.warning("par branch failed on a worker", extra={'fields': {
+                    'attempt': attempt, 'error': str(e)}})
+                with self._lock:
+                    self.retries += 1
+                continue
+            with self._lock:
+                self.shipped += 1
+            return decode_result(reply)
+        with self._lock:
+            self.fallbacks += 1
+        log.warning("no par worker could run the branch, running it locally")
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        """Branch counters and the health of every worker"""
+        with self._lock:
+            client = self.client
+            counters = {'shipped': self.shipped, 'retries': self.retries,
+                        'fallbacks': self.fallbacks}
+            nodes = list(self.nodes)
+        counters['workers'] = (client.stats() if client is not None else
+                               [{'endpoint': f"{host}:{port}", 'up': False} for host, port in nodes])
+        return counters
+
+    def close(self):
+        with self._lock:
+            if self.client is not None:
+                self.client.release()
+                self.client = None
+
+    def _client(self) -> BalancedClient:
+        with self._lock:
+            if self.client is None:
+                if not self.nodes:
+                    raise ConnectionError("No par worker registered")
+                # Raises ConnectionRefusedError while every worker is down
+                self.client = BalancedClient(self.nodes, self.config, log=log)
+            return self.client
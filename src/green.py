@@ -0,0 +1,239 @@
+"""
+Cooperative (Green-Thread) Scheduler for Minipar PAR Blocks
+Runs PAR branches as generator tasks on the calling thread instead of on
+OS threads, so a program can keep tens of thousands of branches waiting on
+timers and channels at once:
+
+- a task runs until it reaches a switch point: sleep(), a channel put() or
+  get() that has to wait, a network channel request or await(), a nested
+  PAR block, or a loop back-edge while other tasks are ready to run
+- sleeping tasks wait in a timer heap, tasks blocked on a channel are
+  parked until another task uses that channel
+- network requests block in the socket library, so they run on a small
+  pool of helper threads while their task waits; the loop sleeps until a
+  timer is due or a request finishes
+- when every task is parked on a channel, and no timer or request is
+  pending, nothing can ever wake them and the PAR block fails instead of
+  hanging
+
+Tasks yield instructions to the loop: None (let others run), Sleep,
+WaitChannel, Blocking or Join.
+"""
+
+import heapq
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Generator, List, Optional, Tuple
+
+
+# Helper threads running the blocking calls of green tasks, per scheduler
+BLOCKING_THREADS = 32
+
+
+class Sleep:
+    """Resume the task once the monotonic clock reaches until"""
+    __slots__ = ('until',)
+
+    def __init__(self, seconds: float):
+        if seconds < 0:
+            raise ValueError(f"sleep() needs a non-negative number of seconds, got {seconds}")
+        self.until = time.monotonic() + seconds
+
+
+class WaitChannel:
+    """Resume the task after the next operation on channel"""
+    __slots__ = ('channel',)
+
+    def __init__(self, channel: Any):
+        self.channel = channel
+
+
+class Blocking:
+    """Run call on a helper thread; the task resumes with its result or error"""
+    __slots__ = ('call',)
+
+    def __init__(self, call: Callable[[], Any]):
+        self.call = call
+
+
+class Join:
+    """Resume the task once every one of tasks has finished"""
+    __slots__ = ('tasks',)
+
+    def __init__(self, tasks: List['GreenTask']):
+        self.tasks = tasks
+
+
+class GreenTask:
+    """One PAR branch: its generator, and its result or error once it has finished"""
+    __slots__ = ('gen', 'result', 'error', 'done', 'joiner', 'pending', 'resume')
+
+    def __init__(self, gen: Generator):
+        self.gen = gen
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+        self.joiner: Optional['GreenTask'] = None  # Task waiting in Join for this one
+        self.pending = 0  # Unfinished tasks this one is joining
+        self.resume: Optional[Future] = None  # Finished blocking call to resume with
+
+
+class GreenScheduler:
+    """Single-threaded loop driving green tasks"""
+
+    def __init__(self):
+        self.ready: Deque[GreenTask] = deque()
+        self.timers: List[Tuple[float, int, GreenTask]] = []
+        self.parked: Dict[int, List[GreenTask]] = {}
+        self.running = False
+        self.switches = 0
+        self.spawned = 0
+        self.blocked = 0  # Tasks whose blocking call has not been collected
+        self._woken: Deque[GreenTask] = deque()  # Appended to by helper threads
+        self._wakeup = threading.Event()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._seq = 0
+
+    def run_all(self, gens: List[Generator]) -> List[Any]:
+        """Run gens as tasks until all have finished; their results in order, or the first error"""
+        root = GreenTask(None)  # Joins the tasks on behalf of the caller
+        tasks = [self.spawn(gen) for gen in gens]
+        for task in tasks:
+            task.joiner = root
+        root.pending = len(tasks)
+        self.running = True
+        try:
+            while root.pending:
+                if not self._run_once():
+                    break
+        finally:
+            self.running = False
+        for task in tasks:
+            if task.error is not None:
+                raise task.error
+        if root.pending:
+            stuck = self._abandon_parked()
+            raise RuntimeError(f"deadlock: {stuck} PAR tasks are waiting on channels nothing will use")
+        return [task.result for task in tasks]
+
+    def spawn(self, gen: Generator) -> GreenTask:
+        task = GreenTask(gen)
+        self.ready.append(task)
+        self.spawned += 1
+        return task
+
+    def should_yield(self) -> bool:
+        """Whether a task at a loop back-edge should let others run"""
+        return (bool(self.ready) or bool(self._woken)
+                or bool(self.timers and self.timers[0][0] <= time.monotonic()))
+
+    def notify(self, channel: Any):
+        """Wake the tasks parked on channel, which retry their operation"""
+        waiting = self.parked.pop(id(channel), None)
+        if waiting:
+            self.ready.extend(waiting)
+
+    def shutdown(self):
+        """Stop the helper threads once their calls return"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+    def _run_once(self) -> bool:
+        """Run every ready task once; False when no task can ever run again"""
+        self._collect_woken()
+        if not self.ready and (self.timers or self.blocked):
+            timeout = max(0.0, self.timers[0][0] - time.monotonic()) if self.timers else None
+            if self.blocked:
+                # A finishing call sets the event after queueing its task
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+                self._collect_woken()
+            elif timeout:
+                time.sleep(timeout)
+        if self.timers:
+            now = time.monotonic()
+            while self.timers and self.timers[0][0] <= now:
+                self.ready.append(heapq.heappop(self.timers)[2])
+        if not self.ready:
+            return bool(self.timers or self.blocked)
+        # Tasks made ready while this batch runs wait for the next one
+        for _ in range(len(self.ready)):
+            self._step(self.ready.popleft())
+        return True
+
+    def _abandon_parked(self) -> int:
+        """Close the generators of parked tasks (running their finally blocks); returns how many"""
+        stuck = [task for waiting in self.parked.values() for task in waiting]
+        self.parked.clear()
+        for task in stuck:
+            task.gen.close()
+        return len(stuck)
+
+    def _collect_woken(self):
+        while self._woken:
+            self.ready.append(self._woken.popleft())
+            self.blocked -= 1
+
+    def _block(self, task: GreenTask, call: Callable[[], Any]):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(BLOCKING_THREADS, thread_name_prefix='minipar-green-io')
+        self.blocked += 1
+        task.resume = self._executor.submit(call)
+
+        def woken(_: Future):
+            self._woken.append(task)
+            self._wakeup.set()
+        task.resume.add_done_callback(woken)
+
+    def _step(self, task: GreenTask):
+        self.switches += 1
+        try:
+            if task.resume is None:
+                instruction = next(task.gen)
+            else:
+                future, task.resume = task.resume, None
+                error = future.exception()
+                if error is not None:
+                    instruction = task.gen.throw(error)
+                else:
+                    instruction = task.gen.send(future.result())
+        except StopIteration as stop:
+            self._finish(task, stop.value, None)
+            return
+        except BaseException as e:
+            self._finish(task, None, e)
+            return
+
+        if instruction is None:
+            self.ready.append(task)
+        elif isinstance(instruction, Sleep):
+            self._seq += 1
+            heapq.heappush(self.timers, (instruction.until, self._seq, task))
+        elif isinstance(instruction, WaitChannel):
+            self.parked.setdefault(id(instruction.channel), []).append(task)
+        elif isinstance(instruction, Blocking):
+            self._block(task, instruction.call)
+        elif isinstance(instruction, Join):
+            task.pending = 0
+            for child in instruction.tasks:
+                if not child.done:
+                    child.joiner = task
+                    task.pending += 1
+            if not task.pending:
+                self.ready.append(task)
+        else:
+            task.gen.close()
+            self._finish(task, None, TypeError(f"green task yielded {instruction!r}"))
+
+    def _finish(self, task: GreenTask, result: Any, error: Optional[BaseException]):
+        task.result = result
+        task.error = error
+        task.done = True
+        joiner = task.joiner
+        if joiner is not None:
+            joiner.pending -= 1
+            if not joiner.pending and joiner.gen is not None:
+                self.ready.append(joiner)
@@ -1,12 +1,20 @@
 """
 Lexer for Minipar Language
 Performs lexical analysis and tokenization
+
+Two modes produce the same tokens:
+- 'regex' (the default) matches whole tokens with one compiled master
+  pattern and works out line and column from offsets, only when a token is
+  made; anything the pattern does not cover (non-ASCII identifiers and
+  digits, unterminated strings and comments, stray characters) is handed to
+  the character scanner for that one token
+- 'chars' walks the source one character at a time with peek()/advance()
 """
 
 import re
 from enum import Enum, auto
 from dataclasses import dataclass
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
 
 class TokenType(Enum):
@@ -36,6 +44,7 @@ class TokenType(Enum):
     LIST = auto()
     DICT = auto()
     ANY = auto()
+    CHAN = auto()
     
     # Literals
     NUMBER_LITERAL = auto()
@@ -94,7 +103,54 @@ class Token:
         return f"Token({self.type.name}, {repr(self.value)}, {self.line}:{self.column})"
 
 
+# Operators and delimiters, two-character ones first so they win
+OPERATORS = {
+    '==': TokenType.EQ,
+    '!=': TokenType.NEQ,
+    '<=': TokenType.LTE,
+    '>=': TokenType.GTE,
+    '&&': TokenType.AND,
+    '||': TokenType.OR,
+    '->': TokenType.ARROW,
+    '+': TokenType.PLUS,
+    '-': TokenType.MINUS,
+    '*': TokenType.MULTIPLY,
+    '/': TokenType.DIVIDE,
+    '%': TokenType.MODULO,
+    '!': TokenType.NOT,
+    '<': TokenType.LT,
+    '>': TokenType.GT,
+    '=': TokenType.ASSIGN,
+    '(': TokenType.LPAREN,
+    ')': TokenType.RPAREN,
+    '{': TokenType.LBRACE,
+    '}': TokenType.RBRACE,
+    ',': TokenType.COMMA,
+    ';': TokenType.SEMICOLON,
+    ':': TokenType.COLON,
+    '.': TokenType.DOT,
+    '[': TokenType.LBRACKET,
+    ']': TokenType.RBRACKET,
+}
+
+# Leading whitespace, then one alternative per token class, most frequent
+# first. Identifiers and numbers are ASCII only, the character scanner takes
+# the rest; '/' never starts an unterminated comment, which it reports
+MASTER_PATTERN = re.compile(r'[ \t\r\n]*(?:' + '|'.join([
+    r'(?P<IDENT>[A-Za-z_][A-Za-z0-9_]*)',
+    r'(?P<OP>' + '|'.join(r'/(?!\*)' if op == '/' else re.escape(op) for op in OPERATORS) + ')',
+    r'(?P<NUMBER>[0-9]+(?:\.[0-9]*)?)',
+    r'(?P<STRING>"(?:[^"\\]|\\.)*")',
+    r'(?P<SKIP>\#[^\n]*|/\*.*?\*/)',
+]) + ')', re.DOTALL)
+
+ESCAPE_PATTERN = re.compile(r'\\(.)', re.DOTALL)
+ESCAPES = {'n': '\n', 't': '\t'}
+
+
 class Lexer:
+    MODES = ('regex', 'chars')
+    
     KEYWORDS = {
         'break': TokenType.BREAK,
         'c_channel': TokenType.C_CHANNEL,
@@ -119,10 +175,14 @@ class Lexer:
         'list': TokenType.LIST,
         'dict': TokenType.DICT,
         'any': TokenType.ANY,
+        'chan': TokenType.CHAN,
     }
     
-    def __init__(self, source: str):
+    def __init__(self, source: str, mode: str = 'regex'):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown lexer mode '{mode}', expected one of {', '.join(self.MODES)}")
         self.source = source
+        self.mode = mode
         self.pos = 0
         self.line = 1
         self.column = 1
@@ -225,145 +285,216 @@ class Lexer:
         return Token(token_type, value, start_line, start_col)
     
     def tokenize(self) -> List[Token]:
+        self.tokens.extend(self.iter_tokens())
+        return self.tokens
+    
+    def iter_tokens(self) -> Iterator[Token]:
+        """Yield tokens as they are read, ending with EOF, without keeping them"""
+        if self.mode == 'regex':
+            yield from self.iter_tokens_regex()
+            return
         while self.pos < len(self.source):
-            self.skip_whitespace()
-            
-            if self.pos >= len(self.source):
-                break
-            
-            if self.skip_comment():
+            token = self.scan_token()
+            if token is not None:
+                yield token
+        yield Token(TokenType.EOF, None, self.line, self.column)
+    
+    def iter_tokens_regex(self) -> Iterator[Token]:
+        source = self.source
+        match = MASTER_PATTERN.match
+        keywords, operators = self.KEYWORDS, OPERATORS
+        end = len(source)
+        pos = self.pos
+        # Line and column come from the offset of the last newline before a
+        # token, found by searching only the text since the previous token
+        line, line_start, counted = self.line, self.pos - self.column + 1, self.pos
+        
+        while pos < end:
+            m = match(source, pos)
+            kind = m.lastgroup if m is not None else None
+            if kind is None or (kind in ('IDENT', 'NUMBER') and m.end() < end
+                                and source[m.end()] >= '\x80'):
+                # Let the character scanner take (or reject) this token
+                newlines = source.count('\n', counted, pos)
+                if newlines:
+                    line += newlines
+                    line_start = source.rindex('\n', counted, pos) + 1
+                self.pos, self.line, self.column = pos, line, pos - line_start + 1
+                token = self.scan_token()
+                if token is not None:
+                    yield token
+                pos, line, counted = self.pos, self.line, self.pos
+                line_start = pos - self.column + 1
                 continue
             
-            start_line, start_col = self.line, self.column
-            char = self.peek()
-            
-            # Numbers
-            if char.isdigit():
-                self.tokens.append(self.read_number())
-            
-            # Strings
-            elif char == '"':
-                self.tokens.append(self.read_string())
-            
-            # Identifiers and keywords
-            elif char.isalpha() or char == '_':
-                self.tokens.append(self.read_identifier())
-            
-            # Two-character operators
-            elif char == '=' and self.peek(1) == '=':
-                self.advance()
-                self.advance()
-                self.tokens.append(Token(TokenType.EQ, '==', start_line, start_col))
-            
-            elif char == '!' and self.peek(1) == '=':
-                self.advance()
-                self.advance()
-                self.tokens.append(Token(TokenType.NEQ, '!=', start_line, start_col))
-            
-            elif char == '<' and self.peek(1) == '=':
-                self.advance()
-                self.advance()
-                self.tokens.append(Token(TokenType.LTE, '<=', start_line, start_col))
-            
-            elif char == '>' and self.peek(1) == '=':
-                self.advance()
-                self.advance()
-                self.tokens.append(Token(TokenType.GTE, '>=', start_line, start_col))
-            
-            elif char == '&' and self.peek(1) == '&':
-                self.advance()
-                self.advance()
-                self.tokens.append(Token(TokenType.AND, '&&', start_line, start_col))
-            
-            elif char == '|' and self.peek(1) == '|':
-                self.advance()
-                self.advance()
-                self.tokens.append(Token(TokenType.OR, '||', start_line, start_col))
-            
-            elif char == '-' and self.peek(1) == '>':
-                self.advance()
-                self.advance()
-                self.tokens.append(Token(TokenType.ARROW, '->', start_line, start_col))
-            
-            # Single-character operators and delimiters
-            elif char == '+':
-                self.advance()
-                self.tokens.append(Token(TokenType.PLUS, '+', start_line, start_col))
-            
-            elif char == '-':
-                self.advance()
-                self.tokens.append(Token(TokenType.MINUS, '-', start_line, start_col))
-            
-            elif char == '*':
-                self.advance()
-                self.tokens.append(Token(TokenType.MULTIPLY, '*', start_line, start_col))
-            
-            elif char == '/':
-                self.advance()
-                self.tokens.append(Token(TokenType.DIVIDE, '/', start_line, start_col))
-            
-            elif char == '%':
-                self.advance()
-                self.tokens.append(Token(TokenType.MODULO, '%', start_line, start_col))
-            
-            elif char == '!':
-                self.advance()
-                self.tokens.append(Token(TokenType.NOT, '!', start_line, start_col))
-            
-            elif char == '<':
-                self.advance()
-                self.tokens.append(Token(TokenType.LT, '<', start_line, start_col))
-            
-            elif char == '>':
-                self.advance()
-                self.tokens.append(Token(TokenType.GT, '>', start_line, start_col))
-            
-            elif char == '=':
-                self.advance()
-                self.tokens.append(Token(TokenType.ASSIGN, '=', start_line, start_col))
-            
-            elif char == '(':
-                self.advance()
-                self.tokens.append(Token(TokenType.LPAREN, '(', start_line, start_col))
-            
-            elif char == ')':
-                self.advance()
-                self.tokens.append(Token(TokenType.RPAREN, ')', start_line, start_col))
-            
-            elif char == '{':
-                self.advance()
-                self.tokens.append(Token(TokenType.LBRACE, '{', start_line, start_col))
-            
-            elif char == '}':
-                self.advance()
-                self.tokens.append(Token(TokenType.RBRACE, '}', start_line, start_col))
-            
-            elif char == ',':
-                self.advance()
-                self.tokens.append(Token(TokenType.COMMA, ',', start_line, start_col))
-            
-            elif char == ';':
-                self.advance()
-                self.tokens.append(Token(TokenType.SEMICOLON, ';', start_line, start_col))
-            
-            elif char == ':':
-                self.advance()
-                self.tokens.append(Token(TokenType.COLON, ':', start_line, start_col))
-            
-            elif char == '.':
-                self.advance()
-                self.tokens.append(Token(TokenType.DOT, '.', start_line, start_col))
-            
-            elif char == '[':
-                self.advance()
-                self.tokens.append(Token(TokenType.LBRACKET, '[', start_line, start_col))
-            
-            elif char == ']':
-                self.advance()
-                self.tokens.append(Token(TokenType.RBRACKET, ']', start_line, start_col))
-            
+            pos = m.end()
+            if kind == 'SKIP':
+                continue
+            start = m.start(kind)
+            newlines = source.count('\n', counted, start)
+            if newlines:
+                line += newlines
+                line_start = source.rindex('\n', counted, start) + 1
+            counted = start
+            column = start - line_start + 1
+            text = m.group(kind)
+            if kind == 'IDENT':
+                yield Token(keywords.get(text, TokenType.IDENTIFIER), text, line, column)
+            elif kind == 'OP':
+                yield Token(operators[text], text, line, column)
+            elif kind == 'NUMBER':
+                value = float(text) if '.' in text else int(text)
+                yield Token(TokenType.NUMBER_LITERAL, value, line, column)
             else:
-                self.error(f"Unexpected character: '{char}'")
+                value = text[1:-1]
+                if '\\' in value:
+                    value = ESCAPE_PATTERN.sub(lambda e: ESCAPES.get(e.group(1), e.group(1)), value)
+                yield Token(TokenType.STRING_LITERAL, value, line, column)
         
-        self.tokens.append(Token(TokenType.EOF, None, self.line, self.column))
-        return self.tokens
+        newlines = source.count('\n', counted, end)
+        if newlines:
+            line += newlines
+            line_start = source.rindex('\n', counted, end) + 1
+        self.pos, self.line, self.column = end, line, end - line_start + 1
+        yield Token(TokenType.EOF, None, self.line, self.column)
+    
+    def scan_token(self) -> Optional[Token]:
+        """Read one token from pos with the character scanner; None after whitespace or a comment"""
+        self.skip_whitespace()
+        
+        if self.pos >= len(self.source):
+            return None
+        
+        if self.skip_comment():
+            return None
+        
+        start_line, start_col = self.line, self.column
+        char = self.peek()
+        
+        # Numbers
+        if char.isdigit():
+            return self.read_number()
+        
+        # Strings
+        elif char == '"':
+            return self.read_string()
+        
+        # Identifiers and keywords
+        elif char.isalpha() or char == '_':
+            return self.read_identifier()
+        
+        # Two-character operators
+        elif char == '=' and self.peek(1) == '=':
+            self.advance()
+            self.advance()
+            return Token(TokenType.EQ, '==', start_line, start_col)
+        
+        elif char == '!' and self.peek(1) == '=':
+            self.advance()
+            self.advance()
+            return Token(TokenType.NEQ, '!=', start_line, start_col)
+        
+        elif char == '<' and self.peek(1) == '=':
+            self.advance()
+            self.advance()
+            return Token(TokenType.LTE, '<=', start_line, start_col)
+        
+        elif char == '>' and self.peek(1) == '=':
+            self.advance()
+            self.advance()
+            return Token(TokenType.GTE, '>=', start_line, start_col)
+        
+        elif char == '&' and self.peek(1) == '&':
+            self.advance()
+            self.advance()
+            return Token(TokenType.AND, '&&', start_line, start_col)
+        
+        elif char == '|' and self.peek(1) == '|':
+            self.advance()
+            self.advance()
+            return Token(TokenType.OR, '||', start_line, start_col)
+        
+        elif char == '-' and self.peek(1) == '>':
+            self.advance()
+            self.advance()
+            return Token(TokenType.ARROW, '->', start_line, start_col)
+        
+        # Single-character operators and delimiters
+        elif char == '+':
+            self.advance()
+            return Token(TokenType.PLUS, '+', start_line, start_col)
+        
+        elif char == '-':
+            self.advance()
+            return Token(TokenType.MINUS, '-', start_line, start_col)
+        
+        elif char == '*':
+            self.advance()
+            return Token(TokenType.MULTIPLY, '*', start_line, start_col)
+        
+        elif char == '/':
+            self.advance()
+            return Token(TokenType.DIVIDE, '/', start_line, start_col)
+        
+        elif char == '%':
+            self.advance()
+            return Token(TokenType.MODULO, '%', start_line, start_col)
+        
+        elif char == '!':
+            self.advance()
+            return Token(TokenType.NOT, '!', start_line, start_col)
+        
+        elif char == '<':
+            self.advance()
+            return Token(TokenType.LT, '<', start_line, start_col)
+        
+        elif char == '>':
+            self.advance()
+            return Token(TokenType.GT, '>', start_line, start_col)
+        
+        elif char == '=':
+            self.advance()
+            return Token(TokenType.ASSIGN, '=', start_line, start_col)
+        
+        elif char == '(':
+            self.advance()
+            return Token(TokenType.LPAREN, '(', start_line, start_col)
+        
+        elif char == ')':
+            self.advance()
+            return Token(TokenType.RPAREN, ')', start_line, start_col)
+        
+        elif char == '{':
+            self.advance()
+            return Token(TokenType.LBRACE, '{', start_line, start_col)
+        
+        elif char == '}':
+            self.advance()
+            return Token(TokenType.RBRACE, '}', start_line, start_col)
+        
+        elif char == ',':
+            self.advance()
+            return Token(TokenType.COMMA, ',', start_line, start_col)
+        
+        elif char == ';':
+            self.advance()
+            return Token(TokenType.SEMICOLON, ';', start_line, start_col)
+        
+        elif char == ':':
+            self.advance()
+            return Token(TokenType.COLON, ':', start_line, start_col)
+        
+        elif char == '.':
+            self.advance()
+            return Token(TokenType.DOT, '.', start_line, start_col)
+        
+        elif char == '[':
+            self.advance()
+            return Token(TokenType.LBRACKET, '[', start_line, start_col)
+        
+        elif char == ']':
+            self.advance()
+            return Token(TokenType.RBRACKET, ']', start_line, start_col)
+        
+        else:
+            self.error(f"Unexpected character: '{char}'")
@@ -0,0 +1,332 @@
+"""
+Channel Load Generator for Minipar
+Opens N concurrent connections to a server channel and reports throughput
+and latency.
+
+Closed-loop mode keeps a fixed number of requests in flight per connection,
+so it measures the most a server can do. Fixed-rate mode sends on a
+schedule whatever the server does, and measures each latency from the time
+the request was due, so a stalled server shows up in the tail instead of
+silently slowing the generator down.
+
+Usage:
+    python -m src.loadgen localhost:5000 -c 8 -d 10
+    python -m src.loadgen localhost:5001 --rate 2000 --message "hello {i}"
+    python -m src.loadgen localhost:5000 --serve examples/calc_server.minipar
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional, Tuple
+
+try:
+    from src.channels import FrameReader, encode_frame
+    from src.telemetry import LatencyHistogram
+    from src.transports import parse_address, parse_endpoint, describe, connect
+except ImportError:
+    from channels import FrameReader, encode_frame
+    from telemetry import LatencyHistogram
+    from transports import parse_address, parse_endpoint, describe, connect
+
+
+# Reported after the histogram's own p50/p90/p99
+EXTRA_QUANTILES = (0.999,)
+
+
+@dataclass
+class LoadConfig:
+    """What to send, how hard and for how long"""
+    host: str
+    port: int
+    connections: int = 8
+    duration: float = 10.0
+    warmup: float = 1.0
+    rate: float = 0.0           # Total requests/second; 0 runs closed-loop
+    pipeline: int = 1           # Requests in flight per connection (closed-loop)
+    max_inflight: int = 1000    # Fixed-rate: stop sending past this backlog
+    messages: List[str] = field(default_factory=lambda: ["+,{i},1"])
+
+
+@dataclass
+class LoadResult:
+    """Counts and latencies measured after the warm-up"""
+    requests: int = 0
+    errors: int = 0
+    bytes_out: int = 0
+    bytes_in: int = 0
+    elapsed: float = 0.0
+    latency: LatencyHistogram = field(default_factory=LatencyHistogram)
+
+    def merge(self, other: 'LoadResult'):
+        self.requests += other.requests
+        self.errors += other.errors
+        self.bytes_out += other.bytes_out
+        self.bytes_in += other.bytes_in
+        self.elapsed = max(self.elapsed, other.elapsed)
+        self.latency.merge(other.latency)
+
+    def summary(self) -> dict:
+        latency = {}
+        for name, value in self.latency.summary().items():
+            latency[name] = value
+            if name == 'p99':
+                for q in EXTRA_QUANTILES:
+                    latency[f"p{q * 100:g}"] = round(self.latency.quantile(q) * 1000, 3)
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'seconds': round(self.elapsed, 3),
+            'throughput': round(self.requests / self.elapsed, 1) if self.elapsed else 0.0,
+            'bytes_out': self.bytes_out,
+            'bytes_in': self.bytes_in,
+            'latency_ms': latency,
+        }
+
+
+class _Connection:
+    """One load connection; records into its own result, so no locking"""
+
+    def __init__(self, config: LoadConfig, index: int, start: float, result: LoadResult):
+        self.config = config
+        self.index = index
+        self.result = result
+        self.measure_from = start + config.warmup
+        self.stop_at = self.measure_from + config.duration
+        transport, target = parse_address(config.host, config.port)
+        self.sock = connect(transport, target)
+        self.reader = FrameReader(self.sock)
+        if self.reader.read_frame() is None:
+            raise ConnectionError(f"{describe(transport, target)} closed the connection")
+        # Request id -> (time the request was due, bytes sent)
+        self.pending = {}
+        self.lock = threading.Condition()
+        self.sent = 0
+
+    def _frame(self) -> Tuple[int, bytes]:
+        request_id = self.sent
+        self.sent += 1
+        messages = self.config.messages
+        message = messages[request_id % len(messages)]
+        if '{' in message:
+            message = message.replace('{i}', str(request_id)).replace('{c}', str(self.index))
+        return request_id, encode_frame(message, {'id': request_id})
+
+    def _complete(self, frame) -> bool:
+        """Account for one reply; False once the run is over"""
+        now = time.perf_counter()
+        due, size = self.pending.pop(int(frame.id))
+        if due >= self.measure_from and now <= self.stop_at:
+            self.result.requests += 1
+            self.result.bytes_out += size
+            self.result.bytes_in += frame.size
+            self.result.latency.record(now - due)
+        return now < self.stop_at
+
+    def run_closed_loop(self):
+        """Keep `pipeline` requests in flight until the run ends"""
+        for _ in range(self.config.pipeline):
+            self._send(time.perf_counter())
+        while True:
+            frame = self.reader.read_frame()
+            if frame is None:
+                raise ConnectionError("Server closed the connection")
+            if not self._complete(frame):
+                return
+            self._send(time.perf_counter())
+
+    def run_fixed_rate(self, rate: float, offset: float):
+        """Send every 1/rate seconds on one thread, read replies on another"""
+        receiver = threading.Thread(target=self._receive, daemon=True)
+        receiver.start()
+        interval = 1.0 / rate
+        due = self.measure_from - self.config.warmup + offset
+        while due < self.stop_at:
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            with self.lock:
+                while len(self.pending) >= self.config.max_inflight:
+                    self.lock.wait()
+                data = self._register(due)
+            # Send outside the lock so the receiver never waits on a full socket
+            self.sock.sendall(data)
+            due += interval
+        receiver.join(max(self.stop_at - time.perf_counter(), 0) + 5)
+
+    def _receive(self):
+        while True:
+            try:
+                frame = self.reader.read_frame()
+            except OSError:
+                frame = None
+            if frame is None:
+                return
+            with self.lock:
+                self._complete(frame)
+                self.lock.notify()
+                if not self.pending and time.perf_counter() >= self.stop_at:
+                    return
+
+    def _register(self, due: float) -> bytes:
+        request_id, data = self._frame()
+        self.pending[request_id] = (due, len(data))
+        return data
+
+    def _send(self, due: float):
+        self.sock.sendall(self._register(due))
+
+    def close(self):
+        self.sock.close()
+
+
+def run_load(config: LoadConfig) -> LoadResult:
+    """Generate load from this process; one thread per connection"""
+    start = time.perf_counter()
+    results = [LoadResult() for _ in range(config.connections)]
+    errors = [0]
+
+    def worker(index: int):
+        try:
+            conn = _Connection(config, index, start, results[index])
+        except OSError:
+            errors[0] += 1
+            return
+        try:
+            if config.rate:
+                per_connection = config.rate / config.connections
+                conn.run_fixed_rate(per_connection, index / config.rate)
+            else:
+                conn.run_closed_loop()
+        except (OSError, ValueError):
+            results[index].errors += 1
+        finally:
+            conn.close()
+
+    threads = [threading.Thread(target=worker, args=(i,), daemon=True)
+               for i in range(config.connections)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    total = LoadResult()
+    for result in results:
+        total.merge(result)
+    total.errors += errors[0]
+    total.elapsed = config.duration
+    return total
+
+
+def run_processes(config: LoadConfig, processes: int) -> LoadResult:
+    """Split connections (and rate) over several processes and merge their results"""
+    if processes <= 1:
+        return run_load(config)
+    configs = []
+    for i in range(processes):
+        share = config.connections // processes + (1 if i < config.connections % processes else 0)
+        if share:
+            configs.append(LoadConfig(
+                config.host, config.port, share, config.duration, config.warmup,
+                config.rate * share / config.connections, config.pipeline,
+                config.max_inflight, config.messages))
+    with multiprocessing.get_context('spawn').Pool(len(configs)) as pool:
+        results = pool.map(run_load, configs)
+    total = LoadResult()
+    for result in results:
+        total.merge(result)
+    return total
+
+
+def start_server(path: str, host: str, port: int, timeout: float = 15.0) -> subprocess.Popen:
+    """Run a Minipar server program and wait until it accepts connections"""
+    runner = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'runner.py')
+    process = subprocess.Popen([sys.executable, runner, path],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    transport, target = parse_address(host, port)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            connect(transport, target).close()
+            return process
+        except OSError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError(f"Server program {path} did not start listening on "
+                                   f"{describe(transport, target)}")
+            time.sleep(0.1)
+
+
+def format_report(config: LoadConfig, result: LoadResult) -> str:
+    summary = result.summary()
+    mode = f"fixed rate {config.rate:g} req/s" if config.rate else f"closed loop, pipeline {config.pipeline}"
+    lines = [
+        f"Target:      {describe(*parse_address(config.host, config.port))}",
+        f"Mode:        {mode}, {config.connections} connections, {config.duration:g}s "
+        f"(+{config.warmup:g}s warm-up)",
+        f"Requests:    {summary['requests']} ({summary['errors']} errors)",
+        f"Throughput:  {summary['throughput']:.1f} req/s",
+        "Latency (ms):",
+    ]
+    for name, value in summary['latency_ms'].items():
+        lines.append(f"  {name:<6} {value:>10.3f}")
+    return '\n'.join(lines)
+
+
+def main(argv: Optional[List[str]] = None):
+    """Command-line interface for the load generator"""
+    parser = argparse.ArgumentParser(description="Generate load against a Minipar server channel")
+    parser.add_argument("target", help="Server address: host:port, unix:/path or shm:name")
+    parser.add_argument("-c", "--connections", type=int, default=8,
+                        help="Concurrent connections (default: 8)")
+    parser.add_argument("-d", "--duration", type=float, default=10.0,
+                        help="Seconds to measure (default: 10)")
+    parser.add_argument("--warmup", type=float, default=1.0,
+                        help="Seconds of unmeasured load before measuring (default: 1)")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="Fixed total request rate per second (default: closed loop)")
+    parser.add_argument("--pipeline", type=int, default=1,
+                        help="Closed loop: requests in flight per connection (default: 1)")
+    parser.add_argument("-m", "--message", action="append",
+                        help="Request payload, repeatable; {i} is replaced by the request "
+                             "number and {c} by the connection number (default: '+,{i},1')")
+    parser.add_argument("-p", "--processes", type=int, default=1,
+                        help="Generate load from several processes (default: 1)")
+    parser.add_argument("--serve", metavar="FILE",
+                        help="Start this Minipar server program first and stop it afterwards")
+    parser.add_argument("--json", action="store_true", help="Print the result as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        host, port = parse_endpoint(args.target)
+    except ValueError as e:
+        parser.error(str(e))
+    if args.connections < 1 or args.duration <= 0 or args.pipeline < 1 or args.rate < 0:
+        parser.error("connections and pipeline must be at least 1, duration positive, rate non-negative")
+
+    config = LoadConfig(host, port, args.connections, args.duration, args.warmup,
+                        args.rate, args.pipeline, messages=args.message or ["+,{i},1"])
+
+    server = start_server(args.serve, host, port) if args.serve else None
+    try:
+        result = run_processes(config, args.processes)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if args.json:
+        print(json.dumps(result.summary(), indent=2))
+    else:
+        print(format_report(config, result))
+    return 0 if result.requests else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,7 +3,8 @@ Parser for Minipar Language
 Performs syntax analysis and builds an Abstract Syntax Tree (AST)
 """
 
-from typing import List, Optional
+from collections import deque
+from typing import Deque, Iterable, Iterator, List, Optional
 try:
     from src.lexer import Token, TokenType, Lexer
     from src.ast_nodes import *
@@ -13,21 +14,34 @@ except ImportError:
 
 
 class Parser:
-    def __init__(self, tokens: List[Token]):
-        self.tokens = tokens
-        self.pos = 0
-    
+    def __init__(self, tokens: Iterable[Token]):
+        # Any iterable works, e.g. Lexer.iter_tokens(): tokens are pulled into
+        # a lookahead buffer only as far as peek() looks, so lexing and
+        # parsing interleave and consumed tokens are not kept
+        self.tokens: Iterator[Token] = iter(tokens)
+        self.lookahead: Deque[Token] = deque()
+        self.pos = 0  # Tokens consumed so far
+    
+    def fill(self, count: int) -> bool:
+        """Buffer count tokens ahead; False when the tokens run out first"""
+        while len(self.lookahead) < count:
+            token = next(self.tokens, None)
+            if token is None:
+                return False
+            self.lookahead.append(token)
+        return True
     
     def current(self) -> Token:
-        return self.tokens[self.pos] if self.pos < len(self.tokens) else self.tokens[-1]
+        return self.peek()
     
     def peek(self, offset: int = 0) -> Token:
-        pos = self.pos + offset
-        return self.tokens[pos] if pos < len(self.tokens) else self.tokens[-1]
+        # Past the end, every look sees the last token (EOF)
+        return self.lookahead[offset] if self.fill(offset + 1) else self.lookahead[-1]
     
     def advance(self) -> Token:
         token = self.current()
-        if self.pos < len(self.tokens) - 1:
+        if self.fill(2):
+            self.lookahead.popleft()
             self.pos += 1
         return token
     
@@ -169,6 +183,9 @@ class Parser:
         elif self.match(TokenType.DICT):
             self.advance()
             return 'dict'
+        elif self.match(TokenType.CHAN):
+            self.advance()
+            return 'chan'
         elif self.match(TokenType.ANY):
             self.advance()
             return 'any'
@@ -208,6 +225,8 @@ class Parser:
             return self.var_declaration()
         elif self.match(TokenType.FUNC):
             return self.func_declaration()
+        elif self.match(TokenType.S_CHANNEL, TokenType.C_CHANNEL):
+            return self.channel_declaration()
         else:
             return self.expression_statement()
     
@@ -237,6 +256,37 @@ class Parser:
 
     def for_statement(self) -> ForStmt:
         """Parse for loop: for (var x: type in iterable) { body }"""
+        variable, iterable = self.for_header()
+        
+        # Parse loop body
+        body = self.statement()
+        
+        return ForStmt(variable, iterable, body)
+    
+    def par_for_statement(self) -> ParForStmt:
+        """Parse par for loop: par for (var x: type in iterable) reduce(op: name, ...) { body }"""
+        variable, iterable = self.for_header()
+        
+        # Optional reductions; 'reduce' is only special here, so it stays a valid name
+        reductions = []
+        if self.match(TokenType.IDENTIFIER) and self.current().value == 'reduce':
+            self.advance()
+            self.consume(TokenType.LPAREN, "Expected '(' after 'reduce'")
+            while True:
+                operator = self.consume(TokenType.IDENTIFIER, "Expected reduction operator").value
+                self.consume(TokenType.COLON, "Expected ':' after reduction operator")
+                name = self.consume(TokenType.IDENTIFIER, "Expected reduction variable").value
+                reductions.append((operator, name))
+                if not self.match(TokenType.COMMA):
+                    break
+                self.advance()
+            self.consume(TokenType.RPAREN, "Expected ')' after reductions")
+        
+        body = self.statement()
+        return ParForStmt(variable, iterable, body, reductions)
+    
+    def for_header(self):
+        """Parse for (var x: type in iterable) and return the variable and iterable"""
         self.consume(TokenType.FOR)
         self.consume(TokenType.LPAREN)
         
@@ -257,10 +307,7 @@ class Parser:
         
         self.consume(TokenType.RPAREN, "Expected ')' after for header")
         
-        # Parse loop body
-        body = self.statement()
-        
-        return ForStmt(variable, iterable, body)
+        return variable, iterable
 
     def return_statement(self) -> ReturnStmt:
         self.consume(TokenType.RETURN)
@@ -302,8 +349,10 @@ class Parser:
         return SeqBlock(statements)
     
     def par_block(self) -> 'ParBlock':
-        """Parse PAR { stmts } - parallel execution block"""
+        """Parse PAR { stmts } - parallel execution block (or a par for loop)"""
         self.consume(TokenType.PAR)
+        if self.match(TokenType.FOR):
+            return self.par_for_statement()
         self.consume(TokenType.LBRACE)
         
         statements = []
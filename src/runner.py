@@ -3,22 +3,82 @@ Minipar Runtime Executor
 Executes Minipar programs with support for channels, parallel execution, and more
 """
 
+import copy
+import logging
+import os
+import pickle
+import signal
 import socket
+import sys
 import threading
 import time
-from typing import Any, Dict, List, Optional
+from collections.abc import Iterator
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional
 from abc import ABC, abstractmethod
 
 try:
     from src.ast_nodes import *
     from src.lexer import Lexer
     from src.parser import Parser
-    from src.semantic import SemanticAnalyzer
+    from src.semantic import SemanticAnalyzer, PurityChecker
+    from src.channels import (ServerConfig, ServerMetrics, ResponseCache, WorkerPool, SelectorServer,
+                              ClientConfig, ClientConnection, BalancedClient, ChannelFuture,
+                              FrameReader, PreforkSupervisor, encode_frame, encode_reply,
+                              encode_item, encode_error, wants_stream, stamp_deadline,
+                              deadline_passed, client_pool)
+    from src.runtime_log import (channel_logger, configure as configure_logging,
+                                 current_levels, parse_channel_levels)
+    from src.transports import (REUSE_PORT, parse_address, parse_endpoint, describe,
+                                create_listener, close_listener, tune_socket)
+    from src.telemetry import ChannelStats, telemetry
+    from src.csp import LocalChannel, ChannelClosedError
+    from src.scheduler import WorkStealingScheduler
+    from src.distributed import DistributedScheduler, serve_par_worker
+    from src.green import GreenScheduler, Sleep, WaitChannel, Blocking, Join
 except ImportError:
     from ast_nodes import *
     from lexer import Lexer
     from parser import Parser
-    from semantic import SemanticAnalyzer
+    from semantic import SemanticAnalyzer, PurityChecker
+    from channels import (ServerConfig, ServerMetrics, ResponseCache, WorkerPool, SelectorServer,
+                          ClientConfig, ClientConnection, BalancedClient, ChannelFuture,
+                          FrameReader, PreforkSupervisor, encode_frame, encode_reply,
+                          encode_item, encode_error, wants_stream, stamp_deadline,
+                          deadline_passed, client_pool)
+    from runtime_log import (channel_logger, configure as configure_logging,
+                             current_levels, parse_channel_levels)
+    from transports import (REUSE_PORT, parse_address, parse_endpoint, describe,
+                            create_listener, close_listener, tune_socket)
+    from telemetry import ChannelStats, telemetry
+    from csp import LocalChannel, ChannelClosedError
+    from scheduler import WorkStealingScheduler
+    from distributed import DistributedScheduler, serve_par_worker
+    from green import GreenScheduler, Sleep, WaitChannel, Blocking, Join
+
+
+# Builtins a par for body may not call from a forked worker process: they
+# talk to state (channels, handler streams, stdin) that only the parent owns
+PROCESS_UNSAFE_BUILTINS = frozenset({'input', 'await', 'wait_all', 'stats', 'emit', 'channel'})
+
+# Builtins that can wait on another branch or the outside world: a PAR block
+# calling them gets a thread per branch rather than scheduler tasks
+BLOCKING_BUILTINS = frozenset({'input', 'await', 'wait_all', 'emit', 'sleep'})
+
+# Channel methods a green task may have to wait in (or wake others with)
+GREEN_CHANNEL_METHODS = frozenset({'put', 'get', 'close'})
+
+# Network channel methods and builtins that wait for a reply: a green task
+# runs them on a helper thread and lets the others run meanwhile
+GREEN_BLOCKING_METHODS = frozenset({'send', 'call'})
+GREEN_BLOCKING_BUILTINS = frozenset({'await', 'wait_all'})
+
+
+# Held while print() writes a line, so lines of concurrent branches never mix
+PRINT_LOCK = threading.Lock()
+
+# Seconds a server channel declaration waits for its listener to be bound
+SERVER_START_TIMEOUT = 10.0
 
 
 class BreakException(Exception):
@@ -38,6 +98,12 @@ class ReturnException(Exception):
         super().__init__()
 
 
+@dataclass
+class _Evaluated(ASTNode):
+    """Operand a green task has already evaluated"""
+    value: Any
+
+
 class VariableTable:
     """Variable scope management"""
     def __init__(self, parent=None):
@@ -75,11 +141,28 @@ class MiniparRunner:
     """Main runtime executor for Minipar programs"""
     
     def __init__(self):
+        # Shared by every execution context: a single read or write of a
+        # global is one dict operation, atomic under the interpreter lock
         self.global_scope = VariableTable()
         self.current_scope = self.global_scope
         self.functions: Dict[str, FuncDecl] = {}
-        self.channels: Dict[str, socket.socket] = {}
+        self.channels: Dict[str, ClientConnection] = {}
         self.servers: Dict[str, threading.Thread] = {}
+        self.supervisors: Dict[str, PreforkSupervisor] = {}
+        self.server_metrics: Dict[str, ServerMetrics] = {}
+        self.channel_logs: Dict[str, logging.Logger] = {}
+        # Where emit() sends items, per handler thread (shared by forked contexts)
+        self.handler_state = threading.local()
+        # Chunks a par for splits its iterations into, run at the same time
+        self.par_workers = os.cpu_count() or 1
+        # Runs PAR branches that never block (threads start on first use)
+        self.scheduler = WorkStealingScheduler(self.par_workers)
+        # Worker daemons PAR branches are shipped to (None: run them here)
+        self.cluster: Optional[DistributedScheduler] = None
+        # Runs PAR branches as green tasks on one thread instead (None: off)
+        self.green: Optional[GreenScheduler] = None
+        # id(node) -> (node, whether running it can switch green tasks)
+        self.green_points: Dict[int, tuple] = {}
         
         # Built-in functions
         self.builtins = {
@@ -89,6 +172,13 @@ class MiniparRunner:
             'to_number': lambda x: int(x) if isinstance(x, str) else x,
             'to_bool': bool,
             'len': len,
+            'await': self._builtin_await,
+            'wait_all': self._builtin_wait_all,
+            'stats': self._builtin_stats,
+            'emit': self._builtin_emit,
+            'channel': self._builtin_channel,
+            'range': self._builtin_range,
+            'sleep': self._builtin_sleep,
         }
     
     def run_file(self, filename: str):
@@ -100,15 +190,15 @@ class MiniparRunner:
     def run_source(self, source: str):
         """Run Minipar source code"""
         # Compile
-        lexer = Lexer(source)
-        tokens = lexer.tokenize()
-        
-        parser = Parser(tokens)
+        # The parser pulls tokens as it goes, so the token list is never built
+        parser = Parser(Lexer(source).iter_tokens())
         ast = parser.parse()
         
         semantic = SemanticAnalyzer()
         if not semantic.analyze(ast):
             raise Exception("Semantic errors found")
+        for warning in semantic.warnings:
+            print(warning, file=sys.stderr)
         
         # Execute
         return self.execute(ast)
@@ -123,6 +213,17 @@ class MiniparRunner:
         else:
             raise NotImplementedError(f"Execution for {type(node).__name__} not implemented")
     
+    def fork_context(self, scope: Optional[VariableTable] = None) -> 'MiniparRunner':
+        """
+        Create an execution context for another thread: it shares functions,
+        globals, channels and servers with this runner but has its own scope
+        stack, so concurrent code never moves this runner's current_scope.
+        The new stack starts below scope (the global scope by default).
+        """
+        context = copy.copy(self)
+        context.current_scope = VariableTable(parent=scope or self.global_scope)
+        return context
+    
     def enter_scope(self):
         """Enter a new scope"""
         self.current_scope = VariableTable(parent=self.current_scope)
@@ -134,14 +235,59 @@ class MiniparRunner:
     
     # Built-in functions
     def _builtin_print(self, *args):
-        """Built-in print function"""
-        print(*args)
+        """Built-in print function: the whole line is written at once"""
+        line = ' '.join(str(arg) for arg in args) + '\n'
+        with PRINT_LOCK:
+            sys.stdout.write(line)
         return None
     
     def _builtin_input(self, prompt=""):
         """Built-in input function"""
         return input(prompt)
     
+    def _builtin_await(self, handle):
+        """Built-in await: wait for the reply of a channel send_async()"""
+        if not isinstance(handle, ChannelFuture):
+            raise TypeError(f"await() expects a send_async() handle, got {type(handle).__name__}")
+        return self._decode_response(handle.result())
+    
+    def _builtin_wait_all(self, handles):
+        """Built-in wait_all: wait for a list of send_async() handles, in order"""
+        if not isinstance(handles, list):
+            raise TypeError(f"wait_all() expects a list of handles, got {type(handles).__name__}")
+        return [self._builtin_await(handle) for handle in handles]
+    
+    def _builtin_stats(self):
+        """Built-in stats: telemetry of every channel in this process, keyed by name"""
+        return telemetry.snapshot()
+    
+    def _builtin_emit(self, value):
+        """Built-in emit: send one item of a server channel handler's response"""
+        sink = getattr(self.handler_state, 'emit', None)
+        if sink is None:
+            raise RuntimeError("emit() can only be called by a server channel handler")
+        sink(value)
+        return None
+    
+    def _builtin_channel(self, capacity):
+        """Built-in channel: bounded queue between the branches of a PAR block"""
+        if not isinstance(capacity, (int, float)) or isinstance(capacity, bool):
+            raise TypeError(f"channel() expects a capacity number, got {type(capacity).__name__}")
+        return LocalChannel(int(capacity))
+    
+    def _builtin_range(self, start, end):
+        """Built-in range: the numbers start, start + 1, ..., end - 1"""
+        return range(int(start), int(end))
+    
+    def _builtin_sleep(self, seconds):
+        """Built-in sleep: pause for a number of seconds (green tasks yield instead)"""
+        if isinstance(seconds, bool) or not isinstance(seconds, (int, float)):
+            raise TypeError(f"sleep() expects a number of seconds, got {type(seconds).__name__}")
+        if seconds < 0:
+            raise ValueError(f"sleep() needs a non-negative number of seconds, got {seconds}")
+        time.sleep(seconds)
+        return None
+    
     # Execution methods for each AST node type
     
     def exec_Program(self, node: Program) -> Any:
@@ -207,8 +353,8 @@ class MiniparRunner:
         """Execute for loop"""
         iterable = self.execute(node.iterable)
         
-        # Check if iterable is valid
-        if not isinstance(iterable, (list, str)):
+        # Check if iterable is valid (iterators come from channel streams)
+        if not isinstance(iterable, (list, str, range, Iterator, LocalChannel)):
             raise TypeError(f"Cannot iterate over {type(iterable).__name__}")
         
         # Enter new scope for loop variable
@@ -227,6 +373,9 @@ class MiniparRunner:
                     continue
         finally:
             self.exit_scope()
+            if isinstance(iterable, Iterator) and hasattr(iterable, 'close'):
+                # Leaving the loop early discards the rest of a stream
+                iterable.close()
         
         return None
 
@@ -404,10 +553,16 @@ class MiniparRunner:
         return result
 
     def exec_IndexAccess(self, node: 'IndexAccess') -> Any:
-        """Execute index access (array/string indexing)"""
+        """Execute index access (array/string indexing, dict lookup by key)"""
         obj = self.execute(node.object)
         index = self.execute(node.index)
 
+        # Handle dict lookup
+        if isinstance(obj, dict):
+            if index not in obj:
+                raise KeyError(f"Key not found: {index!r}")
+            return obj[index]
+
         # Convert index to integer
         try:
             index = int(index)
@@ -459,13 +614,546 @@ class MiniparRunner:
         raise TypeError(f"Cannot slice object of type {type(obj).__name__}")
 
     def exec_ParBlock(self, node: ParBlock) -> Any:
-        """Execute parallel block using threads"""
-        # For now, execute statements sequentially
-        # True parallelism would require thread-safe variable tables
+        """
+        Execute parallel block: the statements run at the same time and the
+        block ends when all of them have. Branches see the enclosing
+        variables (and talk through channel() queues); the first error
+        raised by a branch is re-raised here.
+        
+        Branches are tasks of the work-stealing scheduler, so nested and
+        recursive PAR blocks share a fixed set of worker threads. A block
+        whose branches may block (channels, input, await) gets a thread per
+        branch instead: a task waiting on a sibling that sits queued behind
+        it on the same worker would wait forever.
+        
+        With worker daemons registered (self.cluster), every branch that
+        needs nothing of this process (channels, stdin) and races with no
+        other branch is shipped to one of them; the others still run here.
+        With a green scheduler (self.green), the branches are green tasks on
+        this thread.
+        """
+        if len(node.statements) < 2:
+            for stmt in node.statements:
+                self.execute(stmt)
+            return None
+        
+        if self.green is not None:
+            # Reached outside a green task, or from code a task runs without switching
+            loop = self.green if not self.green.running else GreenScheduler()
+            contexts = [self.fork_context(self.current_scope) for _ in node.statements]
+            for context in contexts:
+                context.green = loop
+            try:
+                loop.run_all([context._green(stmt) for context, stmt in zip(contexts, node.statements)])
+            finally:
+                if loop is not self.green:
+                    loop.shutdown()
+            return None
+        
+        jobs = [(lambda context=self.fork_context(self.current_scope), stmt=stmt: context.execute(stmt))
+                for stmt in node.statements]
+        if self.cluster is not None:
+            racing = {branch for branches in node.races.values() for branch in branches}
+            # Shipped branches work on copies: a race would silently lose writes
+            remote = [i not in racing and not self._finds(stmt, self._process_bound)
+                      for i, stmt in enumerate(node.statements)]
+            if any(remote):
+                # Waiting for a worker's reply holds a thread, not a scheduler task
+                self._run_parallel([
+                    (lambda context=self.fork_context(self.current_scope), stmt=stmt:
+                        context._run_remote(stmt)) if ship else job
+                    for stmt, job, ship in zip(node.statements, jobs, remote)
+                ])
+                return None
+        if node.communicates or self._finds(node.statements, self._may_block):
+            self._run_parallel(jobs)
+        else:
+            self.scheduler.run_all(jobs)
+        return None
+    
+    # Green tasks: green_<Node> methods mirror exec_<Node> as generators that
+    # yield an instruction to the GreenScheduler wherever the task may switch
+    
+    def _green(self, node: ASTNode):
+        """Run node in a green task; code that cannot switch runs through execute()"""
+        if not self._green_switches(node):
+            return self.execute(node)
+        method = getattr(self, f'green_{type(node).__name__}', None)
+        if method is None:
+            return (yield from self._green_operands(node))
+        return (yield from method(node))
+    
+    def _green_switches(self, node: ASTNode) -> bool:
+        entry = self.green_points.get(id(node))
+        if entry is None or entry[0] is not node:
+            entry = self.green_points[id(node)] = (
+                node, self._reaches(node, self._green_switch_point, set()))
+        return entry[1]
+    
+    def _green_switch_point(self, node: ASTNode) -> bool:
+        if isinstance(node, (WhileStmt, ForStmt, ParBlock)):
+            return True
+        if isinstance(node, FuncCall):
+            return node.name == 'sleep' or node.name in GREEN_BLOCKING_BUILTINS
+        return isinstance(node, MethodCall) and (node.method in GREEN_CHANNEL_METHODS
+                                                 or node.method in GREEN_BLOCKING_METHODS)
+    
+    def _green_operands(self, node: ASTNode):
+        """Evaluate the operands of node in order, then node itself on their values"""
+        if isinstance(node, (ListComprehension, ParForStmt, ChannelDecl)):
+            return self.execute(node)  # Runs without switching
+        evaluated = copy.copy(node)
+        for field, value in vars(node).items():
+            if isinstance(value, ASTNode):
+                value = _Evaluated((yield from self._green(value)))
+            elif isinstance(value, list):
+                items = []
+                for item in value:
+                    if isinstance(item, ASTNode):
+                        item = _Evaluated((yield from self._green(item)))
+                    elif isinstance(item, tuple):
+                        parts = []
+                        for part in item:
+                            parts.append(_Evaluated((yield from self._green(part))))
+                        item = tuple(parts)
+                    items.append(item)
+                value = items
+            setattr(evaluated, field, value)
+        return self.execute(evaluated)
+    
+    def exec__Evaluated(self, node: _Evaluated) -> Any:
+        return node.value
+    
+    def _green_get(self, channel: LocalChannel):
+        """Take a value from channel, parking the task while it is empty"""
+        while True:
+            ok, value = channel.try_get()
+            if ok:
+                self.green.notify(channel)
+                return value
+            yield WaitChannel(channel)
+    
+    def green_Block(self, node: Block):
+        self.enter_scope()
+        try:
+            result = None
+            for stmt in node.statements:
+                result = yield from self._green(stmt)
+            return result
+        finally:
+            self.exit_scope()
+    
+    def green_SeqBlock(self, node: SeqBlock):
         for stmt in node.statements:
-            self.execute(stmt)
+            yield from self._green(stmt)
+        return None
+    
+    def green_VarDecl(self, node: VarDecl):
+        value = yield from self._green(node.initializer)
+        self.current_scope.define(node.name, value)
+        return value
+    
+    def green_Assignment(self, node: Assignment):
+        value = yield from self._green(node.value)
+        self.current_scope.set(node.name, value)
+        return value
+    
+    def green_ExprStmt(self, node: ExprStmt):
+        return (yield from self._green(node.expression))
+    
+    def green_ReturnStmt(self, node: ReturnStmt):
+        value = yield from self._green(node.value)
+        raise ReturnException(value)
+    
+    def green_IfStmt(self, node: IfStmt):
+        if (yield from self._green(node.condition)):
+            yield from self._green(node.then_branch)
+        elif node.else_branch:
+            yield from self._green(node.else_branch)
+        return None
+    
+    def green_WhileStmt(self, node: WhileStmt):
+        while (yield from self._green(node.condition)):
+            try:
+                yield from self._green(node.body)
+            except BreakException:
+                break
+            except ContinueException:
+                pass
+            # Back-edge: let the other ready tasks run
+            if self.green.should_yield():
+                yield None
+        return None
+    
+    def green_ForStmt(self, node: 'ForStmt'):
+        iterable = yield from self._green(node.iterable)
+        if not isinstance(iterable, (list, str, range, Iterator, LocalChannel)):
+            raise TypeError(f"Cannot iterate over {type(iterable).__name__}")
+        items = None if isinstance(iterable, LocalChannel) else iter(iterable)
+        
+        self.enter_scope()
+        try:
+            while True:
+                try:
+                    if items is None:
+                        item = yield from self._green_get(iterable)
+                    else:
+                        item = next(items)
+                except (ChannelClosedError, StopIteration):
+                    break
+                self.current_scope.set(node.variable.name, item)
+                try:
+                    yield from self._green(node.body)
+                except BreakException:
+                    break
+                except ContinueException:
+                    pass
+                if self.green.should_yield():
+                    yield None
+        finally:
+            self.exit_scope()
+            if isinstance(iterable, Iterator) and hasattr(iterable, 'close'):
+                iterable.close()
+        return None
+    
+    def green_FuncCall(self, node: FuncCall):
+        if node.name in self.builtins:
+            args = []
+            for arg in node.arguments:
+                args.append((yield from self._green(arg)))
+            if node.name == 'sleep':
+                yield Sleep(*args)
+                return None
+            builtin = self.builtins[node.name]
+            if node.name in GREEN_BLOCKING_BUILTINS:
+                return (yield Blocking(lambda: builtin(*args)))
+            return builtin(*args)
+        
+        func = self.functions.get(node.name)
+        if func is None:
+            raise NameError(f"Function '{node.name}' not defined")
+        self.enter_scope()
+        try:
+            for param, arg in zip(func.parameters, node.arguments):
+                arg_value = yield from self._green(arg)
+                self.current_scope.define(param.name, arg_value)
+            return (yield from self._green(func.body))
+        except ReturnException as ret:
+            return ret.value
+        finally:
+            self.exit_scope()
+    
+    def green_MethodCall(self, node: MethodCall):
+        if node.object in self.channels and node.method in GREEN_BLOCKING_METHODS:
+            evaluated = copy.copy(node)
+            evaluated.arguments = []
+            for arg in node.arguments:
+                evaluated.arguments.append(_Evaluated((yield from self._green(arg))))
+            # Only the request runs on the helper thread, on values already computed
+            return (yield Blocking(lambda: self.exec_MethodCall(evaluated)))
+        obj = None if node.object in self.channels else self.current_scope.get(node.object)
+        if isinstance(obj, LocalChannel):
+            if node.method == 'put' and len(node.arguments) == 1:
+                value = yield from self._green(node.arguments[0])
+                while not obj.try_put(value):
+                    yield WaitChannel(obj)
+                self.green.notify(obj)
+                return None
+            if node.method == 'get' and not node.arguments:
+                return (yield from self._green_get(obj))
+            if node.method == 'close':
+                obj.close()
+                self.green.notify(obj)
+                return None
+        return (yield from self._green_operands(node))
+    
+    def green_ParBlock(self, node: ParBlock):
+        tasks = [self.green.spawn(self.fork_context(self.current_scope)._green(stmt))
+                 for stmt in node.statements]
+        yield Join(tasks)
+        for task in tasks:
+            if task.error is not None:
+                raise task.error
+        return None
+    
+    def _run_remote(self, stmt: ASTNode):
+        """Run one PAR branch on a worker daemon, or here if none can take it"""
+        functions: Dict[str, FuncDecl] = {}
+        names: set = set()
+        self._free_names(stmt, names, functions)
+        values = {}
+        for name in names:
+            try:
+                values[name] = self.current_scope.get(name)
+            except NameError:
+                pass  # Declared inside the branch
+        try:
+            result = self.cluster.run(functions, stmt, values)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            result = None  # A value that cannot be copied to another process
+        if result is None:
+            return self.execute(stmt)
+        
+        changes, output, error = result
+        if output:
+            sys.stdout.write(output)
+        if error is not None:
+            raise error
+        for name, value in changes.items():
+            current = values[name]
+            # Update lists and dicts in place, so other references see the result
+            if isinstance(current, list) and isinstance(value, list):
+                current[:] = value
+            elif isinstance(current, dict) and isinstance(value, dict):
+                current.clear()
+                current.update(value)
+            else:
+                self.current_scope.set(name, value)
+        return None
+    
+    def _free_names(self, node: Any, names: set, functions: Dict[str, FuncDecl]):
+        """Collect the variable names node (and every function it calls) uses, and those functions"""
+        if isinstance(node, list):
+            for item in node:
+                self._free_names(item, names, functions)
+            return
+        if not isinstance(node, ASTNode):
+            return
+        if isinstance(node, (Variable, Assignment)):
+            names.add(node.name)
+        elif isinstance(node, MethodCall):
+            names.add(node.object)
+        elif isinstance(node, FuncCall):
+            func = self.functions.get(node.name)
+            if func is not None and node.name not in functions:
+                functions[node.name] = func
+                self._free_names(func.body, names, functions)
+        for value in vars(node).values():
+            self._free_names(value, names, functions)
+    
+    def _run_parallel(self, jobs: List[Callable[[], Any]]) -> List[Any]:
+        """Run every job on a thread of its own; returns their results in order or raises the first error"""
+        results: List[Any] = [None] * len(jobs)
+        errors: List[BaseException] = []
+        
+        def run(index: int):
+            try:
+                results[index] = jobs[index]()
+            except BaseException as e:
+                errors.append(e)
+        
+        threads = [threading.Thread(target=run, args=(i,), name="minipar-par", daemon=True)
+                   for i in range(len(jobs))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if errors:
+            raise errors[0]
+        return results
+    
+    def exec_ParForStmt(self, node: 'ParForStmt') -> Any:
+        """
+        Execute parallel for: the elements are split into one contiguous chunk
+        per worker and the chunks run at the same time. Each chunk reduces into
+        its own copy of every reduction variable (starting from 0 for sum, 1
+        for product and the current value for min and max); the copies are
+        combined, in chunk order, once every chunk has finished.
+        """
+        iterable = self.execute(node.iterable)
+        if not isinstance(iterable, (list, str, range)):
+            raise TypeError(f"par for needs a list, string or range, got {type(iterable).__name__}")
+        items = list(iterable)
+        if not items:
+            return None  # Reductions keep their values
+        initial = {name: self.current_scope.get(name) for _, name in node.reductions}
+        
+        workers = max(1, min(self.par_workers, len(items)))
+        size = -(-len(items) // workers)
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        
+        if len(chunks) < 2:
+            partials = [self._run_par_for_chunk(node, chunk, initial) for chunk in chunks]
+        elif self._par_for_can_fork(node):
+            partials = self._fork_par_for_chunks(node, chunks, initial)
+        else:
+            partials = self._run_parallel([
+                (lambda chunk=chunk: self._run_par_for_chunk(node, chunk, initial)) for chunk in chunks
+            ])
+        
+        for i, (operator, name) in enumerate(node.reductions):
+            values = [partial[i] for partial in partials]
+            if operator == 'sum':
+                value = initial[name]
+                for v in values:
+                    value = value + v
+            elif operator == 'product':
+                value = initial[name]
+                for v in values:
+                    value = value * v
+            elif operator == 'min':
+                value = min([initial[name]] + values)
+            else:
+                value = max([initial[name]] + values)
+            self.current_scope.set(name, value)
         return None
     
+    def _run_par_for_chunk(self, node: 'ParForStmt', chunk: list, initial: Dict[str, Any]) -> List[Any]:
+        """Run the iterations of one chunk; returns its value of every reduction variable"""
+        context = self.fork_context(self.current_scope)
+        for operator, name in node.reductions:
+            start = {'sum': 0, 'product': 1}.get(operator, initial[name])
+            context.current_scope.define(name, start)
+        for item in chunk:
+            context.enter_scope()
+            try:
+                context.current_scope.define(node.variable.name, item)
+                context.execute(node.body)
+            except ContinueException:
+                pass
+            finally:
+                context.exit_scope()
+        return [context.current_scope.get(name) for _, name in node.reductions]
+    
+    def _par_for_can_fork(self, node: 'ParForStmt') -> bool:
+        """
+        Whether the chunks can run in forked processes, which use every core
+        where threads share one interpreter lock. The semantic analyzer
+        already keeps the body from writing shared variables; forking also
+        needs a process with no other threads (their locks would be copied
+        mid-use) and a body that never touches channels or stdin.
+        """
+        # Parked scheduler workers hold no locks, any other thread might
+        if not hasattr(os, 'fork') or threading.active_count() - self.scheduler.idle_threads() > 1:
+            return False
+        return self._process_safe(node.body, set())
+    
+    def _process_safe(self, node: Any, visited: set) -> bool:
+        """Whether node, and every function it calls, is safe to run in a forked process"""
+        return not self._finds(node, self._process_unsafe, visited)
+    
+    def _finds(self, node: Any, flagged: Callable[[ASTNode, Callable[[str], bool]], bool],
+               visited: Optional[set] = None) -> bool:
+        """Like _reaches, for checks that also need _channel_names(node)"""
+        may_be_channel = self._channel_names(node)
+        return self._reaches(node, lambda n: flagged(n, may_be_channel),
+                             set() if visited is None else visited)
+    
+    def _channel_names(self, node: Any) -> Callable[[str], bool]:
+        """
+        Whether a name used in node (or a function it calls) may hold a
+        channel. Static types come first: a name declared there as chan or
+        any (a parameter a channel is passed to, say) may; a name declared
+        with another type only if it also names a channel here; a name that
+        is neither declared there nor defined here is assumed to.
+        """
+        declared: Dict[str, set] = {}
+        
+        def declare(n: ASTNode) -> bool:
+            if isinstance(n, VarDecl):
+                declared.setdefault(n.name, set()).add(n.type)
+            elif isinstance(n, (ForStmt, ParForStmt)):
+                declared.setdefault(n.variable.name, set()).add(n.variable.type)
+            return False
+        self._reaches(node, declare, set())
+        
+        def may_be_channel(name: str) -> bool:
+            types = declared.get(name)
+            if name in self.channels or (types and types & {'chan', 'any'}):
+                return True
+            try:
+                value = self.current_scope.get(name)
+            except NameError:
+                return not types
+            return isinstance(value, LocalChannel)
+        return may_be_channel
+    
+    def _reaches(self, node: Any, flagged: Callable[[ASTNode], bool], visited: set) -> bool:
+        """Whether node, or any function it calls, contains a node flagged() accepts"""
+        if isinstance(node, list):
+            return any(self._reaches(item, flagged, visited) for item in node)
+        if not isinstance(node, ASTNode):
+            return False
+        if flagged(node):
+            return True
+        if isinstance(node, FuncCall):
+            func = self.functions.get(node.name)
+            if func is not None and node.name not in visited:
+                visited.add(node.name)
+                if self._reaches([func.parameters, func.body], flagged, visited):
+                    return True
+        return any(self._reaches(value, flagged, visited) for value in vars(node).values())
+    
+    def _uses_channel(self, node: ASTNode, may_be_channel: Callable[[str], bool]) -> bool:
+        """Whether node is a method call on what may be a client or PAR channel"""
+        return isinstance(node, MethodCall) and may_be_channel(node.object)
+    
+    def _process_unsafe(self, node: ASTNode, may_be_channel: Callable[[str], bool]) -> bool:
+        return isinstance(node, ParBlock) or self._process_bound(node, may_be_channel)
+    
+    def _process_bound(self, node: ASTNode, may_be_channel: Callable[[str], bool]) -> bool:
+        """Whether node needs state only this process has (channels, handler streams, stdin)"""
+        if isinstance(node, ChannelDecl):
+            return True
+        if isinstance(node, FuncCall) and node.name in PROCESS_UNSAFE_BUILTINS:
+            return True
+        return self._uses_channel(node, may_be_channel)
+    
+    def _may_block(self, node: ASTNode, may_be_channel: Callable[[str], bool]) -> bool:
+        if isinstance(node, ChannelDecl):
+            return True
+        if isinstance(node, FuncCall) and node.name in BLOCKING_BUILTINS:
+            return True
+        return self._uses_channel(node, may_be_channel)
+    
+    def _fork_par_for_chunks(self, node: 'ParForStmt', chunks: List[list],
+                             initial: Dict[str, Any]) -> List[List[Any]]:
+        """Run every chunk in a forked child process and collect the pickled reductions"""
+        sys.stdout.flush()  # Or the children would print the parent's pending output again
+        children = []
+        for chunk in chunks:
+            read_fd, write_fd = os.pipe()
+            pid = os.fork()
+            if pid == 0:
+                os.close(read_fd)
+                try:
+                    # Nested par for loops run in this worker rather than forking
+                    # again; the parent's scheduler threads do not exist here
+                    self.par_workers = 1
+                    self.scheduler = WorkStealingScheduler(1)
+                    outcome = (True, self._run_par_for_chunk(node, chunk, initial))
+                except BaseException as e:
+                    outcome = (False, e)
+                try:
+                    try:
+                        payload = pickle.dumps(outcome)
+                    except Exception as e:
+                        payload = pickle.dumps((False, RuntimeError(f"par for worker result: {e}")))
+                    sys.stdout.flush()
+                    with os.fdopen(write_fd, 'wb') as f:
+                        f.write(payload)
+                finally:
+                    os._exit(0)
+            os.close(write_fd)
+            children.append((pid, read_fd))
+        
+        partials, errors = [], []
+        for pid, read_fd in children:
+            with os.fdopen(read_fd, 'rb') as f:
+                payload = f.read()
+            os.waitpid(pid, 0)
+            if not payload:
+                errors.append(RuntimeError("par for worker process exited without a result"))
+                continue
+            ok, value = pickle.loads(payload)
+            if ok:
+                partials.append(value)
+            else:
+                errors.append(value)
+        if errors:
+            raise errors[0]
+        return partials
+    
     def exec_SeqBlock(self, node: SeqBlock) -> Any:
         """Execute sequential block"""
         for stmt in node.statements:
@@ -483,157 +1171,447 @@ class MiniparRunner:
     
     def _create_server_channel(self, node: ChannelDecl) -> Any:
         """Create server channel (socket server)"""
-        # Parse arguments: {func_name, description, host, port}
+        # Parse arguments: {func_name, description, host, port[, options]}, where
+        # func_name may be a list of functions served over one listener
         args = node.arguments
         
         if len(args) < 4:
             raise ValueError("Server channel requires: function, description, host, port")
         
-        func_name = self.execute(args[0]) if not isinstance(args[0], Variable) else args[0].name
+        if isinstance(args[0], ListLiteral):
+            func_names = [self._function_name(arg) for arg in args[0].elements]
+            if not func_names:
+                raise ValueError(f"Server channel '{node.name}' needs at least one function")
+        else:
+            func_names = [self._function_name(args[0])]
         description = self.execute(args[1])
         host = self.execute(args[2])
         port = self.execute(args[3])
         
-        # Get the function
-        if func_name not in self.functions:
-            raise NameError(f"Function '{func_name}' not found for server channel")
+        # Optional tuning options: {"workers": 8, "backlog": 128, "queue_size": 64, "mode": "threads"}
+        options = self.execute(args[4]) if len(args) > 4 else None
+        if options is not None and not isinstance(options, dict):
+            raise TypeError("Server channel options must be a dictionary")
+        config = ServerConfig.from_options(options)
         
-        func = self.functions[func_name]
+        # "unix:/path" and "shm:name" hosts select a local transport (port is ignored)
+        transport, target = parse_address(host, port)
+        if transport == 'shm' and config.mode == 'selector':
+            raise ValueError("Selector mode needs a socket transport, not shm:")
+        
+        # Get the functions; requests without an "fn" header go to the first
+        for func_name in func_names:
+            if func_name not in self.functions:
+                raise NameError(f"Function '{func_name}' not found for server channel")
+        handlers = {func_name: self.functions[func_name] for func_name in func_names}
+        if config.cache:
+            # Replaying a response is only safe when running the handler has no effect
+            checker = PurityChecker(self.functions)
+            for func_name in func_names:
+                reason = checker.impurity(func_name)
+                if reason is not None:
+                    raise ValueError(f"Server channel option 'cache' needs a side-effect-free "
+                                     f"handler, but '{func_name}' {reason}")
+        metrics = ServerMetrics()
+        self.server_metrics[node.name] = metrics
+        
+        if config.processes > 1:
+            self._start_prefork(node.name, func_names, description, transport, target, config)
+            return None
+        
+        # The server thread binds and listens, then reports back (or the bind error)
+        ready = threading.Event()
+        failure = []
+        bound = [target]
         
-        # Start server in a separate thread
         def run_server():
-            server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            
             try:
-                server.bind((host, int(port)))
-                server.listen(5)
-                print(f"✓ Server '{node.name}' started on {host}:{port}")
-                print(f"  Description: {description}")
-                
-                while True:
-                    try:
-                        conn, addr = server.accept()
-                        print(f"  Client connected from {addr}")
-                        
-                        # Handle client in new thread
-                        client_thread = threading.Thread(
-                            target=self._handle_client,
-                            args=(conn, func, description)
-                        )
-                        client_thread.daemon = True
-                        client_thread.start()
-                        
-                    except KeyboardInterrupt:
-                        print(f"\n✓ Server '{node.name}' shutting down...")
-                        break
-                    except Exception as e:
-                        print(f"  Error accepting connection: {e}")
+                server = create_listener(transport, target, config.backlog)
+            except Exception as e:
+                failure.append(e)
+                ready.set()
+                return
+            if transport == 'tcp':
+                # Port 0 asks the OS for a free port
+                bound[0] = (target[0], server.getsockname()[1])
+            ready.set()
             
+            try:
+                self._serve_listener(node.name, server, handlers, description, config, metrics)
             finally:
-                server.close()
+                close_listener(server)
         
         # Start server thread
         server_thread = threading.Thread(target=run_server, daemon=True)
         server_thread.start()
-        self.servers[node.name] = server_thread
         
-        # Give server time to start
-        time.sleep(0.5)
+        if not ready.wait(SERVER_START_TIMEOUT):
+            raise TimeoutError(f"Server '{node.name}' did not start listening")
+        if failure:
+            error = failure[0]
+            raise OSError(getattr(error, 'errno', None),
+                          f"Server '{node.name}' cannot listen on {describe(transport, target)}: "
+                          f"{getattr(error, 'strerror', None) or error}")
+        
+        self.servers[node.name] = server_thread
+        print(f"✓ Server '{node.name}' started on {describe(transport, bound[0])}")
+        print(f"  Description: {description}")
         
         return None
     
-    def _handle_client(self, conn: socket.socket, func: FuncDecl, description: str):
+    def _start_prefork(self, name: str, func_names: List[str], description: str,
+                       transport: str, target: Any, config: ServerConfig):
+        """Serve a channel from several processes sharing one port"""
+        if transport != 'tcp' or not REUSE_PORT:
+            raise ValueError("Server channel option 'processes' needs a TCP host and SO_REUSEPORT")
+        
+        # Each process gets its own runner holding the program's functions
+        # and a snapshot of the global variables that can be copied over
+        global_values = {}
+        for var_name, value in self.global_scope.table.items():
+            try:
+                pickle.dumps(value)
+            except Exception:
+                continue
+            global_values[var_name] = value
+        
+        supervisor = PreforkSupervisor(
+            name, config.processes, _prefork_worker,
+            (name, func_names, self.functions, global_values, description,
+             target, config, current_levels(), os.getpid()),
+            log=channel_logger(name)
+        )
+        supervisor.start()
+        print(f"✓ Server '{name}' started on {describe(transport, target)} "
+              f"({config.processes} processes)")
+        print(f"  Description: {description}")
+        
+        supervisor_thread = threading.Thread(target=supervisor.supervise, daemon=True)
+        supervisor_thread.start()
+        self.servers[name] = supervisor_thread
+        self.supervisors[name] = supervisor
+    
+    def _serve_listener(self, name: str, server: Any, handlers: Dict[str, FuncDecl],
+                        description: str, config: ServerConfig, metrics: ServerMetrics):
+        """Serve connections from a bound listener until it is closed"""
+        stats = telemetry.channel(name, 'server')
+        if stats is not None:
+            stats.server_metrics = metrics
+        cache = None
+        if config.cache:
+            cache = ResponseCache(config.cache, config.cache_ttl)
+            metrics.bind_cache(cache)
+        
+        if config.mode == 'selector':
+            # One event loop multiplexes every connection
+            routes = {func_name: self._selector_route(func, cache)
+                      for func_name, func in handlers.items()}
+            handler, stream_handler = next(iter(routes.values()))
+            SelectorServer(
+                server, description, handler, metrics, config.workers, config.queue_size,
+                name, channel_logger(name), stats, config.max_pending, stream_handler,
+                routes, config.multiplex
+            ).serve_forever()
+        else:
+            self._serve_threads(name, server, handlers, description, config, metrics,
+                                stats, cache)
+    
+    def _selector_route(self, func: FuncDecl, cache: Optional[ResponseCache]) -> tuple:
+        """Handler and stream handler running func for a SelectorServer"""
+        return (lambda payload: self.fork_context()._call_handler(func, payload, cache),
+                lambda payload, emit: self.fork_context()._stream_handler(func, payload, emit))
+    
+    def _serve_threads(self, name: str, server: Any, handlers: Dict[str, FuncDecl],
+                       description: str,
+                       config: ServerConfig, metrics: ServerMetrics,
+                       stats: Optional[ChannelStats] = None,
+                       cache: Optional[ResponseCache] = None):
+        """Accept loop feeding connections to a fixed pool of worker threads"""
+        log = channel_logger(name)
+        pool = WorkerPool(name, config.workers, config.queue_size,
+                          self._handle_client, metrics)
+        try:
+            while True:
+                try:
+                    conn, addr = server.accept()
+                    metrics.incr('accepted')
+                    
+                    # Hand the client to the pool, shedding it if the queue is full
+                    if not pool.submit(conn, handlers, description, log, stats, cache, metrics,
+                                       config.send_timeout):
+                        log.info("client rejected, server busy", extra={'fields': {'addr': addr}})
+                        conn.close()
+                        continue
+                    
+                    if log.isEnabledFor(logging.DEBUG):
+                        log.debug("client connected", extra={'fields': {'addr': addr}})
+                    
+                except KeyboardInterrupt:
+                    print(f"\n✓ Server '{name}' shutting down...")
+                    break
+                except Exception as e:
+                    log.error("error accepting connection: %s", e)
+        finally:
+            pool.shutdown()
+    
+    def _handle_client(self, conn: Any, handlers: Dict[str, FuncDecl], description: str,
+                       log: logging.Logger, stats: Optional[ChannelStats] = None,
+                       cache: Optional[ResponseCache] = None,
+                       metrics: Optional[ServerMetrics] = None, send_timeout: float = 0.0):
         """Handle client connection on server"""
+        debug = log.isEnabledFor(logging.DEBUG)
+        default = next(iter(handlers.values()))
+        # Each connection runs the handler in its own execution context
+        context = self.fork_context()
+        def send(data):
+            # A client that stops reading must not hold this worker forever
+            if send_timeout:
+                conn.settimeout(send_timeout)
+            conn.sendall(data)
+            if send_timeout:
+                conn.settimeout(None)
+        
         try:
+            tune_socket(conn)
+            reader = FrameReader(conn)
+            
             # Send description
-            conn.send(description.encode('utf-8'))
+            conn.sendall(encode_frame(description))
             
+            replies = bytearray()
             while True:
-                # Receive data
-                data = conn.recv(4096).decode('utf-8')
-                if not data:
+                # Receive data (pipelined requests are answered in arrival order)
+                frame = reader.read_frame()
+                if frame is None:
                     break
                 
-                print(f"  Received: {data}")
-                
-                # Parse the data (expecting comma-separated values)
-                args_str = data.strip().split(',')
+                if debug:
+                    log.debug("received", extra={'fields': {'id': frame.id, 'data': frame.text}})
                 
-                # Create function call
-                self.enter_scope()
-                try:
-                    # Bind parameters
-                    for param, arg_str in zip(func.parameters, args_str):
-                        # Try to convert to number if possible
-                        try:
-                            value = float(arg_str) if '.' in arg_str else int(arg_str)
-                        except ValueError:
-                            value = arg_str.strip()
-                        
-                        self.current_scope.define(param.name, value)
+                func = default if frame.fn is None else handlers.get(frame.fn)
+                if (frame.headers is not None and stamp_deadline(frame, reader.received)
+                        and deadline_passed(frame)):
+                    # The client has given up on this request: do not run it
+                    if metrics is not None:
+                        metrics.incr('expired')
+                    replies += encode_error(frame, 'deadline', 'deadline exceeded')
+                elif func is None:
+                    replies += encode_error(frame, 'fn', f"unknown function '{frame.fn}'")
+                elif wants_stream(frame):
+                    # Items go out as they are emitted, after the replies batched so far
+                    if replies:
+                        send(replies)
+                        replies.clear()
+                    start = time.perf_counter()
+                    streamed = [0]
                     
-                    # Execute function body
-                    result = self.execute(func.body)
+                    def emit(text):
+                        data = encode_item(frame, text)
+                        streamed[0] += len(data)
+                        send(data)
                     
-                    # Send result back
-                    response = str(result) if result is not None else "OK"
-                    conn.send(response.encode('utf-8'))
-                    print(f"  Sent: {response}")
-                
-                except ReturnException as ret:
-                    response = str(ret.value) if ret.value is not None else "OK"
-                    conn.send(response.encode('utf-8'))
-                    print(f"  Sent: {response}")
+                    context._stream_handler(func, frame.text, emit)
+                    reply = encode_reply(frame, '')
+                    replies += reply
+                    if stats is not None:
+                        stats.record(time.perf_counter() - start, frame.size,
+                                     streamed[0] + len(reply))
+                else:
+                    start = time.perf_counter()
+                    response = context._call_handler(func, frame.text, cache)
+                    reply = encode_reply(frame, response)
+                    replies += reply
+                    if stats is not None:
+                        stats.record(time.perf_counter() - start, frame.size, len(reply))
+                    if debug:
+                        log.debug("sent", extra={'fields': {'id': frame.id, 'data': response}})
                 
-                finally:
-                    self.exit_scope()
+                # Batch replies while more pipelined requests are already buffered
+                if not reader.has_frame():
+                    send(replies)
+                    replies.clear()
+        
+        except socket.timeout:
+            log.warning("client not reading replies, disconnected")
+            if stats is not None:
+                stats.error()
         
         except Exception as e:
-            print(f"  Error handling client: {e}")
-            import traceback
-            traceback.print_exc()
+            log.exception("error handling client: %s", e)
+            if stats is not None:
+                stats.error()
         
         finally:
-            print("  Client disconnected")
+            if debug:
+                log.debug("client disconnected")
             conn.close()
     
+    def _call_handler(self, func: FuncDecl, data: str,
+                      cache: Optional[ResponseCache] = None) -> str:
+        """Run a server channel function on one request and return the response text"""
+        values = self._handler_args(func, data)
+        
+        # A pure handler's response depends only on the decoded arguments
+        # (and their types: 1 and 1.0 print differently)
+        if cache is not None:
+            key = (func.name,) + tuple((value.__class__, value) for value in values)
+            response = cache.get(key)
+            if response is not None:
+                return response
+        
+        # Items a streaming handler emits make up its response when sent to
+        emitted = []
+        result = self._run_handler(func, values, emitted.append)
+        if emitted:
+            result = emitted
+        
+        response = str(result) if result is not None else "OK"
+        if cache is not None:
+            cache.put(key, response)
+        return response
+    
+    def _stream_handler(self, func: FuncDecl, data: str, emit: Callable[[str], None]):
+        """Run a server channel function on one request, streaming its items to emit"""
+        count = [0]
+        
+        def sink(value):
+            count[0] += 1
+            emit(str(value))
+        
+        result = self._run_handler(func, self._handler_args(func, data), sink)
+        if not count[0] and result is not None:
+            # A handler that returns its results at once still streams them
+            for value in (result if isinstance(result, list) else [result]):
+                emit(str(value))
+    
+    def _handler_args(self, func: FuncDecl, data: str) -> List[Any]:
+        """Decode a request's comma-separated values for the handler's parameters"""
+        args_str = data.strip().split(',')
+        values = []
+        for arg_str in args_str[:len(func.parameters)]:
+            # Try to convert to number if possible
+            try:
+                values.append(float(arg_str) if '.' in arg_str else int(arg_str))
+            except ValueError:
+                values.append(arg_str.strip())
+        return values
+    
+    def _run_handler(self, func: FuncDecl, values: List[Any],
+                     emit: Callable[[Any], None]) -> Any:
+        """Execute a handler's body with emit() items going to emit"""
+        state = self.handler_state
+        outer = getattr(state, 'emit', None)
+        state.emit = emit
+        
+        # Create function call
+        self.enter_scope()
+        try:
+            # Bind parameters
+            for param, value in zip(func.parameters, values):
+                self.current_scope.define(param.name, value)
+            
+            # Execute function body
+            return self.execute(func.body)
+        
+        except ReturnException as ret:
+            return ret.value
+        
+        finally:
+            self.exit_scope()
+            state.emit = outer
+    
+    def _function_name(self, arg: ASTNode) -> str:
+        """Name of a server channel's function, written bare or as a string"""
+        return arg.name if isinstance(arg, Variable) else self.execute(arg)
+    
     def _create_client_channel(self, node: ChannelDecl) -> Any:
         """Create client channel (socket client)"""
-        # Parse arguments: {host, port}
+        # Parse arguments: {host, port[, options]} or {[endpoints][, options]}
         args = node.arguments
 
-        if len(args) < 2:
+        first = self.execute(args[0]) if args else None
+        if isinstance(first, list):
+            # Replicas given as "host:port" strings, balanced per request
+            endpoints = [parse_endpoint(spec) for spec in first]
+            option_arg = 1
+        elif len(args) < 2:
             raise ValueError("Client channel requires: host, port")
+        else:
+            endpoints = [(first, self.execute(args[1]))]
+            option_arg = 2
 
-        host = self.execute(args[0])
-        port = self.execute(args[1])
+        # Optional options: {"pool": true, "policy": "round_robin"}
+        options = self.execute(args[option_arg]) if len(args) > option_arg else None
+        if options is not None and not isinstance(options, dict):
+            raise TypeError("Client channel options must be a dictionary")
+        config = ClientConfig.from_options(options)
 
-        # Create socket and connect
-        client = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        address = ', '.join(describe(*parse_address(host, port)) for host, port in endpoints)
+        log = self._channel_log(node.name)
 
-        try:
-            client.connect((host, int(port)))
-            print(f"✓ Client '{node.name}' connected to {host}:{port}")
+        # Re-declaring a channel (e.g. in a loop) gives back the old connection
+        self._release_channel(node.name)
 
-            # Receive welcome message
-            welcome = client.recv(4096).decode('utf-8')
-            print(f"  Server says: {welcome}")
+        # Borrow an already handshaken connection, or connect directly
+        try:
+            stats = telemetry.channel(node.name, 'client')
+            if len(endpoints) > 1:
+                client = BalancedClient(endpoints, config,
+                                        client_pool if config.pool else None, log, stats)
+            else:
+                if config.pool:
+                    client = client_pool.acquire(endpoints[0][0], int(endpoints[0][1]))
+                else:
+                    client = ClientConnection.connect(endpoints[0][0], int(endpoints[0][1]))
+                client.bind_stats(stats)
+                client.configure(config)
+            if log.isEnabledFor(logging.INFO):
+                # Welcome message is read during the handshake
+                log.info("connected", extra={'fields': {
+                    'server': address, 'description': client.description}})
 
             # Store connection
             self.channels[node.name] = client
 
-        except ConnectionRefusedError:
+        except (ConnectionRefusedError, FileNotFoundError):
             print(f"✗ Failed to connect client '{node.name}': Connection refused")
-            print(f"  Make sure a server is running on {host}:{port}")
+            print(f"  Make sure a server is running on {address}")
             print(f"  Hint: Start the server program in another terminal first!")
-            raise ConnectionRefusedError(f"No server running on {host}:{port}. Start the server first!")
+            raise ConnectionRefusedError(f"No server running on {address}. Start the server first!")
         except Exception as e:
             print(f"✗ Failed to connect client '{node.name}': {e}")
             raise
 
         return None
     
+    def _decode_response(self, response: str) -> Any:
+        """Convert a server response to a number when possible"""
+        try:
+            return float(response) if '.' in response else int(response)
+        except ValueError:
+            return response
+    
+    def _decode_stream(self, stream: Any):
+        """Iterate a channel stream's items decoded like send() replies"""
+        try:
+            for item in stream:
+                yield self._decode_response(item)
+        finally:
+            stream.close()
+    
+    def _channel_log(self, name: str) -> logging.Logger:
+        """Cached per-channel logger (looked up on every channel call)"""
+        log = self.channel_logs.get(name)
+        if log is None:
+            log = self.channel_logs[name] = channel_logger(name)
+        return log
+    
+    def _release_channel(self, name: str):
+        """Return a client channel's connection to the pool (or close it)"""
+        conn = self.channels.pop(name, None)
+        if conn is not None:
+            conn.release()
+    
     def exec_MethodCall(self, node: MethodCall) -> Any:
         """Execute method call (e.g., channel.send(), list.append(), str.split())"""
         obj_name = node.object
@@ -648,24 +1626,46 @@ class MiniparRunner:
                 args = [self.execute(arg) for arg in node.arguments]
                 message = ','.join(str(arg) for arg in args)
 
-                conn.send(message.encode('utf-8'))
-                print(f"  Sent to server: {message}")
-
                 # Receive response
-                response = conn.recv(4096).decode('utf-8')
-                print(f"  Received from server: {response}")
+                response = conn.request(message)
 
-                # Try to convert response to number
-                try:
-                    return float(response) if '.' in response else int(response)
-                except ValueError:
-                    return response
+                log = self._channel_log(obj_name)
+                if log.isEnabledFor(logging.DEBUG):
+                    log.debug("request", extra={'fields': {'sent': message, 'received': response}})
+
+                return self._decode_response(response)
+
+            elif method_name == 'stream':
+                # Items are read as the caller iterates, e.g. in a for loop
+                args = [self.execute(arg) for arg in node.arguments]
+                message = ','.join(str(arg) for arg in args)
+                return self._decode_stream(conn.stream(message))
+
+            elif method_name in ('call', 'call_async', 'call_stream'):
+                # Address one function of a multi-function server channel
+                if not node.arguments:
+                    raise TypeError(f"{method_name}() needs the name of the server function")
+                args = [self.execute(arg) for arg in node.arguments]
+                fn = args[0]
+                if not isinstance(fn, str):
+                    raise TypeError(f"{method_name}() expects a function name, got {type(fn).__name__}")
+                message = ','.join(str(arg) for arg in args[1:])
+                if method_name == 'call_async':
+                    return conn.submit(message, fn=fn)
+                if method_name == 'call_stream':
+                    return self._decode_stream(conn.stream(message, fn=fn))
+                return self._decode_response(conn.request(message, fn=fn))
+
+            elif method_name == 'send_async':
+                # Pipeline the request; the reply is collected with await()
+                args = [self.execute(arg) for arg in node.arguments]
+                message = ','.join(str(arg) for arg in args)
+                return conn.submit(message)
 
             elif method_name == 'close':
-                # Close connection
-                conn.close()
-                del self.channels[obj_name]
-                print(f"✓ Connection '{obj_name}' closed")
+                # Close connection (pooled connections stay open for reuse)
+                self._release_channel(obj_name)
+                self._channel_log(obj_name).debug("closed")
                 return None
 
             else:
@@ -676,6 +1676,23 @@ class MiniparRunner:
         if obj is None:
             raise NameError(f"Object '{obj_name}' not found")
 
+        # Channel between PAR branches
+        if isinstance(obj, LocalChannel):
+            if method_name == 'put':
+                if len(node.arguments) != 1:
+                    raise TypeError(f"put() takes exactly 1 argument")
+                obj.put(self.execute(node.arguments[0]))
+                return None
+            elif method_name == 'get':
+                if len(node.arguments) != 0:
+                    raise TypeError(f"get() takes no arguments")
+                return obj.get()
+            elif method_name == 'close':
+                obj.close()
+                return None
+            else:
+                raise AttributeError(f"Channel has no method '{method_name}'")
+
         # List methods
         if isinstance(obj, list):
             if method_name == 'append':
@@ -770,10 +1787,21 @@ class MiniparRunner:
 
     def cleanup(self):
         """Clean up resources"""
-        # Close all channels
-        for name, conn in list(self.channels.items()):
+        self.scheduler.shutdown()
+        if self.green is not None:
+            self.green.shutdown()
+        if self.cluster is not None:
+            self.cluster.close()
+        
+        # Stop server processes started for pre-forked channels
+        for supervisor in self.supervisors.values():
+            supervisor.stop()
+        self.supervisors.clear()
+        
+        # Close all channels (pooled connections go back to the pool)
+        for name in list(self.channels):
             try:
-                conn.close()
+                self._release_channel(name)
             except:
                 pass
         
@@ -782,18 +1810,123 @@ class MiniparRunner:
 
 
 
+def _prefork_worker(name: str, func_names: List[str], functions: Dict[str, FuncDecl],
+                    global_values: Dict[str, Any], description: str, address: tuple,
+                    config: ServerConfig, log_levels: tuple, parent_pid: int, ready):
+    """Entry point of one server process started by PreforkSupervisor"""
+    # Ctrl+C is handled by the parent, which takes its server processes down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    configure_logging(*log_levels)
+    
+    runner = MiniparRunner()
+    runner.functions.update(functions)
+    for var_name, value in global_values.items():
+        runner.global_scope.define(var_name, value)
+    metrics = runner.server_metrics[name] = ServerMetrics()
+    
+    try:
+        server = create_listener('tcp', address, config.backlog, reuse_port=True)
+    except Exception as e:
+        ready.write(f"{type(e).__name__}: {e}\n")
+        return
+    ready.write("ready\n")
+    ready.close()
+    
+    def exit_with_parent():
+        while os.getppid() == parent_pid:
+            time.sleep(1)
+        os._exit(0)
+    
+    threading.Thread(target=exit_with_parent, daemon=True).start()
+    try:
+        handlers = {func_name: functions[func_name] for func_name in func_names}
+        runner._serve_listener(name, server, handlers, description, config, metrics)
+    finally:
+        close_listener(server)
+
+
+def _execute_branch(functions: Dict[str, FuncDecl], statement: ASTNode,
+                    values: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a PAR branch shipped to a worker daemon; returns the variables it changed"""
+    runner = MiniparRunner()
+    runner.functions.update(functions)
+    before = {}
+    for name, value in values.items():
+        runner.global_scope.define(name, value)
+        before[name] = pickle.dumps(value)
+    try:
+        runner.execute(statement)
+    finally:
+        runner.scheduler.shutdown()
+    return {name: value for name, value in runner.global_scope.table.items()
+            if name in before and pickle.dumps(value) != before[name]}
+
+
 def main():
     """Command-line interface for runner"""
     import sys
     import argparse
     
     parser = argparse.ArgumentParser(description="Minipar Runtime Executor")
-    parser.add_argument("file", help="Minipar source file to execute")
+    parser.add_argument("file", nargs="?", help="Minipar source file to execute")
     parser.add_argument("--debug", action="store_true", help="Enable debug output")
+    parser.add_argument("--log-level", default="warning",
+                        help="Runtime log level: debug, info, warning, error or off (default: warning)")
+    parser.add_argument("--log-channel", action="append", metavar="CHANNEL=LEVEL",
+                        help="Override the log level of one channel (repeatable)")
+    parser.add_argument("--stats-file", metavar="PATH",
+                        help="Periodically write channel telemetry to this JSON file")
+    parser.add_argument("--stats-interval", type=float, default=10.0, metavar="SECONDS",
+                        help="Seconds between --stats-file updates (default: 10)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="Serve plaintext channel metrics on http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--no-telemetry", action="store_true",
+                        help="Do not record channel telemetry")
+    parser.add_argument("--par-node", action="append", metavar="HOST:PORT",
+                        help="Ship PAR branches to the worker daemon at HOST:PORT (repeatable)")
+    parser.add_argument("--par-worker", metavar="HOST:PORT",
+                        help="Run as a worker daemon for PAR branches instead of running a file")
+    parser.add_argument("--green", action="store_true",
+                        help="Run PAR branches as cooperative green tasks on one thread "
+                             "(network requests and await() wait on helper threads)")
     
     args = parser.parse_args()
+    if (args.file is None) == (args.par_worker is None):
+        parser.error("give either a file to execute or --par-worker HOST:PORT")
+    
+    try:
+        configure_logging(args.log_level, parse_channel_levels(args.log_channel))
+    except ValueError as e:
+        parser.error(str(e))
+    
+    telemetry.enabled = not args.no_telemetry
+    if args.stats_file:
+        telemetry.start_dump(args.stats_file, args.stats_interval)
+    if args.metrics_port is not None:
+        try:
+            telemetry.serve(args.metrics_port)
+        except OSError as e:
+            parser.error(f"cannot serve metrics on port {args.metrics_port}: {e}")
+    
+    if args.par_worker:
+        try:
+            serve_par_worker(args.par_worker, _execute_branch,
+                             on_ready=lambda address: print(f"PAR worker listening on {address}",
+                                                            flush=True))
+        except KeyboardInterrupt:
+            pass
+        except (OSError, ValueError) as e:
+            parser.error(f"cannot serve PAR branches on {args.par_worker}: {e}")
+        return
     
     runner = MiniparRunner()
+    if args.green:
+        runner.green = GreenScheduler()
+    if args.par_node:
+        try:
+            runner.cluster = DistributedScheduler(args.par_node)
+        except ValueError as e:
+            parser.error(str(e))
     
     try:
         print(f"\n{'='*60}")
@@ -823,6 +1956,7 @@ def main():
     
     finally:
         runner.cleanup()
+        telemetry.stop()
 
 
 if __name__ == '__main__':
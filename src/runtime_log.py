@@ -0,0 +1,103 @@
+"""
+Runtime Logging for Minipar
+Leveled, per-channel loggers for the runner built on the standard logging module
+"""
+
+import logging
+import sys
+from typing import Dict, Optional, TextIO, Tuple
+
+
+ROOT_LOGGER = 'minipar'
+CHANNEL_LOGGER = 'minipar.channel'
+
+LEVELS = {
+    'debug': logging.DEBUG,
+    'info': logging.INFO,
+    'warning': logging.WARNING,
+    'error': logging.ERROR,
+    'off': logging.CRITICAL + 1,
+}
+
+# Quiet unless configured otherwise
+DEFAULT_LEVEL = 'warning'
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Formats records as 'time level logger event key=value ...' lines"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = f"{self.formatTime(record, '%H:%M:%S')} {record.levelname.lower():7} {record.name} {record.getMessage()}"
+        fields = getattr(record, 'fields', None)
+        if fields:
+            line += ' ' + ' '.join(f"{key}={value!r}" for key, value in fields.items())
+        if record.exc_info:
+            line += '\n' + self.formatException(record.exc_info)
+        return line
+
+
+def parse_level(level: str) -> int:
+    """Translate a level name such as 'debug' into a logging level"""
+    try:
+        return LEVELS[level.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown log level '{level}' (expected one of {', '.join(LEVELS)})")
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger for a runtime component, e.g. get_logger('runner')"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+
+def channel_logger(channel: str) -> logging.Logger:
+    """Logger for one channel, so each channel's level can be set on its own"""
+    return logging.getLogger(f"{CHANNEL_LOGGER}.{channel}")
+
+
+def configure(level: str = DEFAULT_LEVEL, channels: Optional[Dict[str, str]] = None,
+              stream: Optional[TextIO] = None):
+    """
+    Set the global runtime log level and optional per-channel overrides.
+    Calling it again replaces the previous configuration.
+    """
+    root = logging.getLogger(ROOT_LOGGER)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    handler = logging.StreamHandler(stream or sys.stderr)
+    handler.setFormatter(KeyValueFormatter())
+    root.addHandler(handler)
+    root.setLevel(parse_level(level))
+    root.propagate = False
+
+    # Channel loggers inherit the global level unless overridden
+    for name, logger in logging.root.manager.loggerDict.items():
+        if name.startswith(CHANNEL_LOGGER + '.') and isinstance(logger, logging.Logger):
+            logger.setLevel(logging.NOTSET)
+    for name, channel_level in (channels or {}).items():
+        channel_logger(name).setLevel(parse_level(channel_level))
+
+
+def current_levels() -> Tuple[str, Dict[str, str]]:
+    """The active global level and per-channel overrides, as accepted by configure()"""
+    names = {value: name for name, value in LEVELS.items()}
+    root = logging.getLogger(ROOT_LOGGER)
+    channels = {
+        name[len(CHANNEL_LOGGER) + 1:]: names.get(logger.level, DEFAULT_LEVEL)
+        for name, logger in logging.root.manager.loggerDict.items()
+        if name.startswith(CHANNEL_LOGGER + '.') and isinstance(logger, logging.Logger)
+        and logger.level != logging.NOTSET
+    }
+    return names.get(root.level, DEFAULT_LEVEL), channels
+
+
+def parse_channel_levels(specs) -> Dict[str, str]:
+    """Parse command-line 'name=level' pairs into a dict"""
+    levels = {}
+    for spec in specs or []:
+        name, sep, level = spec.partition('=')
+        if not sep or not name:
+            raise ValueError(f"Expected CHANNEL=LEVEL, got '{spec}'")
+        parse_level(level)
+        levels[name] = level
+    return levels
@@ -0,0 +1,166 @@
+"""
+Work-Stealing Scheduler for Minipar PAR Blocks
+Runs PAR branches as tasks on a fixed set of worker threads, so nested and
+recursive PAR blocks (a parallel quicksort, a parallel fib) never start more
+threads than there are workers:
+
+- a thread that runs a PAR block pushes its branches onto its own deque and
+  runs the first one itself
+- workers take tasks from the top of their own deque (newest first) and,
+  when that is empty, steal from the bottom of another one (oldest first,
+  usually the biggest piece of work left)
+- a thread waiting for a branch runs pending tasks until the branch is
+  done, instead of sleeping while it holds a worker
+"""
+
+import threading
+from collections import deque
+from typing import Any, Callable, Deque, List, Optional
+
+
+# How deep a waiting thread nests tasks it stole onto its own stack; deeper
+# joins sleep instead, so helping cannot overflow the interpreter's stack
+MAX_HELP_DEPTH = 32
+
+
+class Task:
+    """One PAR branch: its job, and its result or error once it has run"""
+    __slots__ = ('job', 'result', 'error', 'done')
+
+    def __init__(self, job: Callable[[], Any]):
+        self.job = job
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.done = False
+
+
+class WorkStealingScheduler:
+    """Fixed pool of worker threads with one task deque each"""
+
+    def __init__(self, workers: int):
+        self.workers = max(1, workers)
+        # One deque per worker, plus one shared by threads outside the pool
+        self.deques: List[Deque[Task]] = [deque() for _ in range(self.workers + 1)]
+        self.threads: List[threading.Thread] = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.work = threading.Condition(self.lock)  # Idle workers wait for tasks
+        self.finished = threading.Condition(self.lock)  # Joins wait for tasks to end
+        self.idle = 0
+        self.joining = 0
+        self.stopped = False
+        self.steals = 0
+        self.tasks = 0
+
+    def run_all(self, jobs: List[Callable[[], Any]]) -> List[Any]:
+        """Run jobs in parallel; returns their results in order or raises the first error"""
+        self._start()
+        tasks = [Task(job) for job in jobs]
+        own = self.deques[self._index()]
+        for task in tasks[1:]:
+            own.append(task)
+        if len(tasks) > 1:
+            with self.lock:
+                self.work.notify(len(tasks) - 1)
+
+        self._run(tasks[0])
+        # Newest first: unless stolen, each is still on top of our deque
+        for task in reversed(tasks[1:]):
+            self.join(task)
+
+        for task in tasks:
+            if task.error is not None:
+                raise task.error
+        return [task.result for task in tasks]
+
+    def join(self, task: Task):
+        """Wait for task, running pending tasks in the meantime"""
+        index = self._index()
+        while not task.done:
+            other = self._find(index, steal=self._depth() < MAX_HELP_DEPTH)
+            if other is not None:
+                self._run(other)
+                continue
+            with self.lock:
+                if not task.done:
+                    # The timeout picks up tasks pushed meanwhile by busy workers
+                    self.joining += 1
+                    self.finished.wait(0.05)
+                    self.joining -= 1
+
+    def idle_threads(self) -> int:
+        """Workers parked waiting for tasks (they hold no locks a fork could copy mid-use)"""
+        with self.lock:
+            return self.idle if not any(self.deques) else 0
+
+    def shutdown(self):
+        """Let the workers exit once they run out of tasks"""
+        with self.lock:
+            self.stopped = True
+            self.work.notify_all()
+
+    def _start(self):
+        if self.threads:
+            return
+        with self.lock:
+            if self.threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker, args=(index,),
+                                          name=f"minipar-par-{index}", daemon=True)
+                self.threads.append(thread)
+                thread.start()
+
+    def _worker(self, index: int):
+        self.local.index = index
+        while True:
+            task = self._find(index, steal=True)
+            if task is not None:
+                self._run(task)
+                continue
+            with self.lock:
+                if self.stopped:
+                    return
+                self.idle += 1
+                while not any(self.deques) and not self.stopped:
+                    self.work.wait()
+                self.idle -= 1
+
+    def _index(self) -> int:
+        """Deque of the calling thread: its own for a worker, the shared one otherwise"""
+        return getattr(self.local, 'index', self.workers)
+
+    def _depth(self) -> int:
+        return getattr(self.local, 'depth', 0)
+
+    def _find(self, index: int, steal: bool) -> Optional[Task]:
+        """The newest task of deque index, else the oldest one of another deque"""
+        try:
+            return self.deques[index].pop()
+        except IndexError:
+            pass
+        if not steal:
+            return None
+        count = len(self.deques)
+        for offset in range(1, count):
+            try:
+                task = self.deques[(index + offset) % count].popleft()
+            except IndexError:
+                continue
+            self.steals += 1
+            return task
+        return None
+
+    def _run(self, task: Task):
+        self.local.depth = self._depth() + 1
+        try:
+            task.result = task.job()
+        except BaseException as e:
+            task.error = e
+        finally:
+            self.local.depth -= 1
+            with self.lock:
+                task.done = True
+                self.tasks += 1
+                if self.joining:
+                    self.finished.notify_all()
@@ -3,7 +3,7 @@ Semantic Analyzer for Minipar Language
 Performs type checking and semantic validation
 """
 
-from typing import Optional, List
+from typing import Callable, Dict, List, Optional, Set, Tuple
 try:
     from src.ast_nodes import *
     from src.symbol_table import SymbolTable, SymbolType, Symbol
@@ -23,8 +23,17 @@ class SemanticAnalyzer:
     def __init__(self):
         self.symbol_table = SymbolTable()
         self.errors: List[str] = []
+        self.warnings: List[str] = []
+        self.functions: Dict[str, FuncDecl] = {}
+        self._effects: Optional['EffectAnalyzer'] = None  # Rebuilt when a function is declared
+        self.program: Optional[Program] = None
+        self._shared: Optional[Dict[str, Set[str]]] = None  # See shared_objects()
         self.current_function_return_type: Optional[str] = None
         self.in_loop = False  # Track if we're inside a loop (for break/continue)
+        self.in_par_for = False  # Whether the innermost loop is a par for
+        self.par_for_scope = None  # Scope of the outermost par for being visited
+        self.par_for_reductions: Set[str] = set()
+        self.par_for_written: Set[str] = set()  # Shared variables it already reported writes to
         
         # Built-in functions
         self._initialize_builtins()
@@ -38,6 +47,15 @@ class SemanticAnalyzer:
             ("to_string", "string", ["any"]),
             ("to_number", "number", ["string"]),
             ("sleep", "void", ["number"]),
+            # Channel replies
+            ("await", "any", ["any"]),
+            ("wait_all", "list", ["list"]),
+            ("stats", "dict", []),
+            ("emit", "void", ["any"]),
+            # Bounded channel between PAR branches
+            ("channel", "chan", ["number"]),
+            # Numbers start..end-1, e.g. for a par for
+            ("range", "list", ["number", "number"]),
             # Math functions
             ("pow", "number", ["number", "number"]),
             ("sqrt", "number", ["number"]),
@@ -58,11 +76,16 @@ class SemanticAnalyzer:
         """Add a semantic error"""
         self.errors.append(f"Semantic error at line {line}: {message}")
     
+    def add_warning(self, message: str, line: int = 0):
+        """Add a warning: the program is valid but probably wrong"""
+        self.warnings.append(f"Semantic warning at line {line}: {message}")
+    
     def analyze(self, node: ASTNode) -> bool:
         """
         Analyze the AST and return True if no errors
         """
         self.errors = []
+        self.warnings = []
         try:
             self.visit(node)
             return len(self.errors) == 0
@@ -87,6 +110,7 @@ class SemanticAnalyzer:
     
     def visit_Program(self, node: Program) -> None:
         """Visit program node"""
+        self.program, self._shared = node, None
         for declaration in node.declarations:
             self.visit(declaration)
     
@@ -128,6 +152,8 @@ class SemanticAnalyzer:
             line=0, is_initialized=True,
             param_types=param_types, return_type=node.return_type
         )
+        self.functions[node.name] = node
+        self._effects = None
         
         # Enter function scope
         self.symbol_table.enter_scope(f"func_{node.name}")
@@ -208,6 +234,78 @@ class SemanticAnalyzer:
             self.visit(stmt)
         
         self.symbol_table.exit_scope()
+        self.check_par_races(node)
+    
+    def check_par_races(self, node: ParBlock):
+        """
+        Record on node which variables the branches race on (one writes
+        what another reads or writes), warning once per variable, whether
+        branches share a channel, and whether they are independent: no races
+        and no channel between them.
+        """
+        effects = [self.effects_of(stmt) for stmt in node.statements]
+        
+        writers: Dict[str, List[int]] = {}
+        readers: Dict[str, List[int]] = {}
+        channel_users: Dict[str, int] = {}
+        for branch, effect in enumerate(effects):
+            for name in effect.writes:
+                writers.setdefault(name, []).append(branch)
+            for name in effect.reads - effect.writes:
+                readers.setdefault(name, []).append(branch)
+            for name in effect.channels:
+                channel_users[name] = channel_users.get(name, 0) + 1
+        
+        node.races = {}
+        for name in sorted(writers):
+            written, read = writers[name], readers.get(name, [])
+            if len(written) > 1 or read:
+                node.races[name] = sorted(written + read)
+                self.add_warning(f"PAR branches {_branch_list(node.races[name])} race on "
+                                 f"'{name}' (written by {_branch_list(written)})")
+        node.communicates = any(users > 1 for users in channel_users.values())
+        node.independent = not node.races and not node.communicates
+    
+    def effects_of(self, node: ASTNode) -> 'Effects':
+        """Effects of node, following the functions declared so far"""
+        if self._effects is None:
+            self._effects = EffectAnalyzer(self.functions, self._kind_of)
+        effects = self._effects.effects(node)
+        shared = self.shared_objects()
+        if shared:
+            # Touching a list touches every global that may name it
+            effects.reads = {alias for name in effects.reads for alias in shared.get(name, {name})}
+            effects.writes = {alias for name in effects.writes for alias in shared.get(name, {name})}
+        return effects
+    
+    def shared_objects(self) -> Dict[str, Set[str]]:
+        """
+        Groups of global lists, dicts and any-typed variables that may name
+        the same object anywhere in the program, by member name. Assignments
+        are followed through functions, so storing a parameter in a global
+        groups that global with every variable passed in.
+        """
+        if self._shared is None:
+            self._shared = {}
+            if self.program is not None:
+                declarations = self.program.declarations
+                kinds = {d.name: d.type for d in declarations if isinstance(d, VarDecl)}
+                functions = {d.name: d for d in declarations if isinstance(d, FuncDecl)}
+                for a, b in EffectAnalyzer(functions, kinds.get).links(self.program):
+                    if kinds.get(a) in CONTAINER_TYPES and kinds.get(b) in CONTAINER_TYPES:
+                        group = self._shared.get(a, {a}) | self._shared.get(b, {b})
+                        for name in group:
+                            self._shared[name] = group
+        return self._shared
+    
+    def _kind_of(self, name: str) -> Optional[str]:
+        """Data type of a visible name, 'channel' for network channels"""
+        symbol = self.symbol_table.lookup(name)
+        if symbol is None:
+            return None
+        if symbol.symbol_type == SymbolType.CHANNEL:
+            return "channel"
+        return symbol.data_type
     
     def visit_IfStmt(self, node: IfStmt) -> None:
         """Visit if statement"""
@@ -229,14 +327,14 @@ class SemanticAnalyzer:
             self.add_error(f"While condition must be boolean, got {cond_type}")
 
         # Track that we're in a loop
-        old_in_loop = self.in_loop
-        self.in_loop = True
+        old_in_loop, old_in_par_for = self.in_loop, self.in_par_for
+        self.in_loop, self.in_par_for = True, False
 
         # Visit body
         self.visit(node.body)
 
         # Restore loop state
-        self.in_loop = old_in_loop
+        self.in_loop, self.in_par_for = old_in_loop, old_in_par_for
 
     def visit_ForStmt(self, node: 'ForStmt') -> None:
         """Visit for statement"""
@@ -250,24 +348,94 @@ class SemanticAnalyzer:
         
         # Visit iterable
         iter_type = self.visit(node.iterable)
-        if iter_type not in ("list", "string", "any"):
+        if iter_type not in ("list", "string", "chan", "any"):
             self.add_error(f"Cannot iterate over type '{iter_type}'")
         
         # Track that we're in a loop
-        old_in_loop = self.in_loop
-        self.in_loop = True
+        old_in_loop, old_in_par_for = self.in_loop, self.in_par_for
+        self.in_loop, self.in_par_for = True, False
         
         # Visit body
         self.visit(node.body)
         
-        self.in_loop = old_in_loop
+        self.in_loop, self.in_par_for = old_in_loop, old_in_par_for
+        self.symbol_table.exit_scope()
+
+    def visit_ParForStmt(self, node: 'ParForStmt') -> None:
+        """
+        Visit parallel for: iterations run in any order and at the same time,
+        so they may only write variables declared inside the loop, plus the
+        reduction variables whose per-worker results are combined at the end
+        """
+        iter_type = self.visit(node.iterable)
+        if iter_type not in ("list", "string", "any"):
+            self.add_error(f"Cannot iterate over type '{iter_type}' in par for")
+        
+        reductions = set()
+        for operator, name in node.reductions:
+            if operator not in REDUCTIONS:
+                self.add_error(f"Unknown reduction '{operator}' (expected sum, product, min or max)")
+            symbol = self.symbol_table.lookup(name)
+            if not symbol:
+                self.add_error(f"Undefined variable '{name}'")
+            elif symbol.symbol_type in (SymbolType.FUNCTION, SymbolType.CHANNEL) or \
+                    symbol.data_type not in ("number", "any"):
+                self.add_error(f"Reduction variable '{name}' must be a number")
+            if name in reductions:
+                self.add_error(f"Variable '{name}' is reduced more than once")
+            reductions.add(name)
+        
+        self.symbol_table.enter_scope("par_for")
+        self.symbol_table.add_symbol(
+            node.variable.name, SymbolType.VARIABLE, node.variable.type, 0
+        )
+        
+        old_state = (self.in_loop, self.in_par_for, self.par_for_scope, self.par_for_reductions)
+        self.in_loop, self.in_par_for = True, True
+        outermost = self.par_for_scope is None
+        if outermost:
+            self.par_for_scope, self.par_for_reductions = self.symbol_table.current_scope, reductions
+            self.par_for_written = set()
+        
+        self.visit(node.body)
+        
+        self.in_loop, self.in_par_for, self.par_for_scope, self.par_for_reductions = old_state
         self.symbol_table.exit_scope()
+        
+        if outermost:
+            # Writes made by called functions, to globals or to lists passed in
+            effects = self.effects_of(node)
+            for name in sorted(effects.writes - reductions - self.par_for_written):
+                self.add_error(
+                    f"par for iterations must be independent: a function called in the loop "
+                    f"writes '{name}' declared outside it (combine values with reduce(...))"
+                )
+    
+    def check_par_for_write(self, name: str, action: str):
+        """Report a write from a par for body to a variable shared by its iterations"""
+        if self.par_for_scope is None:
+            return
+        scope = self.symbol_table.current_scope
+        while scope is not None:
+            if scope.lookup_local(name):
+                return  # Declared inside the loop
+            if scope is self.par_for_scope:
+                break
+            scope = scope.parent
+        if name not in self.par_for_reductions:
+            self.par_for_written.add(name)
+            self.add_error(
+                f"par for iterations must be independent: cannot {action} '{name}' "
+                f"declared outside the loop (combine values with reduce(...))"
+            )
 
     def visit_ReturnStmt(self, node: ReturnStmt) -> None:
         """Visit return statement"""
         if self.current_function_return_type is None:
             self.add_error("Return statement outside function")
             return
+        if self.par_for_scope is not None:
+            self.add_error("Return statement in par for (iterations do not run in order)")
         
         if node.value:
             return_type = self.visit(node.value)
@@ -286,6 +454,8 @@ class SemanticAnalyzer:
         """Visit break statement"""
         if not self.in_loop:
             self.add_error("Break statement outside loop")
+        elif self.in_par_for:
+            self.add_error("Break statement in par for (iterations do not run in order)")
     
     def visit_ContinueStmt(self, node: ContinueStmt) -> None:
         """Visit continue statement"""
@@ -310,6 +480,7 @@ class SemanticAnalyzer:
         if symbol.symbol_type == SymbolType.FUNCTION:
             self.add_error(f"Cannot assign to function '{node.name}'")
             return "any"
+        self.check_par_for_write(node.name, "assign to")
         
         # Check type compatibility
         value_type = self.visit(node.value)
@@ -436,9 +607,21 @@ class SemanticAnalyzer:
 
         # For channels, allow send, receive, close methods
         if symbol.symbol_type == SymbolType.CHANNEL:
-            if node.method in ['send', 'receive', 'close']:
+            if node.method in ['send', 'send_async', 'stream', 'call', 'call_async',
+                               'call_stream', 'receive', 'close']:
+                # Visit arguments so undefined names are reported
+                for arg in node.arguments:
+                    self.visit(arg)
                 if node.method == 'send':
                     return "string"  # send returns response string from server
+                elif node.method == 'send_async':
+                    return "any"  # handle passed to await() / wait_all()
+                elif node.method == 'stream':
+                    return "any"  # items iterated with a for loop
+                elif node.method in ('call', 'call_async', 'call_stream'):
+                    if not node.arguments:
+                        self.add_error(f"{node.method}() needs the name of the server function")
+                    return "any"  # reply, handle or stream of the named function
                 elif node.method == 'receive':
                     return "string"  # receive returns string
                 else:  # close
@@ -449,6 +632,8 @@ class SemanticAnalyzer:
 
         # List methods
         if obj_type == "list":
+            if node.method in ("append", "pop", "insert", "remove", "sort"):
+                self.check_par_for_write(node.object, f"{node.method}() on")
             if node.method == "append":
                 # append(elem) -> void
                 if len(node.arguments) != 1:
@@ -487,6 +672,24 @@ class SemanticAnalyzer:
                 self.add_error(f"Unknown method '{node.method}' for list")
                 return "any"
 
+        # Channel between PAR branches
+        if obj_type == "chan":
+            if node.method == "put":
+                # put(value) -> void, blocks while the channel is full
+                if len(node.arguments) != 1:
+                    self.add_error(f"put() takes exactly 1 argument, got {len(node.arguments)}")
+                else:
+                    self.visit(node.arguments[0])
+                return "void"
+            elif node.method in ("get", "close"):
+                # get() -> any, blocks while the channel is empty; close() -> void
+                if len(node.arguments) != 0:
+                    self.add_error(f"{node.method}() takes no arguments, got {len(node.arguments)}")
+                return "any" if node.method == "get" else "void"
+            else:
+                self.add_error(f"Unknown method '{node.method}' for chan")
+                return "any"
+
         # String methods
         if obj_type == "string":
             if node.method in ["strip", "lower", "upper", "lstrip", "rstrip"]:
@@ -598,10 +801,16 @@ class SemanticAnalyzer:
         return "dict"
 
     def visit_IndexAccess(self, node: 'IndexAccess') -> str:
-        """Visit index access (array/string indexing)"""
+        """Visit index access (array/string indexing, dict lookup by key)"""
         obj_type = self.visit(node.object)
         index_type = self.visit(node.index)
 
+        # Dict keys are strings or numbers; an untyped value may be a dict
+        if obj_type == "dict" or (obj_type == "any" and index_type == "string"):
+            if index_type not in ("string", "number", "any"):
+                self.add_error(f"Dict key must be string or number, got {index_type}")
+            return "any"
+
         # Check index is number
         if index_type != "number" and index_type != "any":
             self.add_error(f"Index must be number, got {index_type}")
@@ -684,3 +893,470 @@ class SemanticAnalyzer:
     def get_errors(self) -> List[str]:
         """Get list of errors"""
         return self.errors.copy()
+    
+    def print_warnings(self):
+        """Print all semantic warnings"""
+        if self.warnings:
+            print("\n=== Semantic Warnings ===")
+            for warning in self.warnings:
+                print(f"  {warning}")
+
+
+# Builtins whose result depends only on their arguments
+PURE_BUILTINS = frozenset({
+    "len", "to_string", "to_number", "to_bool", "pow", "sqrt", "abs", "isalpha", "isnum",
+    "range",
+})
+
+# Operators of par for reductions
+REDUCTIONS = ("sum", "product", "min", "max")
+
+
+class ImpureError(Exception):
+    """Raised inside PurityChecker at the first construct with an effect"""
+    pass
+
+
+class PurityChecker:
+    """
+    Proves functions side-effect-free: a pure function reads only its
+    parameters and its own locals, assigns only to its locals and calls only
+    pure builtins and other pure functions. Anything the checker does not
+    recognise counts as impure, so a True verdict is safe to rely on.
+    """
+    
+    def __init__(self, functions: Dict[str, FuncDecl]):
+        self.functions = functions
+        self._verdicts: Dict[str, Optional[str]] = {}
+        self._checking: List[str] = []
+        self._scopes: List[Set[str]] = []
+    
+    def is_pure(self, name: str) -> bool:
+        return self.impurity(name) is None
+    
+    def impurity(self, name: str) -> Optional[str]:
+        """Why a function is not pure, or None when it is"""
+        if name in self._verdicts:
+            return self._verdicts[name]
+        if name in self._checking:
+            # Recursion: the function is pure if the rest of its body is
+            return None
+        func = self.functions.get(name)
+        if func is None:
+            return f"'{name}' is not a known function"
+        
+        saved_scopes, self._scopes = self._scopes, [{param.name for param in func.parameters}]
+        self._checking.append(name)
+        try:
+            self.visit(func.body)
+            reason = None
+        except ImpureError as e:
+            reason = str(e)
+        finally:
+            self._checking.pop()
+            self._scopes = saved_scopes
+        
+        # Inside a recursive check, "pure" rests on an assumption about the caller
+        if reason is not None or not self._checking:
+            self._verdicts[name] = reason
+        return reason
+    
+    def visit(self, node: ASTNode):
+        method = getattr(self, f'visit_{node.__class__.__name__}', None)
+        if method is None:
+            raise ImpureError(f"uses {node.__class__.__name__}")
+        method(node)
+    
+    def _is_local(self, name: str) -> bool:
+        return any(name in scope for scope in self._scopes)
+    
+    def _visit_scoped(self, statements: List[ASTNode], names: Set[str] = frozenset()):
+        self._scopes.append(set(names))
+        try:
+            for stmt in statements:
+                self.visit(stmt)
+        finally:
+            self._scopes.pop()
+    
+    # ========== Statements ==========
+    
+    def visit_Block(self, node: Block):
+        self._visit_scoped(node.statements)
+    
+    def visit_SeqBlock(self, node: SeqBlock):
+        self._visit_scoped(node.statements)
+    
+    def visit_VarDecl(self, node: VarDecl):
+        if node.initializer is not None:
+            self.visit(node.initializer)
+        self._scopes[-1].add(node.name)
+    
+    def visit_Assignment(self, node: Assignment):
+        if not self._is_local(node.name):
+            raise ImpureError(f"assigns to non-local variable '{node.name}'")
+        self.visit(node.value)
+    
+    def visit_IfStmt(self, node: IfStmt):
+        self.visit(node.condition)
+        self.visit(node.then_branch)
+        if node.else_branch is not None:
+            self.visit(node.else_branch)
+    
+    def visit_WhileStmt(self, node: WhileStmt):
+        self.visit(node.condition)
+        self.visit(node.body)
+    
+    def visit_ForStmt(self, node: 'ForStmt'):
+        self.visit(node.iterable)
+        self._visit_scoped([node.body], {node.variable.name})
+    
+    def visit_ReturnStmt(self, node: ReturnStmt):
+        if node.value is not None:
+            self.visit(node.value)
+    
+    def visit_BreakStmt(self, node: BreakStmt):
+        pass
+    
+    def visit_ContinueStmt(self, node: ContinueStmt):
+        pass
+    
+    def visit_ExprStmt(self, node: ExprStmt):
+        self.visit(node.expression)
+    
+    # ========== Expressions ==========
+    
+    def visit_Variable(self, node: Variable):
+        if not self._is_local(node.name):
+            raise ImpureError(f"reads non-local variable '{node.name}'")
+    
+    def visit_FuncCall(self, node: FuncCall):
+        if node.name in self.functions:
+            reason = self.impurity(node.name)
+            if reason is not None:
+                raise ImpureError(f"calls impure function '{node.name}' ({reason})")
+        elif node.name not in PURE_BUILTINS:
+            raise ImpureError(f"calls '{node.name}'")
+        for arg in node.arguments:
+            self.visit(arg)
+    
+    def visit_BinaryOp(self, node: BinaryOp):
+        self.visit(node.left)
+        self.visit(node.right)
+    
+    def visit_UnaryOp(self, node: UnaryOp):
+        self.visit(node.operand)
+    
+    def visit_NumberLiteral(self, node: NumberLiteral):
+        pass
+    
+    def visit_StringLiteral(self, node: StringLiteral):
+        pass
+    
+    def visit_BoolLiteral(self, node: BoolLiteral):
+        pass
+    
+    def visit_ListLiteral(self, node: 'ListLiteral'):
+        for element in node.elements:
+            self.visit(element)
+    
+    def visit_DictLiteral(self, node: 'DictLiteral'):
+        for key, value in node.pairs:
+            self.visit(key)
+            self.visit(value)
+    
+    def visit_ListComprehension(self, node: 'ListComprehension'):
+        self.visit(node.iterable)
+        self._visit_scoped([node.expression], {node.variable.name})
+    
+    def visit_IndexAccess(self, node: 'IndexAccess'):
+        self.visit(node.object)
+        self.visit(node.index)
+    
+    def visit_SliceAccess(self, node: 'SliceAccess'):
+        self.visit(node.object)
+        for bound in (node.start, node.end):
+            if bound is not None:
+                self.visit(bound)
+
+
+def _branch_list(branches: List[int]) -> str:
+    """1-based branch numbers for a message, the first few of a long list"""
+    shown = ", ".join(str(branch + 1) for branch in branches[:5])
+    if len(branches) > 5:
+        return f"{shown} and {len(branches) - 5} more"
+    return shown
+
+
+# List methods that change the list they are called on
+LIST_MUTATORS = frozenset({"append", "pop", "insert", "remove", "sort"})
+
+# Types whose values are shared, not copied, by assignment
+CONTAINER_TYPES = frozenset({"list", "dict", "any"})
+
+
+class Effects:
+    """
+    What running some code touches outside itself: the shared variables
+    (and the lists they name) it reads and writes, and the channels it uses.
+    returns holds what a function's return value may alias; links pairs a
+    shared variable with a location whose object it was assigned.
+    """
+    __slots__ = ('reads', 'writes', 'channels', 'returns', 'links')
+    
+    def __init__(self):
+        self.reads: Set[str] = set()
+        self.writes: Set[str] = set()
+        self.channels: Set[str] = set()
+        self.returns: Set[str] = set()
+        self.links: Set[Tuple[str, str]] = set()
+    
+    def conflicts(self, other: 'Effects') -> Set[str]:
+        """Locations one side writes and the other reads or writes"""
+        return (self.writes & (other.reads | other.writes)) | (other.writes & self.reads)
+    
+    def __eq__(self, other):
+        return (isinstance(other, Effects) and self.reads == other.reads
+                and self.writes == other.writes and self.channels == other.channels
+                and self.returns == other.returns and self.links == other.links)
+    
+    def __repr__(self):
+        return (f"Effects(reads={sorted(self.reads)}, writes={sorted(self.writes)}, "
+                f"channels={sorted(self.channels)})")
+
+
+class EffectAnalyzer:
+    """
+    Computes the effects of statements on the variables they share with the
+    surrounding code. A location is the name of a variable declared outside
+    the statement; inside a function summary, "#i" stands for whatever the
+    caller passes as parameter i. Lists are followed through local
+    variables, parameters, return values and indexing, so appending to a
+    parameter writes the caller's list. Summaries of recursive functions
+    are iterated until they stop growing.
+    """
+    
+    def __init__(self, functions: Dict[str, FuncDecl],
+                 kind_of: Callable[[str], Optional[str]]):
+        self.functions = functions
+        self.kind_of = kind_of  # Declared type of a name outside the code analyzed
+        self._summaries: Dict[str, Effects] = {}
+        self._pending: Dict[str, Effects] = {}
+        self._recursive: Set[str] = set()
+        # Locals in scope: name -> (declared type, locations its value may alias)
+        self._scopes: List[Dict[str, Tuple[str, Set[str]]]] = []
+        self._effects = Effects()
+    
+    def effects(self, node: ASTNode) -> Effects:
+        """Effects of running node; names it declares itself are not shared"""
+        return self._collect(node, {})
+    
+    def links(self, program: Program) -> Set[Tuple[str, str]]:
+        """Pairs of global variables that may end up naming the same object"""
+        saved = self._scopes, self._effects
+        self._scopes, self._effects = [{}], Effects()
+        try:
+            for declaration in program.declarations:
+                if isinstance(declaration, VarDecl):
+                    # Globals stay locations of their own
+                    if declaration.initializer is not None:
+                        aliases = self.visit(declaration.initializer)
+                        self._effects.links |= {(declaration.name, alias) for alias in aliases}
+                else:
+                    self.visit(declaration)
+            return self._effects.links
+        finally:
+            self._scopes, self._effects = saved
+    
+    def summary(self, name: str) -> Effects:
+        """Effects of calling function name, in terms of "#i" parameter locations"""
+        if name in self._summaries:
+            return self._summaries[name]
+        if name in self._pending:
+            # Recursive call: use what is known so far, the caller iterates
+            self._recursive.add(name)
+            return self._pending[name]
+        func = self.functions[name]
+        params = {param.name: (param.type, {f"#{i}"}) for i, param in enumerate(func.parameters)}
+        self._pending[name] = Effects()
+        try:
+            while True:
+                result = self._collect(func.body, params)
+                stable = result == self._pending[name] or name not in self._recursive
+                self._pending[name] = result
+                if stable:
+                    break
+        finally:
+            result = self._pending.pop(name)
+        # Within another function's iteration this result may still grow
+        if not self._pending:
+            self._summaries[name] = result
+        return result
+    
+    def _collect(self, node: ASTNode, names: Dict[str, Tuple[str, Set[str]]]) -> Effects:
+        saved = self._scopes, self._effects
+        self._scopes, self._effects = [dict(names)], Effects()
+        try:
+            self.visit(node)
+            return self._effects
+        finally:
+            self._scopes, self._effects = saved
+    
+    def visit(self, node: ASTNode) -> Set[str]:
+        """Record node's effects; returns the locations its value may alias"""
+        method = getattr(self, f'visit_{node.__class__.__name__}', None)
+        if method is None:
+            return self.generic_visit(node)
+        return method(node)
+    
+    def generic_visit(self, node: ASTNode) -> Set[str]:
+        """Visit every child node; the value is a new object aliasing nothing"""
+        for value in vars(node).values():
+            self._visit_all(value)
+        return set()
+    
+    def _visit_all(self, value):
+        if isinstance(value, ASTNode):
+            self.visit(value)
+        elif isinstance(value, (list, tuple)):
+            for item in value:
+                self._visit_all(item)
+    
+    def _local(self, name: str) -> Optional[Tuple[str, Set[str]]]:
+        for scope in reversed(self._scopes):
+            if name in scope:
+                return scope[name]
+        return None
+    
+    def _kind(self, name: str) -> Optional[str]:
+        local = self._local(name)
+        return local[0] if local is not None else self.kind_of(name)
+    
+    def _locations(self, name: str) -> Set[str]:
+        local = self._local(name)
+        return set(local[1]) if local is not None else {name}
+    
+    def _visit_scoped(self, statements: List[ASTNode], names: Dict[str, Tuple[str, Set[str]]]):
+        self._scopes.append(dict(names))
+        try:
+            for stmt in statements:
+                self.visit(stmt)
+        finally:
+            self._scopes.pop()
+    
+    # ========== Statements ==========
+    
+    def visit_Block(self, node: Block) -> Set[str]:
+        self._visit_scoped(node.statements, {})
+        return set()
+    
+    def visit_SeqBlock(self, node: SeqBlock) -> Set[str]:
+        self._visit_scoped(node.statements, {})
+        return set()
+    
+    def visit_VarDecl(self, node: VarDecl) -> Set[str]:
+        aliases = self.visit(node.initializer) if node.initializer is not None else set()
+        self._scopes[-1][node.name] = (node.type, aliases)
+        return set()
+    
+    def visit_Assignment(self, node: Assignment) -> Set[str]:
+        aliases = self.visit(node.value)
+        for scope in reversed(self._scopes):
+            if node.name in scope:
+                scope[node.name] = (scope[node.name][0], aliases)
+                return aliases
+        self._effects.writes.add(node.name)
+        self._effects.links |= {(node.name, alias) for alias in aliases}
+        return aliases
+    
+    def visit_ForStmt(self, node: 'ForStmt') -> Set[str]:
+        aliases = self.visit(node.iterable)
+        if isinstance(node.iterable, Variable) and self._kind(node.iterable.name) == "chan":
+            self._effects.channels |= aliases
+            aliases = set()
+        # Elements of a list of lists are the inner lists themselves
+        self._visit_scoped([node.body], {node.variable.name: (node.variable.type, aliases)})
+        return set()
+    
+    def visit_ParForStmt(self, node: 'ParForStmt') -> Set[str]:
+        self.visit(node.iterable)
+        self._visit_scoped([node.body], {node.variable.name: (node.variable.type, set())})
+        for _, name in node.reductions:
+            self._effects.reads |= self._locations(name)
+            self._effects.writes |= self._locations(name)
+        return set()
+    
+    def visit_ReturnStmt(self, node: ReturnStmt) -> Set[str]:
+        if node.value is not None:
+            self._effects.returns |= self.visit(node.value)
+        return set()
+    
+    def visit_ChannelDecl(self, node: ChannelDecl) -> Set[str]:
+        self._visit_all(node.arguments)
+        self._effects.channels.add(node.name)
+        return set()
+    
+    def visit_FuncDecl(self, node: FuncDecl) -> Set[str]:
+        return set()  # Its body runs when called, through its summary
+    
+    # ========== Expressions ==========
+    
+    def visit_Variable(self, node: Variable) -> Set[str]:
+        locations = self._locations(node.name)
+        # Naming a channel is not a data access; using it is recorded by the call
+        if self._kind(node.name) not in ("chan", "channel"):
+            self._effects.reads |= locations
+        return locations
+    
+    def visit_ListLiteral(self, node: ListLiteral) -> Set[str]:
+        aliases = set()
+        for element in node.elements:
+            aliases |= self.visit(element)
+        return aliases
+    
+    def visit_DictLiteral(self, node: DictLiteral) -> Set[str]:
+        aliases = set()
+        for key, value in node.pairs:
+            self.visit(key)
+            aliases |= self.visit(value)
+        return aliases
+    
+    def visit_IndexAccess(self, node: 'IndexAccess') -> Set[str]:
+        aliases = self.visit(node.object)
+        self.visit(node.index)
+        return aliases
+    
+    def visit_FuncCall(self, node: FuncCall) -> Set[str]:
+        args = [self.visit(arg) for arg in node.arguments]
+        if node.name not in self.functions:
+            return set()  # Builtins only touch their arguments, read above
+        summary = self.summary(node.name)
+        
+        def bind(locations: Set[str]) -> Set[str]:
+            bound = set()
+            for location in locations:
+                if location.startswith('#'):
+                    index = int(location[1:])
+                    if index < len(args):
+                        bound |= args[index]
+                else:
+                    bound.add(location)
+            return bound
+        
+        self._effects.reads |= bind(summary.reads)
+        self._effects.writes |= bind(summary.writes)
+        self._effects.channels |= bind(summary.channels)
+        for target, location in summary.links:
+            self._effects.links |= {(target, alias) for alias in bind({location})}
+        return bind(summary.returns)
+    
+    def visit_MethodCall(self, node: MethodCall) -> Set[str]:
+        self._visit_all(node.arguments)
+        kind = self._kind(node.object)
+        locations = self._locations(node.object)
+        if kind in ("chan", "channel"):
+            self._effects.channels |= locations
+            return set()
+        self._effects.reads |= locations
+        if kind == "list" and node.method in LIST_MUTATORS:
+            self._effects.writes |= locations
+        return set()
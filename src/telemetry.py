@@ -0,0 +1,248 @@
+"""
+Channel Telemetry for Minipar
+Per-channel request counters, byte counts, errors, active connections and
+latency histograms, with JSON and plaintext exporters. Recording a request
+costs one lock acquisition and a bisect, so telemetry stays on by default.
+"""
+
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+
+CHANNEL_KINDS = ('server', 'client')
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+# Latency bucket upper bounds in seconds: 1us to ~100s, four per doubling,
+# so reported quantiles are within ~19% of the true value
+_BUCKET_BOUNDS: List[float] = [1e-6 * 2 ** (i / 4) for i in range(4 * 27)]
+
+log = logging.getLogger('minipar.telemetry')
+
+
+class LatencyHistogram:
+    """Fixed log-scale buckets; not thread-safe on its own"""
+    __slots__ = ('counts', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.counts = [0] * (len(_BUCKET_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.counts[bisect.bisect_left(_BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other: 'LatencyHistogram'):
+        """Add another histogram's samples to this one"""
+        for index, count in enumerate(other.counts):
+            self.counts[index] += count
+        self.count += other.count
+        self.total += other.total
+        if other.max > self.max:
+            self.max = other.max
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the q-th quantile, in seconds"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                bound = _BUCKET_BOUNDS[index] if index < len(_BUCKET_BOUNDS) else self.max
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """Latency figures in milliseconds"""
+        result = {f"p{int(q * 100)}": round(self.quantile(q) * 1000, 3) for q in QUANTILES}
+        result['mean'] = round(self.total / self.count * 1000, 3) if self.count else 0.0
+        result['max'] = round(self.max * 1000, 3)
+        return result
+
+
+class ChannelStats:
+    """Counters for one server or client channel"""
+
+    def __init__(self, name: str, kind: str):
+        self.name = name
+        self.kind = kind
+        self.requests = 0
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.active = 0
+        self.latency = LatencyHistogram()
+        # Server channels also report their connection counters
+        self.server_metrics = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float, bytes_in: int, bytes_out: int):
+        """Account for one completed request"""
+        with self._lock:
+            self.requests += 1
+            self.bytes_in += bytes_in
+            self.bytes_out += bytes_out
+            self.latency.record(seconds)
+
+    def error(self):
+        with self._lock:
+            self.errors += 1
+
+    def connection(self, delta: int):
+        """Track connections opened (+1) and closed (-1)"""
+        with self._lock:
+            self.active += delta
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            result = {
+                'kind': self.kind,
+                'requests': self.requests,
+                'errors': self.errors,
+                'bytes_in': self.bytes_in,
+                'bytes_out': self.bytes_out,
+                'active': self.active,
+                'latency_ms': self.latency.summary(),
+            }
+        if self.server_metrics is not None:
+            metrics = self.server_metrics.snapshot()
+            result['active'] = metrics.pop('active')
+            result.update(metrics)
+        return result
+
+
+class Telemetry:
+    """Process-wide registry of channel statistics and their exporters"""
+
+    def __init__(self):
+        self.enabled = True
+        self.channels: Dict[str, ChannelStats] = {}
+        self._lock = threading.Lock()
+        self._http: Optional[ThreadingHTTPServer] = None
+        self._dump_stop: Optional[threading.Event] = None
+        self._dump_thread: Optional[threading.Thread] = None
+
+    def channel(self, name: str, kind: str) -> Optional[ChannelStats]:
+        """Stats object for a channel, or None while telemetry is disabled"""
+        if not self.enabled:
+            return None
+        key = f"{kind}:{name}"
+        with self._lock:
+            stats = self.channels.get(key)
+            if stats is None:
+                stats = self.channels[key] = ChannelStats(name, kind)
+            return stats
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Every channel's figures keyed by channel name"""
+        with self._lock:
+            channels = list(self.channels.values())
+        result = {}
+        for stats in channels:
+            # A program may use one name for a server and a client channel
+            key = stats.name if stats.name not in result else f"{stats.name} ({stats.kind})"
+            result[key] = stats.snapshot()
+        return result
+
+    def reset(self):
+        with self._lock:
+            self.channels.clear()
+
+    def render_text(self) -> str:
+        """Plaintext exposition, one 'metric{labels} value' per line"""
+        lines = []
+        with self._lock:
+            channels = list(self.channels.values())
+        for stats in channels:
+            snapshot = stats.snapshot()
+            labels = f'channel="{stats.name}",kind="{stats.kind}"'
+            for key, value in snapshot.items():
+                if key == 'latency_ms':
+                    for stat, ms in value.items():
+                        lines.append(f'minipar_channel_latency_ms{{{labels},stat="{stat}"}} {ms}')
+                elif key != 'kind':
+                    lines.append(f"minipar_channel_{key}{{{labels}}} {value}")
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path: str):
+        """Write a JSON snapshot, replacing the file atomically"""
+        data = {'time': time.time(), 'channels': self.snapshot()}
+        tmp = f"{path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp, path)
+
+    def start_dump(self, path: str, interval: float = 10.0):
+        """Dump to path every interval seconds (and once more on stop())"""
+        self._dump_stop = stop = threading.Event()
+
+        def run():
+            while not stop.wait(interval):
+                try:
+                    self.dump(path)
+                except OSError as e:
+                    log.error("could not write stats file %s: %s", path, e)
+            self.dump(path)
+
+        self._dump_thread = threading.Thread(target=run, name='telemetry-dump', daemon=True)
+        self._dump_thread.start()
+
+    def serve(self, port: int, host: str = '127.0.0.1') -> int:
+        """
+        Serve /metrics (plaintext) and /stats (JSON) on a side port from a
+        background thread; returns the bound port.
+        """
+        telemetry = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == '/metrics':
+                    body, kind = telemetry.render_text(), 'text/plain; version=0.0.4'
+                elif self.path == '/stats':
+                    body, kind = json.dumps(telemetry.snapshot(), indent=2), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', kind)
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                log.debug(format, *args)
+
+        self._http = ThreadingHTTPServer((host, port), Handler)
+        self._http.daemon_threads = True
+        threading.Thread(target=self._http.serve_forever, name='telemetry-http',
+                         daemon=True).start()
+        return self._http.server_address[1]
+
+    def stop(self):
+        """Stop the exporters started by start_dump() and serve()"""
+        if self._dump_stop is not None:
+            self._dump_stop.set()
+            self._dump_thread.join(5)
+            self._dump_stop = self._dump_thread = None
+        if self._http is not None:
+            self._http.shutdown()
+            self._http.server_close()
+            self._http = None
+
+
+# Shared by every runner in the process
+telemetry = Telemetry()
@@ -0,0 +1,438 @@
+"""
+Channel Transports for Minipar
+Selects how a channel reaches its peer from the host string:
+
+    "localhost"          TCP (the port argument is used)
+    "unix:/tmp/x.sock"   Unix domain socket at that path
+    "shm:name"           Shared-memory ring buffers for processes on one host
+
+Every transport hands out socket-like connections offering recv(),
+sendall(), close() and fileno(), so the channel layer is unaware of which
+one is in use.
+"""
+
+import os
+import select
+import socket
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, Optional, Tuple
+
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:  # Python without _posixshmem
+    shared_memory = None
+
+
+TRANSPORTS = ('tcp', 'unix', 'shm')
+
+# Several processes may listen on one TCP port (Linux, BSD, macOS)
+REUSE_PORT = hasattr(socket, 'SO_REUSEPORT')
+
+# Bytes of payload each shared-memory ring can hold
+SHM_RING_SIZE = 1024 * 1024
+
+# Seconds a waiting shm reader busy-polls before blocking; polling only
+# pays off when the peer can run on another CPU meanwhile
+SHM_SPIN_TIME = 50e-6 if (os.cpu_count() or 1) > 1 else 0.0
+
+
+def parse_address(host: str, port: Any = None) -> Tuple[str, Any]:
+    """Split a channel host string into (transport, target)"""
+    host = str(host)
+    if host.startswith('unix:'):
+        path = host[len('unix:'):]
+        if not path:
+            raise ValueError("unix: channel address needs a socket path")
+        return 'unix', path
+    if host.startswith('shm:'):
+        name = host[len('shm:'):]
+        if not name or not name.replace('_', '').replace('-', '').isalnum():
+            raise ValueError(f"Invalid shm: channel name '{name}'")
+        if shared_memory is None or not hasattr(socket, 'AF_UNIX'):
+            raise ValueError("shm: channels are not supported on this platform")
+        return 'shm', name
+    return 'tcp', (host, int(port))
+
+
+def parse_endpoint(spec: Any) -> Tuple[str, int]:
+    """Split an endpoint string such as 'localhost:8000' into (host, port)"""
+    spec = str(spec)
+    if spec.startswith(('unix:', 'shm:')):
+        parse_address(spec)
+        return spec, 0
+    host, sep, port = spec.rpartition(':')
+    if not sep or not host or not port.isdigit():
+        raise ValueError(f"Invalid channel endpoint '{spec}' (expected host:port)")
+    return host, int(port)
+
+
+def describe(transport: str, target: Any) -> str:
+    """Human-readable form of an address"""
+    if transport == 'tcp':
+        return f"{target[0]}:{target[1]}"
+    return f"{transport}:{target}"
+
+
+def tune_socket(sock: socket.socket, keepalive: bool = False):
+    """Disable Nagle (and optionally enable keepalive) on TCP sockets"""
+    if sock.family in (socket.AF_INET, socket.AF_INET6):
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        if keepalive:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+
+
+def create_listener(transport: str, target: Any, backlog: int, reuse_port: bool = False):
+    """
+    Bind and listen; the result has accept(), close() and fileno().
+    With reuse_port, other processes may bind the same TCP port and the
+    kernel spreads incoming connections between them.
+    """
+    if reuse_port and (transport != 'tcp' or not REUSE_PORT):
+        raise ValueError("Sharing a port between processes needs a TCP host and SO_REUSEPORT")
+    if transport == 'tcp':
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        try:
+            sock.bind(target)
+            sock.listen(backlog)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+    if transport == 'unix':
+        return _bind_unix(target, backlog)
+    return ShmListener(target, backlog)
+
+
+def connect(transport: str, target: Any, keepalive: bool = False):
+    """Open a connection to a listener created by create_listener()"""
+    if transport == 'tcp':
+        sock = socket.create_connection(target)
+        tune_socket(sock, keepalive)
+        return sock
+    if transport == 'unix':
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(target)
+        except OSError:
+            sock.close()
+            raise
+        return sock
+    return ShmConnection.connect(target)
+
+
+def close_listener(listener):
+    """Close a listener, removing the socket file a Unix listener leaves behind"""
+    if isinstance(listener, socket.socket) and listener.family == getattr(socket, 'AF_UNIX', None):
+        path = listener.getsockname()
+        listener.close()
+        if path and os.path.exists(path):
+            os.unlink(path)
+    else:
+        listener.close()
+
+
+def _bind_unix(path: str, backlog: int) -> socket.socket:
+    # A socket file left behind by a dead server would make bind() fail
+    if os.path.exists(path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(path)
+            raise OSError(f"Address already in use: {path}")
+        except (ConnectionRefusedError, FileNotFoundError):
+            os.unlink(path)
+        finally:
+            probe.close()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.bind(path)
+        sock.listen(backlog)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+# ========== Shared Memory Transport ==========
+#
+# Each connection owns two single-producer/single-consumer rings, one per
+# direction. A ring is a shared memory block starting with a header of
+# (head, tail, closed, waiting) words; the reader advances head, the writer
+# advances tail and sets closed on shutdown. A reader that finds its ring
+# empty polls briefly, then raises waiting and sleeps on the Unix socket
+# kept from the handshake; the writer only sends a wake-up byte over that
+# socket when waiting is raised, so a busy connection makes no syscalls
+# beyond the copies. The socket also reports a peer that dies.
+
+_RING_HEADER = struct.Struct('QQ')
+_HEAD, _TAIL, _CLOSED, _WAITING = 0, 8, 16, 24
+_DATA = 64
+
+# Longest a sleeping reader goes without re-checking its ring, which covers
+# a wake-up lost to the unsynchronised waiting flag
+_WAKE_INTERVAL = 0.001
+
+
+class ShmRing:
+    """One direction of a shared-memory connection"""
+
+    def __init__(self, shm, capacity: int = SHM_RING_SIZE):
+        self.shm = shm
+        self.buf = shm.buf
+        self.capacity = capacity
+
+    def available(self) -> int:
+        head, tail = _RING_HEADER.unpack_from(self.buf, 0)
+        return tail - head
+
+    def _flag(self, offset: int) -> bool:
+        return struct.unpack_from('Q', self.buf, offset)[0] != 0
+
+    def _set_flag(self, offset: int, value: bool):
+        struct.pack_into('Q', self.buf, offset, 1 if value else 0)
+
+    def is_closed(self) -> bool:
+        return self._flag(_CLOSED)
+
+    def close(self):
+        self._set_flag(_CLOSED, True)
+
+    def reader_waiting(self) -> bool:
+        return self._flag(_WAITING)
+
+    def set_waiting(self, waiting: bool):
+        self._set_flag(_WAITING, waiting)
+
+    def write(self, data: memoryview) -> int:
+        """Copy as much of data as fits; returns the number of bytes written"""
+        head, tail = _RING_HEADER.unpack_from(self.buf, 0)
+        n = min(len(data), self.capacity - (tail - head))
+        if n <= 0:
+            return 0
+        pos = tail % self.capacity
+        first = min(n, self.capacity - pos)
+        self.buf[_DATA + pos:_DATA + pos + first] = data[:first]
+        if n > first:
+            self.buf[_DATA:_DATA + n - first] = data[first:n]
+        # Publish the bytes only after they are in place
+        struct.pack_into('Q', self.buf, _TAIL, tail + n)
+        return n
+
+    def read(self, size: int) -> bytes:
+        """Take up to size buffered bytes (empty if none)"""
+        data = bytearray(min(size, self.available()))
+        return bytes(data[:self.read_into(memoryview(data))])
+
+    def read_into(self, target: memoryview) -> int:
+        """Copy buffered bytes straight into target; returns how many were taken"""
+        head, tail = _RING_HEADER.unpack_from(self.buf, 0)
+        n = min(len(target), tail - head)
+        if n <= 0:
+            return 0
+        pos = head % self.capacity
+        first = min(n, self.capacity - pos)
+        target[:first] = self.buf[_DATA + pos:_DATA + pos + first]
+        if n > first:
+            target[first:n] = self.buf[_DATA:_DATA + n - first]
+        struct.pack_into('Q', self.buf, _HEAD, head + n)
+        return n
+
+    def release(self):
+        self.buf = None
+        self.shm.close()
+
+
+class ShmConnection:
+    """Socket-like connection over a pair of shared-memory rings"""
+
+    def __init__(self, rx: ShmRing, tx: ShmRing, control: socket.socket):
+        self.rx = rx
+        self.tx = tx
+        self.control = control
+        self.control.setblocking(False)
+        self.family = socket.AF_UNIX
+        self._timeout: Optional[float] = None
+        self._closed = False
+        self._peer_gone = False
+
+    @classmethod
+    def connect(cls, name: str) -> 'ShmConnection':
+        control = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            control.connect(_rendezvous_path(name))
+            # Server announces "<client-to-server> <server-to-client>" ring names
+            reply = b''
+            while not reply.endswith(b'\n'):
+                chunk = control.recv(256)
+                if not chunk:
+                    raise ConnectionError(f"shm:{name} closed during handshake")
+                reply += chunk
+            c2s_name, s2c_name = reply.decode('ascii').split()
+            tx = ShmRing(_attach(c2s_name))
+            rx = ShmRing(_attach(s2c_name))
+            control.sendall(b'ok\n')
+        except Exception:
+            control.close()
+            raise
+        return cls(rx, tx, control)
+
+    def fileno(self) -> int:
+        return self.control.fileno()
+
+    def settimeout(self, timeout: Optional[float]):
+        """Like socket.settimeout: recv/sendall raise socket.timeout after this long"""
+        self._timeout = timeout
+
+    def gettimeout(self) -> Optional[float]:
+        return self._timeout
+
+    def _expired(self, started: float) -> bool:
+        return self._timeout is not None and time.perf_counter() - started >= self._timeout
+
+    def recv(self, size: int) -> bytes:
+        """Block until data arrives; b'' once the peer has closed"""
+        data = bytearray(size)
+        return bytes(data[:self.recv_into(data)])
+
+    def recv_into(self, buffer, nbytes: int = 0) -> int:
+        """Like socket.recv_into: block until data arrives; 0 once the peer has closed"""
+        target = memoryview(buffer)
+        if nbytes:
+            target = target[:nbytes]
+        rx = self.rx
+        if not rx.available():
+            started = time.perf_counter()
+            deadline = started + SHM_SPIN_TIME
+            while not rx.available() and time.perf_counter() < deadline:
+                pass
+            while not rx.available():
+                if self._closed or rx.is_closed() or self._peer_gone:
+                    if not rx.available():
+                        return 0
+                    break
+                if self._expired(started):
+                    raise socket.timeout("timed out")
+                rx.set_waiting(True)
+                # Re-check so a write that raced the flag is not slept through
+                if not rx.available():
+                    self._sleep(_WAKE_INTERVAL)
+                rx.set_waiting(False)
+        return rx.read_into(target)
+
+    def sendall(self, data: bytes):
+        view = memoryview(data)
+        delay = 0.00005
+        started = time.perf_counter()
+        while True:
+            if self._closed:
+                raise OSError("shm connection is closed")
+            written = self.tx.write(view)
+            view = view[written:]
+            if written and self.tx.reader_waiting():
+                self._wake_peer()
+            if not view:
+                return
+            # Ring full: give the reader time to drain it
+            if self.rx.is_closed() or self._peer_gone:
+                raise BrokenPipeError("shm peer closed the connection")
+            if not written:
+                if self._expired(started):
+                    raise socket.timeout("timed out")
+                self._sleep(delay)
+                delay = min(delay * 2, _WAKE_INTERVAL)
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            self.tx.close()
+            self._wake_peer()
+        finally:
+            self.rx.release()
+            self.tx.release()
+            self.control.close()
+
+    def _wake_peer(self):
+        try:
+            self.control.send(b'\0')
+        except (BlockingIOError, InterruptedError):
+            pass    # a wake-up is already pending
+        except OSError:
+            self._peer_gone = True
+
+    def _sleep(self, timeout: float):
+        """Block until the peer sends a wake-up byte or the timeout passes"""
+        readable, _, _ = select.select([self.control], [], [], timeout)
+        if readable:
+            try:
+                if not self.control.recv(4096):
+                    self._peer_gone = True
+            except OSError:
+                self._peer_gone = True
+
+
+class ShmListener:
+    """Accepts shm: connections through a rendezvous Unix socket"""
+
+    def __init__(self, name: str, backlog: int):
+        self.name = name
+        self.sock = _bind_unix(_rendezvous_path(name), backlog)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def fileno(self) -> int:
+        return self.sock.fileno()
+
+    def accept(self) -> Tuple[ShmConnection, str]:
+        control, _ = self.sock.accept()
+        with self._lock:
+            self._count += 1
+            prefix = f"mp{os.getpid()}_{self.name}_{self._count}"
+        c2s = s2c = None
+        try:
+            c2s = shared_memory.SharedMemory(f"{prefix}_c", create=True, size=_DATA + SHM_RING_SIZE)
+            s2c = shared_memory.SharedMemory(f"{prefix}_s", create=True, size=_DATA + SHM_RING_SIZE)
+            for shm in (c2s, s2c):
+                shm.buf[:_DATA] = bytes(_DATA)
+            control.sendall(f"{c2s.name} {s2c.name}\n".encode('ascii'))
+            if control.recv(16) != b'ok\n':
+                raise ConnectionError("shm client failed the handshake")
+        except Exception:
+            control.close()
+            for shm in (c2s, s2c):
+                if shm is not None:
+                    shm.close()
+                    shm.unlink()
+            raise
+        # Both sides are attached; the names are no longer needed
+        c2s.unlink()
+        s2c.unlink()
+        return ShmConnection(ShmRing(c2s), ShmRing(s2c), control), f"shm:{self.name}"
+
+    def close(self):
+        path = _rendezvous_path(self.name)
+        self.sock.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+def _rendezvous_path(name: str) -> str:
+    return os.path.join(tempfile.gettempdir(), f"minipar-shm-{name}.sock")
+
+
+def _attach(name: str):
+    # The creating side owns the segment; this side must not unlink it at exit
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:  # Python < 3.13 always registers with the resource tracker
+        shm = shared_memory.SharedMemory(name)
+    # A tracker shared with the creator (same process) must keep its entry
+    if not name.startswith(f"mp{os.getpid()}_"):
+        resource_tracker.unregister(shm._name, 'shared_memory')
+    return shm
@@ -0,0 +1,1906 @@
+"""
+Test Suite for Minipar Channel Runtime
+Starts real server channels on localhost and talks to them over sockets
+"""
+
+import sys
+import os
+import io
+import json
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import time
+import urllib.request
+
+# Fix encoding for Windows console
+if sys.platform == 'win32':
+    try:
+        sys.stdout.reconfigure(encoding='utf-8')
+        sys.stderr.reconfigure(encoding='utf-8')
+    except AttributeError:
+        sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
+        sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
+
+# Add parent directory to path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from src.runner import MiniparRunner
+from src.backend import Backend
+import threading
+
+from src.runtime_log import configure as configure_logging
+from src.channels import (ServerConfig, ServerMetrics, ClientConfig, ClientConnection,
+                          ClientPool, BalancedClient, SelectorServer, ChannelError,
+                          ChannelTimeoutError, encode_frame, FrameReader, MAX_OUTBUF)
+from src.transports import parse_address, create_listener
+from src.telemetry import telemetry, LatencyHistogram
+from src.loadgen import LoadConfig, run_load, format_report
+from src.semantic import PurityChecker, SemanticAnalyzer
+from src.csp import LocalChannel, ChannelClosedError
+from src.scheduler import WorkStealingScheduler
+from src.distributed import DistributedScheduler
+from src.green import GreenScheduler
+from src.ast_nodes import Assignment, FuncCall, NumberLiteral
+from src.lexer import Lexer
+from src.parser import Parser
+from src.codegen import CodeGenerator
+from src.c_codegen import CCodeGenerator
+
+
+def free_port() -> int:
+    """Ask the OS for a currently unused TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("localhost", 0))
+        return s.getsockname()[1]
+
+
+def wait_for(condition, timeout: float = 2.0) -> bool:
+    """Poll condition until it holds or the timeout expires"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return condition()
+
+
+def test_server_config():
+    print("Testing Server Config...")
+
+    config = ServerConfig.from_options({"workers": 2, "backlog": 16, "queue_size": 4})
+    assert (config.workers, config.backlog, config.queue_size) == (2, 16, 4)
+    print("  ✓ Options parsed")
+
+    for bad in ({"threads": 2}, {"workers": 0}, {"backlog": "many"}):
+        try:
+            ServerConfig.from_options(bad)
+            assert False, f"{bad} should be rejected"
+        except ValueError:
+            pass
+    print("  ✓ Invalid options rejected")
+
+    config = ServerConfig.from_options({"mode": "selector", "workers": 0})
+    assert config.mode == "selector" and config.workers == 0
+    try:
+        ServerConfig.from_options({"mode": "fork"})
+        assert False, "unknown mode should be rejected"
+    except ValueError:
+        pass
+    print("  ✓ Server modes validated")
+
+    print("✅ Server config tests passed!\n")
+
+
+def test_framing():
+    print("Testing Channel Framing...")
+
+    messages = ["+,10,5", "line one\nline two", "back\\slash", ""]
+    reader = FrameReader()
+    data = b"".join(encode_frame(m) for m in messages)
+    # Feed byte by byte to exercise partial frames
+    frames = []
+    for i in range(len(data)):
+        frames.extend(reader.feed(data[i:i + 1]))
+    assert [frame.text for frame in frames] == messages
+    print("  ✓ Frames survive escaping and partial reads")
+
+    frames = reader.feed(encode_frame("@not a header") + encode_frame("+,1,2", {"id": 7}))
+    assert frames[0].text == "@not a header" and frames[0].id is None
+    assert frames[1].text == "+,1,2" and frames[1].id == "7"
+    print("  ✓ Correlation id headers decoded")
+
+    # Small and large frames in one read, split across the batch boundary
+    reader = FrameReader(size=64)
+    messages = [f"ação {i}" for i in range(3000)] + ["@" + "x" * 100000, "tail"]
+    data = b"".join(encode_frame(m, {"id": i}) for i, m in enumerate(messages))
+    frames = reader.feed(data[:70000]) + reader.feed(data[70000:])
+    assert [frame.text for frame in frames] == messages
+    assert [frame.size for frame in frames] == [len(encode_frame(m, {"id": i}))
+                                                for i, m in enumerate(messages)]
+    assert reader.buffered() == 0
+    # The buffer grew for the large frame and shrinks back once it is consumed
+    reader.feed(encode_frame("small"))
+    assert len(reader.buf) == 64
+    print("  ✓ Receive buffer reused, grown and shrunk")
+
+    print("✅ Framing tests passed!\n")
+
+
+def test_worker_pool():
+    print("Testing Server Worker Pool...")
+
+    port = free_port()
+    runner = MiniparRunner()
+    runner.run_source(f"""
+    func echo(msg: string) -> string {{
+        return msg
+    }}
+    s_channel pool_server {{echo, "pool", "localhost", {port}, {{"workers": 1, "queue_size": 1}}}}
+    """)
+    metrics = runner.server_metrics["pool_server"]
+
+    # The single worker is held by the first client, the second waits in the
+    # queue and the third finds the queue full
+    clients = [socket.create_connection(("localhost", port))]
+    assert wait_for(lambda: metrics.snapshot()["active"] == 1)
+    clients += [socket.create_connection(("localhost", port)) for _ in range(2)]
+    assert wait_for(lambda: metrics.snapshot()["rejected"] == 1)
+    snapshot = metrics.snapshot()
+    assert snapshot["active"] == 1
+    assert snapshot["queue_depth"] == 1
+    print("  ✓ Excess connections rejected and counted")
+
+    clients[0].close()
+    assert wait_for(lambda: metrics.snapshot()["queue_depth"] == 0)
+    assert clients[1].recv(4096) == b"pool\n"
+    print("  ✓ Queued connection served when a worker frees up")
+
+    for client in clients[1:]:
+        client.close()
+
+    # In selector mode the pool runs requests; its queue shows in the
+    # server's metrics, while connections are still counted once
+    listener = create_listener("tcp", ("localhost", 0), 16)
+    release = threading.Event()
+    metrics = ServerMetrics()
+    server = SelectorServer(listener, "busy", lambda payload: release.wait(5) and payload,
+                            metrics, workers=1, queue_size=8)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = listener.getsockname()[1]
+    conns = [ClientConnection.connect("localhost", port) for _ in range(3)]
+    futures = [conn.submit(str(i)) for i, conn in enumerate(conns)]
+    assert wait_for(lambda: metrics.snapshot()["queue_depth"] == 2)
+    snapshot = metrics.snapshot()
+    assert snapshot["active"] == 3 and snapshot["rejected"] == 0
+    release.set()
+    assert [future.result() for future in futures] == ["0", "1", "2"]
+    assert metrics.snapshot()["queue_depth"] == 0 and metrics.snapshot()["completed"] == 0
+    for conn in conns:
+        conn.close()
+    listener.close()
+    print("  ✓ Selector server reports its pool's queue depth")
+
+    print("✅ Worker pool tests passed!\n")
+
+
+def test_selector_server():
+    print("Testing Selector Server...")
+
+    for workers in (0, 2):
+        port = free_port()
+        runner = MiniparRunner()
+        runner.run_source(f"""
+        func calcular(op: string, v1: number, v2: number) -> number {{
+            if (op == "+") {{
+                return v1 + v2
+            }}
+            return v1 * v2
+        }}
+        s_channel calc {{calcular, "calc", "localhost", {port}, {{"mode": "selector", "workers": {workers}}}}}
+        """)
+        metrics = runner.server_metrics["calc"]
+
+        # Many idle clients must not cost a thread each (counted once the
+        # server has answered a request, so its worker threads are running)
+        client = ClientConnection.connect("localhost", port)
+        assert client.request("+,0,0") == "0"
+        threads_before = threading.active_count()
+        idle = [ClientConnection.connect("localhost", port) for _ in range(200)]
+        assert wait_for(lambda: metrics.snapshot()["active"] == 201)
+        assert threading.active_count() == threads_before
+
+        assert client.description == "calc"
+        assert client.request("+,10,5") == "15"
+        assert client.request("*,6,7") == "42"
+
+        # Untagged frames sent back to back are answered in order
+        client.sock.sendall(encode_frame("+,1,1") + encode_frame("*,3,3"))
+        assert client.reader.read_frame().text == "2"
+        assert client.reader.read_frame().text == "9"
+
+        for conn in idle + [client]:
+            conn.close()
+        assert wait_for(lambda: metrics.snapshot()["active"] == 0)
+        print(f"  ✓ 200 idle clients and requests served (workers={workers})")
+
+    print("✅ Selector server tests passed!\n")
+
+
+def test_client_pool():
+    print("Testing Client Connection Pool...")
+
+    port = free_port()
+    server = MiniparRunner()
+    server.run_source(f"""
+    func double(x: number) -> number {{
+        return x * 2
+    }}
+    s_channel doubler {{double, "doubler", "localhost", {port}}}
+    """)
+    metrics = server.server_metrics["doubler"]
+
+    # Re-declaring a client inside a function reuses one pooled connection
+    client = MiniparRunner()
+    client.run_source(f"""
+    func ask(x: number) -> number {{
+        c_channel ch {{"localhost", {port}}}
+        var r: any = ch.send(x)
+        ch.close()
+        return r
+    }}
+    var total: number = 0
+    for (var i: number in [1, 2, 3, 4, 5]) {{
+        total = total + ask(i)
+    }}
+    """)
+    assert client.global_scope.get("total") == 30
+    assert metrics.snapshot()["accepted"] == 1
+    print("  ✓ Client channels reuse handshaken connections")
+
+    assert ClientConfig.from_options({"pool": False}).pool is False
+    client.run_source(f"""
+    c_channel direct {{"localhost", {port}, {{"pool": false}}}}
+    direct.close()
+    """)
+    assert wait_for(lambda: metrics.snapshot()["accepted"] == 2)
+    print("  ✓ Pooling can be disabled per channel")
+
+    # Cap, idle eviction and health checks on a private pool
+    pool = ClientPool(max_per_host=2, idle_timeout=0.1, acquire_timeout=0.2)
+    a = pool.acquire("localhost", port)
+    b = pool.acquire("localhost", port)
+    try:
+        pool.acquire("localhost", port)
+        assert False, "third connection should exceed the cap"
+    except ConnectionError:
+        pass
+    print("  ✓ Per-host cap enforced")
+
+    pool.release(a)
+    b.broken = True
+    pool.release(b)
+    assert pool.stats()[f"localhost:{port}"] == {"open": 1, "idle": 1}
+    time.sleep(0.2)
+    pool.evict_idle()
+    assert pool.stats()[f"localhost:{port}"] == {"open": 0, "idle": 0}
+    print("  ✓ Broken connections discarded and idle ones evicted")
+
+    print("✅ Client pool tests passed!\n")
+
+
+def test_pipelined_sends():
+    print("Testing Pipelined Sends...")
+
+    for mode in ("threads", "selector"):
+        port = free_port()
+        server = MiniparRunner()
+        server.run_source(f"""
+        func square(x: number) -> number {{
+            return x * x
+        }}
+        s_channel squares {{square, "squares", "localhost", {port}, {{"mode": "{mode}"}}}}
+        """)
+
+        client = MiniparRunner()
+        client.run_source(f"""
+        c_channel sq {{"localhost", {port}, {{"pool": false}}}}
+        var handles: list = [for (var i: number in [1, 2, 3, 4, 5]) -> sq.send_async(i)]
+        var first: any = await(handles[0])
+        var squares: list = wait_all(handles[1:])
+        var direct: any = sq.send(9)
+        """)
+        assert client.global_scope.get("first") == 1
+        assert client.global_scope.get("squares") == [4, 9, 16, 25]
+        assert client.global_scope.get("direct") == 81
+        print(f"  ✓ send_async/await/wait_all ({mode} server)")
+
+        # Many requests in flight on one connection, beyond the in-flight cap
+        conn = ClientConnection.connect("localhost", port)
+        conn.max_inflight = 64
+        futures = [conn.submit(str(i)) for i in range(1000)]
+        assert [f.result() for f in reversed(futures)] == [str(i * i) for i in reversed(range(1000))]
+        assert not conn.inflight and not conn.replies
+        conn.close()
+        print(f"  ✓ 1000 pipelined requests matched by correlation id ({mode} server)")
+
+    print("✅ Pipelined send tests passed!\n")
+
+
+def test_channel_logging():
+    print("Testing Channel Logging...")
+
+    port = free_port()
+    log = io.StringIO()
+    configure_logging("warning", {"loud_client": "debug"}, stream=log)
+    try:
+        MiniparRunner().run_source(f"""
+        func echo(msg: string) -> string {{
+            return msg
+        }}
+        s_channel loud {{echo, "loud", "localhost", {port}}}
+        c_channel quiet_client {{"localhost", {port}}}
+        c_channel loud_client {{"localhost", {port}}}
+        quiet_client.send("hidden")
+        loud_client.send("shown")
+        """)
+    finally:
+        configure_logging("warning")
+
+    output = log.getvalue()
+    assert "minipar.channel.loud_client request" in output
+    assert "sent='shown'" in output
+    assert "hidden" not in output
+    print("  ✓ Per-channel level enables only that channel's log lines")
+
+    print("✅ Channel logging tests passed!\n")
+
+
+def test_concurrent_handlers():
+    print("Testing Concurrent Handler Contexts...")
+
+    for mode in ("threads", "selector"):
+        port = free_port()
+        MiniparRunner().run_source(f"""
+        var served: number = 0
+        func work(x: number) -> number {{
+            var acc: number = 0
+            var i: number = 0
+            while (i < 30) {{
+                acc = acc + x
+                i = i + 1
+            }}
+            served = served + 1
+            return acc
+        }}
+        s_channel stress {{work, "stress", "localhost", {port}, {{"mode": "{mode}", "workers": 8}}}}
+        """)
+
+        errors = []
+
+        def client(k):
+            conn = ClientConnection.connect("localhost", port)
+            try:
+                for j in range(40):
+                    x = k * 1000 + j
+                    response = conn.request(str(x))
+                    if response != str(30 * x):
+                        errors.append((x, response))
+            except Exception as e:
+                errors.append(repr(e))
+            finally:
+                conn.close()
+
+        # Switch threads as often as possible to expose shared state
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=client, args=(k,)) for k in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            sys.setswitchinterval(interval)
+
+        assert not errors, errors[:5]
+        print(f"  ✓ 8 clients x 40 requests in parallel without scope corruption ({mode})")
+
+    print("✅ Concurrent handler tests passed!\n")
+
+
+def test_local_transports():
+    print("Testing Local Transports...")
+
+    assert parse_address("localhost", 8000) == ("tcp", ("localhost", 8000))
+    assert parse_address("unix:/tmp/calc.sock", 0) == ("unix", "/tmp/calc.sock")
+    assert parse_address("shm:calc", 0) == ("shm", "calc")
+    for bad in ("unix:", "shm:", "shm:../etc"):
+        try:
+            parse_address(bad, 0)
+            assert False, f"{bad} should be rejected"
+        except ValueError:
+            pass
+    print("  ✓ Host strings select the transport")
+
+    tag = f"{os.getpid()}_{int(time.time() * 1000) % 100000}"
+    hosts = [
+        ("threads", f"unix:{tempfile.gettempdir()}/minipar-test-{tag}-a.sock"),
+        ("selector", f"unix:{tempfile.gettempdir()}/minipar-test-{tag}-b.sock"),
+        ("threads", f"shm:test_{tag}"),
+    ]
+    for mode, host in hosts:
+        server = MiniparRunner()
+        server.run_source(f"""
+        func calcular(op: string, v1: number, v2: number) -> number {{
+            if (op == "+") {{
+                return v1 + v2
+            }}
+            return v1 * v2
+        }}
+        s_channel local_calc {{calcular, "local", "{host}", 0, {{"mode": "{mode}"}}}}
+        """)
+
+        client = MiniparRunner()
+        client.run_source(f"""
+        c_channel calc {{"{host}", 0, {{"pool": false}}}}
+        var sum: any = calc.send("+", 10, 5)
+        var handles: list = [for (var i: number in [1, 2, 3]) -> calc.send_async("*", i, i)]
+        var squares: list = wait_all(handles)
+        calc.close()
+        """)
+        assert client.global_scope.get("sum") == 15
+        assert client.global_scope.get("squares") == [1, 4, 9]
+
+        # Large payloads cross the shared-memory ring in several pieces
+        conn = ClientConnection.connect(host, 0)
+        big = "x" * (3 * 1024 * 1024)
+        assert conn.request(f"+,{big},") == big
+        conn.close()
+        assert wait_for(lambda: server.server_metrics["local_calc"].snapshot()["active"] == 0)
+        print(f"  ✓ {host.split(':')[0]}: channel served ({mode})")
+
+    try:
+        MiniparRunner().run_source(f"""
+        func echo(msg: string) -> string {{
+            return msg
+        }}
+        s_channel bad {{echo, "bad", "shm:bad_{tag}", 0, {{"mode": "selector"}}}}
+        """)
+        assert False, "selector mode over shm should be rejected"
+    except ValueError:
+        pass
+    print("  ✓ Selector mode over shm rejected")
+
+    print("✅ Local transport tests passed!\n")
+
+
+def start_replica(name: str, port: int) -> MiniparRunner:
+    """Server channel that answers every request with its own name"""
+    runner = MiniparRunner()
+    runner.run_source(f"""
+    func who(x: number) -> string {{
+        return "{name}"
+    }}
+    s_channel replica {{who, "{name}", "localhost", {port}}}
+    """)
+    return runner
+
+
+def test_load_balancing():
+    print("Testing Client Load Balancing...")
+
+    ports = [free_port() for _ in range(3)]
+    for name, port in zip("abc", ports):
+        start_replica(name, port)
+
+    client = MiniparRunner()
+    client.run_source(f"""
+    c_channel lb {{["localhost:{ports[0]}", "localhost:{ports[1]}", "localhost:{ports[2]}"]}}
+    var seen: list = [for (var i: number in [1, 2, 3, 4, 5, 6]) -> lb.send(i)]
+    lb.close()
+    """)
+    assert client.global_scope.get("seen") == ["a", "b", "c", "a", "b", "c"]
+    print("  ✓ Round-robin across replicas")
+
+    endpoints = [("localhost", port) for port in ports]
+    config = ClientConfig.from_options({"policy": "least_outstanding", "pool": False})
+    lb = BalancedClient(endpoints, config)
+    busy = [lb.endpoints[0].conn.submit("1") for _ in range(3)]
+    futures = [lb.submit("1") for _ in range(4)]
+    assert sorted(f.result() for f in futures) == ["b", "b", "c", "c"]
+    assert [f.result() for f in busy] == ["a"] * 3
+    lb.release()
+    print("  ✓ Least-outstanding avoids the busy replica")
+
+    # One replica down at start, one failing mid-run
+    down = free_port()
+    config = ClientConfig.from_options({"pool": False, "retry_backoff": 0.1})
+    lb = BalancedClient(endpoints[:2] + [("localhost", down)], config)
+    assert [e["up"] for e in lb.stats()] == [True, True, False]
+    lb.endpoints[1].conn.sock.close()
+    assert {lb.request("1") for _ in range(4)} == {"a"}
+    assert [e["up"] for e in lb.stats()] == [True, False, False]
+    print("  ✓ Failed endpoints ejected, requests retried elsewhere")
+
+    start_replica("d", down)
+    time.sleep(0.25)
+    assert {lb.request("1") for _ in range(6)} == {"a", "b", "d"}
+    assert all(e["up"] and e["failures"] == 0 for e in lb.stats())
+    lb.release()
+    print("  ✓ Ejected endpoints restored after backoff")
+
+    try:
+        BalancedClient([("localhost", free_port()), ("localhost", free_port())], config)
+        assert False, "no reachable endpoint should fail"
+    except ConnectionRefusedError:
+        pass
+    for bad in ({"policy": "random"}, {"retry_backoff": 0}):
+        try:
+            ClientConfig.from_options(bad)
+            assert False, f"{bad} should be rejected"
+        except ValueError:
+            pass
+    print("  ✓ Unreachable replica sets and bad options rejected")
+
+    print("✅ Load balancing tests passed!\n")
+
+
+def test_prefork_server():
+    print("Testing Pre-forked Server Processes...")
+
+    port = free_port()
+    server = MiniparRunner()
+    server.run_source(f"""
+    var factor: number = 3
+    func triple(x: number) -> number {{
+        return x * factor
+    }}
+    s_channel tri {{triple, "tri", "localhost", {port}, {{"processes": 2}}}}
+    """)
+    supervisor = server.supervisors["tri"]
+    try:
+        pids = supervisor.pids()
+        assert len(pids) == 2 and os.getpid() not in pids
+        for i in range(10):
+            conn = ClientConnection.connect("localhost", port)
+            assert conn.request(str(i)) == str(3 * i)
+            conn.close()
+        print("  ✓ Processes share the port and see the program's globals")
+
+        os.kill(pids[0], signal.SIGKILL)
+        assert wait_for(lambda: supervisor.restarts == 1 and len(supervisor.pids()) == 2, 10)
+        assert pids[0] not in supervisor.pids()
+        conn = ClientConnection.connect("localhost", port)
+        assert conn.request("7") == "21"
+        conn.close()
+        print("  ✓ Dead server process replaced")
+    finally:
+        server.cleanup()
+    assert supervisor.pids() == []
+    print("  ✓ Server processes stopped on cleanup")
+
+    try:
+        MiniparRunner().run_source(f"""
+        func echo(msg: string) -> string {{
+            return msg
+        }}
+        s_channel bad {{echo, "bad", "unix:/tmp/minipar-prefork.sock", 0, {{"processes": 2}}}}
+        """)
+        assert False, "processes over unix: should be rejected"
+    except ValueError:
+        pass
+    print("  ✓ Processes option requires TCP")
+
+    print("✅ Pre-forked server tests passed!\n")
+
+
+def test_channel_telemetry():
+    print("Testing Channel Telemetry...")
+
+    histogram = LatencyHistogram()
+    for ms in range(1, 101):
+        histogram.record(ms / 1000)
+    summary = histogram.summary()
+    assert 45 <= summary["p50"] <= 60 and 85 <= summary["p90"] <= 108
+    assert 95 <= summary["p99"] <= 100 and summary["max"] == 100
+    print("  ✓ Histogram quantiles within bucket precision")
+
+    telemetry.reset()
+    port = free_port()
+    runner = MiniparRunner()
+    runner.run_source(f"""
+    func divide(a: number, b: number) -> number {{
+        return a / b
+    }}
+    s_channel tele_server {{divide, "tele", "localhost", {port}}}
+    c_channel tele_client {{"localhost", {port}, {{"pool": false}}}}
+    var answers: list = [for (var i: number in [1, 2, 4]) -> tele_client.send(8, i)]
+    var during: dict = stats()
+    var p99: number = during["tele_client"]["latency_ms"]["p99"]
+    var served: number = stats()["tele_server"]["requests"]
+    tele_client.close()
+    """)
+    during = runner.global_scope.get("during")
+    server, client = during["tele_server"], during["tele_client"]
+    assert server["kind"] == "server" and client["kind"] == "client"
+    assert server["requests"] == client["requests"] == 3
+    assert server["bytes_in"] == client["bytes_out"] > 0
+    assert server["bytes_out"] == client["bytes_in"] > 0
+    assert server["accepted"] == 1 and server["active"] == 1 and client["active"] == 1
+    assert 0 < client["latency_ms"]["p50"] <= client["latency_ms"]["p99"]
+    assert runner.global_scope.get("p99") == client["latency_ms"]["p99"]
+    assert runner.global_scope.get("served") == 3
+    print("  ✓ stats() reports requests, bytes and latency per channel, read by key")
+
+    # Dividing by zero fails the handler and drops the client's connection
+    configure_logging("off")
+    try:
+        conn = ClientConnection.connect("localhost", port)
+        conn.bind_stats(telemetry.channel("tele_client", "client"))
+        try:
+            conn.request("1,0")
+            assert False, "the failed request should raise"
+        except ConnectionError:
+            pass
+        conn.close()
+        assert wait_for(lambda: telemetry.snapshot()["tele_server"]["errors"] == 1)
+    finally:
+        configure_logging("warning")
+    snapshot = telemetry.snapshot()
+    assert snapshot["tele_client"]["errors"] == 1 and snapshot["tele_client"]["active"] == 0
+    print("  ✓ Handler and connection errors counted")
+
+    path = os.path.join(tempfile.gettempdir(), f"minipar-stats-{os.getpid()}.json")
+    telemetry.start_dump(path, interval=60)
+    metrics_port = telemetry.serve(0)
+    try:
+        text = urllib.request.urlopen(f"http://127.0.0.1:{metrics_port}/metrics").read().decode()
+        assert 'minipar_channel_requests{channel="tele_server",kind="server"} 3' in text
+        assert 'minipar_channel_latency_ms{channel="tele_client",kind="client",stat="p99"}' in text
+    finally:
+        telemetry.stop()
+    with open(path, encoding="utf-8") as f:
+        assert json.load(f)["channels"]["tele_server"]["requests"] == 3
+    os.unlink(path)
+    print("  ✓ Plaintext endpoint and JSON dump exported")
+
+    print("✅ Channel telemetry tests passed!\n")
+
+
+def test_load_generator():
+    print("Testing Load Generator...")
+
+    port = free_port()
+    runner = MiniparRunner()
+    runner.run_source(f"""
+    func calcular(op: string, v1: number, v2: number) -> number {{
+        return v1 + v2
+    }}
+    s_channel load_server {{calcular, "load", "localhost", {port}}}
+    """)
+    try:
+        config = LoadConfig("localhost", port, connections=3, duration=0.5, warmup=0.1,
+                            pipeline=2)
+        result = run_load(config)
+        summary = result.summary()
+        assert result.errors == 0 and result.requests > 0
+        assert summary["throughput"] == result.requests / 0.5
+        assert result.latency.count == result.requests
+        assert 0 < summary["latency_ms"]["p50"] <= summary["latency_ms"]["p99.9"]
+        assert "Throughput:" in format_report(config, result)
+        print(f"  ✓ Closed loop: {result.requests} requests over 3 connections")
+
+        config = LoadConfig("localhost", port, connections=2, duration=0.5, warmup=0.1,
+                            rate=200, messages=["+,{i},{c}"])
+        result = run_load(config)
+        assert result.errors == 0 and 90 <= result.requests <= 101
+        print(f"  ✓ Fixed rate: {result.requests} requests at 200 req/s")
+
+        merged = LatencyHistogram()
+        merged.merge(result.latency)
+        merged.merge(result.latency)
+        assert merged.count == 2 * result.latency.count and merged.max == result.latency.max
+        print("  ✓ Histograms from several generators merge")
+    finally:
+        runner.cleanup()
+
+    result = run_load(LoadConfig("localhost", free_port(), connections=2, duration=0.1, warmup=0))
+    assert result.requests == 0 and result.errors == 2
+    print("  ✓ Refused connections reported as errors")
+
+    print("✅ Load generator tests passed!\n")
+
+
+def test_server_readiness():
+    print("Testing Server Readiness...")
+
+    taken = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    taken.bind(("localhost", 0))
+    taken.listen()
+    port = taken.getsockname()[1]
+
+    runner = MiniparRunner()
+    start = time.perf_counter()
+    runner.run_source("""
+    func echo(msg: string) -> string {
+        return msg
+    }
+    s_channel ready_a {echo, "a", "localhost", 0}
+    s_channel ready_b {echo, "b", "localhost", 0}
+    s_channel ready_c {echo, "c", "localhost", 0}
+    """)
+    elapsed = time.perf_counter() - start
+    assert elapsed < 0.4, f"three servers took {elapsed:.2f}s to start"
+    print(f"  ✓ Three servers listening after {elapsed * 1000:.0f}ms")
+
+    try:
+        runner.run_source(f"""
+        func echo(msg: string) -> string {{
+            return msg
+        }}
+        s_channel ready_taken {{echo, "taken", "localhost", {port}}}
+        var after: number = 1
+        """)
+        assert False, "binding a used port should fail"
+    except OSError as e:
+        assert "ready_taken" in str(e) and str(port) in str(e)
+    assert "ready_taken" not in runner.servers
+    print("  ✓ Port conflict raised in the declaring thread")
+
+    runner.cleanup()
+    taken.close()
+    print("✅ Server readiness tests passed!\n")
+
+
+def test_response_cache():
+    print("Testing Response Cache...")
+
+    port = free_port()
+    runner = MiniparRunner()
+    runner.run_source(f"""
+    var hits: number = 0
+    func square(x: number) -> number {{
+        return x * x
+    }}
+    func norm(a: number, b: number) -> number {{
+        var total: number = 0
+        for (var v: number in [a, b]) {{
+            total = total + square(v)
+        }}
+        return total
+    }}
+    func counted(x: number) -> number {{
+        hits = hits + 1
+        return x
+    }}
+    func noisy(x: number) -> number {{
+        print(x)
+        return x
+    }}
+    func scaled(x: number) -> number {{
+        return x * hits
+    }}
+    func fact(n: number) -> number {{
+        if (n <= 1) {{
+            return 1
+        }}
+        return n * fact(n - 1)
+    }}
+    func wrapper(x: number) -> number {{
+        return counted(x)
+    }}
+    s_channel cached {{norm, "norm", "localhost", {port}, {{"cache": 2, "cache_ttl": 0.3}}}}
+    """)
+
+    checker = PurityChecker(runner.functions)
+    assert checker.is_pure("norm") and checker.is_pure("square") and checker.is_pure("fact")
+    assert "non-local variable 'hits'" in checker.impurity("counted")
+    assert "calls 'print'" in checker.impurity("noisy")
+    assert "reads non-local variable 'hits'" in checker.impurity("scaled")
+    assert "impure function 'counted'" in checker.impurity("wrapper")
+    print("  ✓ Purity checker accepts pure handlers and explains impure ones")
+
+    try:
+        runner.run_source(f"""
+        var hits: number = 0
+        func counted(x: number) -> number {{
+            hits = hits + 1
+            return x
+        }}
+        s_channel uncached {{counted, "counted", "localhost", {free_port()}, {{"cache": 10}}}}
+        """)
+        assert False, "caching an impure handler should be refused"
+    except ValueError as e:
+        assert "side-effect-free" in str(e) and "'hits'" in str(e)
+    print("  ✓ Cache refused for a handler with side effects")
+
+    metrics = runner.server_metrics["cached"]
+    client = ClientConnection.connect("localhost", port)
+    assert [client.request("3,4") for _ in range(3)] == ["25"] * 3
+    assert client.request("3.0,4") == "25.0" and client.request("6,8") == "100"
+    snapshot = metrics.snapshot()
+    assert snapshot["cache_hits"] == 2 and snapshot["cache_misses"] == 3
+    assert snapshot["cache_entries"] == 2
+    print("  ✓ Repeated requests answered from the cache, LRU bounded")
+
+    time.sleep(0.35)
+    assert client.request("6,8") == "100"
+    assert metrics.snapshot()["cache_misses"] == 4
+    print("  ✓ Entries expire after cache_ttl")
+
+    client.close()
+    runner.cleanup()
+    print("✅ Response cache tests passed!\n")
+
+
+def test_timeouts_and_deadlines():
+    print("Testing Timeouts, Deadlines and Backpressure...")
+
+    config = ClientConfig.from_options({"recv_timeout": 0.5, "deadline": 1, "max_inflight": 4})
+    assert config.recv_timeout == 0.5 and config.deadline == 1.0 and config.max_inflight == 4
+    for bad in ({"max_inflight": 0}, {"deadline": -1}, {"send_timeout": "1"}):
+        try:
+            ClientConfig.from_options(bad)
+            assert False, f"{bad} should be rejected"
+        except ValueError:
+            pass
+    print("  ✓ Timeout options validated")
+
+    port = free_port()
+    runner = MiniparRunner()
+    runner.run_source(f"""
+    func slow(n: number) -> number {{
+        var i: number = 0
+        while (i < n) {{
+            i = i + 1
+        }}
+        return n
+    }}
+    s_channel slow_server {{slow, "slow", "localhost", {port}, {{"mode": "selector", "workers": 1}}}}
+    """)
+    metrics = runner.server_metrics["slow_server"]
+
+    conn = ClientConnection.connect("localhost", port)
+    conn.configure(ClientConfig.from_options({"recv_timeout": 0.05}))
+    start = time.perf_counter()
+    try:
+        conn.request("100000")
+        assert False, "the slow request should time out"
+    except ChannelTimeoutError:
+        pass
+    assert time.perf_counter() - start < 0.5
+    print("  ✓ recv_timeout bounds the wait for a slow reply")
+
+    # Requests queued behind the slow one expire on the server unanswered
+    futures = [conn.submit("1", deadline=0.02) for _ in range(3)]
+    for future in futures:
+        try:
+            future.result()
+            assert False, "queued requests should miss their deadline"
+        except ChannelTimeoutError:
+            pass
+    assert wait_for(lambda: metrics.snapshot()["expired"] == 3, timeout=10)
+    conn.configure(None)
+    assert conn.request("7") == "7" and not conn.abandoned
+    assert conn.is_healthy()
+    conn.close()
+    print("  ✓ Deadlines sent to the server, expired requests skipped")
+
+    try:
+        runner.run_source(f"""
+        c_channel hurried {{"localhost", {port}, {{"deadline": 0.05, "pool": false}}}}
+        var r: any = hurried.send(100000)
+        """)
+        assert False, "the channel deadline should abort the send"
+    except ChannelTimeoutError:
+        pass
+    print("  ✓ c_channel deadline option applied to send()")
+    runner.cleanup()
+
+    # A producer flooding a slow selector server is pushed back
+    listener = create_listener("tcp", ("localhost", 0), 16)
+    flood_port = listener.getsockname()[1]
+
+    def handler(payload: str) -> str:
+        time.sleep(0.3)
+        return "ok"
+
+    server = SelectorServer(listener, "flood", handler, ServerMetrics(), workers=1,
+                            max_pending=1)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    conn = ClientConnection.connect("localhost", flood_port)
+    conn.configure(ClientConfig.from_options({"send_timeout": 0.2, "max_inflight": 100000}))
+    payload = "x" * 100000
+    sent = 0
+    try:
+        for _ in range(2000):
+            conn.submit(payload)
+            sent += 1
+        assert False, "sends should block once the server stops reading"
+    except ChannelTimeoutError:
+        pass
+    assert conn.broken and 0 < sent < 2000
+    assert max(len(c.pending) for c in server.connections.values()) <= 1 + 65536 // len(payload) + 1
+    conn.close()
+    listener.close()
+    print(f"  ✓ Server stopped reading; send_timeout fired after {sent} requests")
+
+    print("✅ Timeout and deadline tests passed!\n")
+
+
+def test_streaming():
+    print("Testing Streamed Responses...")
+
+    runner = MiniparRunner()
+    ports = {}
+    for mode, workers in (("threads", 2), ("selector", 0), ("selector", 2)):
+        port = ports[(mode, workers)] = free_port()
+        runner.run_source(f"""
+        func squares(n: number) -> void {{
+            var i: number = 1
+            while (i <= n) {{
+                emit(i * i)
+                i = i + 1
+            }}
+        }}
+        s_channel stream_{mode}_{workers} {{squares, "squares", "localhost", {port},
+                                           {{"mode": "{mode}", "workers": {workers}}}}}
+        """)
+
+    for (mode, workers), port in ports.items():
+        client = MiniparRunner()
+        client.run_source(f"""
+        c_channel ch {{"localhost", {port}}}
+        var seen: list = []
+        for (var x: number in ch.stream(4)) {{
+            seen.append(x)
+        }}
+        var early: list = []
+        for (var x: number in ch.stream(1000)) {{
+            if (x > 9) {{
+                break
+            }}
+            early.append(x)
+        }}
+        var whole: any = ch.send(3)
+        """)
+        assert client.global_scope.get("seen") == [1, 4, 9, 16], mode
+        assert client.global_scope.get("early") == [1, 4, 9], mode
+        # The items still in flight after the break are discarded
+        assert client.global_scope.get("whole") == "[1, 4, 9]", mode
+        client.cleanup()
+    print("  ✓ emit() items iterated with a for loop in threads and selector modes")
+    print("  ✓ Breaking out of a stream keeps the channel usable")
+
+    port = free_port()
+    runner.run_source(f"""
+    func letters(s: string) -> list {{
+        return ["a", "b", s]
+    }}
+    s_channel letter_server {{letters, "letters", "localhost", {port}}}
+    """)
+    conn = ClientConnection.connect("localhost", port)
+    assert list(conn.stream("c")) == ["a", "b", "c"]
+    assert conn.request("d") == "['a', 'b', 'd']"
+    assert conn.is_healthy()
+    conn.close()
+    print("  ✓ Returned lists stream item by item")
+
+    # The first item reaches the client while the handler is still running
+    listener = create_listener("tcp", ("localhost", 0), 16)
+    release = threading.Event()
+
+    def stream_handler(payload, emit):
+        emit("first")
+        release.wait(5)
+        emit("second")
+
+    server = SelectorServer(listener, "stream", lambda payload: payload, ServerMetrics(),
+                            workers=1, stream_handler=stream_handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    conn = ClientConnection.connect("localhost", listener.getsockname()[1])
+    stream = conn.stream("go")
+    assert next(stream) == "first" and not release.is_set()
+    release.set()
+    assert list(stream) == ["second"]
+    assert conn.request("echo") == "echo"
+    conn.close()
+    listener.close()
+    print("  ✓ Items arrive before the handler finishes")
+
+    # Inline handlers wait for a lagging client instead of buffering the stream
+    listener = create_listener("tcp", ("localhost", 0), 16)
+    item = "x" * 65536
+    buffered = []
+
+    def bulk_handler(payload, emit):
+        for _ in range(256):
+            emit(item)
+            buffered.append(max(len(c.outbuf) for c in server.connections.values()))
+
+    server = SelectorServer(listener, "bulk", lambda payload: payload, ServerMetrics(),
+                            stream_handler=bulk_handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    conn = ClientConnection.connect("localhost", listener.getsockname()[1])
+    stream = conn.stream("go")
+    time.sleep(0.5)
+    assert all(text == item for text in stream) and len(buffered) == 256
+    assert max(buffered) < MAX_OUTBUF + 2 * len(item), max(buffered)
+    assert conn.request("echo") == "echo"
+    conn.close()
+    listener.close()
+    print("  ✓ Inline streams respect the output buffer limit")
+
+    try:
+        MiniparRunner().run_source("emit(1)")
+        assert False, "emit() outside a handler should fail"
+    except RuntimeError:
+        pass
+    print("  ✓ emit() outside a server handler rejected")
+
+    runner.cleanup()
+    print("✅ Streaming tests passed!\n")
+
+
+def test_multiplexed_rpc():
+    print("Testing Multi-Function Server Channels...")
+
+    for bad in ({"multiplex": 2}, {"mode": "selector", "workers": 0, "multiplex": 2},
+                {"multiplex": 0}):
+        try:
+            ServerConfig.from_options(bad)
+            assert False, f"{bad} should be rejected"
+        except ValueError:
+            pass
+    print("  ✓ multiplex needs selector mode with workers")
+
+    runner = MiniparRunner()
+    ports = {}
+    for options in ('{"workers": 2}', '{"mode": "selector", "workers": 2, "multiplex": 4}'):
+        port = ports[options] = free_port()
+        runner.run_source(f"""
+        func add(a: number, b: number) -> number {{
+            return a + b
+        }}
+        func sub(a: number, b: number) -> number {{
+            return a - b
+        }}
+        func upto(n: number) -> void {{
+            var i: number = 0
+            while (i < n) {{
+                emit(i)
+                i = i + 1
+            }}
+        }}
+        func spin(n: number) -> number {{
+            var i: number = 0
+            while (i < n) {{
+                i = i + 1
+            }}
+            return n
+        }}
+        s_channel math_{len(ports)} {{[add, sub, upto, spin], "math", "localhost", {port}, {options}}}
+        """)
+
+    for options, port in ports.items():
+        metrics = runner.server_metrics[f"math_{list(ports).index(options) + 1}"]
+        client = MiniparRunner()
+        client.run_source(f"""
+        c_channel m {{"localhost", {port}}}
+        var sum: any = m.call("add", 2, 3)
+        var diff: any = m.call("sub", 2, 3)
+        var default: any = m.send(10, 1)
+        var both: list = wait_all([m.call_async("add", 1, 1), m.call_async("sub", 9, 1)])
+        var items: list = []
+        for (var x: number in m.call_stream("upto", 3)) {{
+            items.append(x)
+        }}
+        """)
+        scope = client.global_scope
+        assert (scope.get("sum"), scope.get("diff"), scope.get("default")) == (5, -1, 11)
+        assert scope.get("both") == [2, 8] and scope.get("items") == [0, 1, 2]
+        # Every function was reached over the one client connection
+        assert metrics.snapshot()["accepted"] == 1, options
+        client.cleanup()
+
+        conn = ClientConnection.connect("localhost", port)
+        try:
+            conn.request("1", fn="mul")
+            assert False, "an unknown function should be an error"
+        except ChannelError as e:
+            assert "unknown function 'mul'" in str(e)
+        assert conn.request("7,2", fn="sub") == "5"
+        conn.close()
+    print("  ✓ Functions called by name, pipelined and streamed over one connection")
+    print("  ✓ Unknown function names answered with an error")
+
+    # With multiplex a quick call on the same connection overtakes a slow one
+    conn = ClientConnection.connect("localhost", ports['{"mode": "selector", "workers": 2, "multiplex": 4}'])
+    start = time.perf_counter()
+    slow = conn.submit("50000", fn="spin")
+    quick = conn.submit("1,2", fn="add")
+    assert quick.result() == "3"
+    quick_time = time.perf_counter() - start
+    assert slow.result() == "50000"
+    slow_time = time.perf_counter() - start
+    assert quick_time < slow_time / 2, (quick_time, slow_time)
+    conn.close()
+    print(f"  ✓ Concurrent calls on one connection ({quick_time * 1000:.0f}ms vs "
+          f"{slow_time * 1000:.0f}ms)")
+
+    runner.cleanup()
+    print("✅ Multi-function server tests passed!\n")
+
+
+def test_local_channels():
+    print("Testing Channels Between PAR Branches...")
+
+    try:
+        LocalChannel(0)
+        assert False, "capacity 0 should be rejected"
+    except ValueError:
+        pass
+    q = LocalChannel(2)
+    q.put(1)
+    q.put(2)
+    blocked = threading.Thread(target=q.put, args=(3,))
+    blocked.start()
+    time.sleep(0.05)
+    assert blocked.is_alive() and len(q) == 2, "put() on a full channel should wait"
+    assert q.get() == 1
+    blocked.join(1)
+    assert not blocked.is_alive() and len(q) == 2
+    q.close()
+    assert list(q) == [2, 3], "a closed channel is drained before iteration stops"
+    try:
+        q.put(4)
+        assert False, "put() on a closed channel should fail"
+    except ChannelClosedError:
+        pass
+    print("  ✓ Bounded put/get, close and drain")
+
+    # A producer far faster than its consumer never holds more than 4 items
+    source = """
+    var q: chan = channel(4)
+    var total: number = 0
+    par {
+        {
+            var i: number = 0
+            while (i < 2000) {
+                q.put(i)
+                i = i + 1
+            }
+            q.close()
+        }
+        {
+            for (var x: number in q) {
+                total = total + x
+            }
+        }
+    }
+    """
+    runner = MiniparRunner()
+    runner.run_source(source)
+    assert runner.global_scope.get("total") == sum(range(2000))
+    print("  ✓ Producer and consumer branches run concurrently")
+
+    failing = "var q: chan = channel(1)\nq.close()\npar {\n q.put(1)\n print(len(q))\n}"
+    try:
+        MiniparRunner().run_source(failing)
+        assert False, "an error in a branch should end the PAR block"
+    except ChannelClosedError:
+        pass
+    for bad in ("var q: chan = channel(2)\nq.push(1)",
+                "var q: chan = channel(2)\nq.put()",
+                "var n: number = 1\nvar q: chan = channel(\"big\")"):
+        analyzer = SemanticAnalyzer()
+        assert not analyzer.analyze(Parser(Lexer(bad).tokenize()).parse()), bad
+    print("  ✓ Branch errors re-raised, misuse rejected by the analyzer")
+
+    source = """
+    var q: chan = channel(8)
+    var total: number = 0
+    par {
+        {
+            var i: number = 0
+            while (i < 5000) {
+                q.put(i)
+                i = i + 1
+            }
+            q.put(-1)
+        }
+        {
+            var x: number = q.get()
+            while (x >= 0) {
+                total = total + x
+                x = q.get()
+            }
+        }
+    }
+    print(total)
+    """
+    codegen = CodeGenerator()
+    codegen.generate(Parser(Lexer(source).tokenize()).parse())
+    c_code = CCodeGenerator().generate(codegen.code)
+    assert "#include <pthread.h>" in c_code and "pthread_create" in c_code
+    assert "__chan_put(q, i);" in c_code and "= __chan_get(q);" in c_code
+    gcc = shutil.which("gcc")
+    if gcc:
+        with tempfile.TemporaryDirectory() as tmp:
+            c_file = os.path.join(tmp, "chan.c")
+            exe = os.path.join(tmp, "chan")
+            with open(c_file, "w") as f:
+                f.write(c_code)
+            assert Backend.thread_flags(c_file) == ["-pthread"]
+            subprocess.run([gcc, "-O2", "-pthread", c_file, "-o", exe], check=True)
+            out = subprocess.run([exe], capture_output=True, text=True, timeout=10).stdout
+            assert out.strip() == str(sum(range(5000))), out
+        print("  ✓ C backend: branches on pthreads, channels on mutex/condvar")
+    else:
+        print("  ✓ C backend: pthread code generated (gcc not found, not run)")
+
+    print("✅ Local channel tests passed!\n")
+
+
+def test_parallel_for():
+    print("Testing Parallel For Loops...")
+
+    def analyze(source: str) -> SemanticAnalyzer:
+        analyzer = SemanticAnalyzer()
+        analyzer.analyze(Parser(Lexer(source).tokenize()).parse())
+        return analyzer
+
+    header = "var total: number = 0\nvar name: string = \"\"\nvar xs: list = [1, 2]\n"
+    for body, error in (
+        ("par for (var x: number in xs) { total = total + x }", "cannot assign to 'total'"),
+        ("par for (var x: number in xs) { xs.append(x) }", "cannot append() on 'xs'"),
+        ("par for (var x: number in xs) { break }", "Break statement in par for"),
+        ("par for (var x: number in xs) reduce(avg: total) { }", "Unknown reduction 'avg'"),
+        ("par for (var x: number in xs) reduce(sum: name) { }", "'name' must be a number"),
+    ):
+        errors = analyze(header + body).errors
+        assert any(error in e for e in errors), (body, errors)
+    ok = """
+    par for (var x: number in range(0, 10)) reduce(sum: total) {
+        var ys: list = []
+        var i: number = 0
+        while (true) {
+            if (i == x) { break }
+            ys.append(i)
+            i = i + 1
+        }
+        total = total + len(ys)
+    }
+    """
+    assert analyze(header + ok).errors == []
+    print("  ✓ Analyzer only allows writes to loop locals and reductions")
+
+    source = """
+    var total: number = 5
+    var count: number = 0
+    var best: number = 0
+    var worst: number = 100
+    var xs: list = [4, 8, 15, 16, 23, 42]
+    par for (var x: number in xs) reduce(sum: total, sum: count, max: best, min: worst) {
+        if (x == 15) { continue }
+        total = total + x
+        count = count + 1
+        if (x > best) { best = x }
+        if (x < worst) { worst = x }
+    }
+    var fact: number = 1
+    par for (var k: number in range(1, 11)) reduce(product: fact) {
+        fact = fact * k
+    }
+    """
+    for workers in (1, 3, 8):
+        runner = MiniparRunner()
+        runner.par_workers = workers
+        runner.run_source(source)
+        got = [runner.global_scope.get(name) for name in ("total", "count", "best", "worst", "fact")]
+        assert got == [5 + 93, 5, 42, 4, 3628800], (workers, got)
+    print("  ✓ Reductions combine the same way for 1, 3 and 8 workers")
+
+    runner = MiniparRunner()
+    runner.par_workers = 4
+    runner.run_source("""
+    var total: number = 7
+    var best: number = 3
+    par for (var x: number in []) reduce(sum: total) { total = total + x }
+    par for (var x: number in range(0, 0)) reduce(max: best) { if (x > best) { best = x } }
+    """)
+    assert [runner.global_scope.get("total"), runner.global_scope.get("best")] == [7, 3]
+    print("  ✓ Empty par for loops leave reductions unchanged")
+
+    runner = MiniparRunner()
+    runner.par_workers = 4
+    try:
+        runner.run_source("par for (var x: number in range(0, 8)) { var y: number = 1 / (x - 5) }")
+        assert False, "an error in an iteration should end the loop"
+    except ZeroDivisionError:
+        pass
+    runner.run_source("var q: chan = channel(4)\nfunc f(n: number) -> number { return n * 2 }")
+    loops = Parser(Lexer("""
+    par for (var x: number in range(0, 4)) { var y: number = f(x) }
+    par for (var x: number in range(0, 4)) { q.put(x) }
+    """).tokenize()).parse().declarations
+    assert runner._process_safe(loops[0].body, set())
+    assert not runner._process_safe(loops[1].body, set())
+    print("  ✓ Iteration errors re-raised, channel bodies kept out of forked workers")
+
+    helpers = """
+    var results: list = []
+    var hits: number = 0
+    func add(lst: list, v: number) -> void { lst.append(v) }
+    func bump() -> void { hits = hits + 1 }
+    func push(out: chan, v: number) -> void { out.put(v) }
+    """
+    for body, name in (("add(results, x)", "results"), ("bump()", "hits")):
+        errors = analyze(helpers + f"par for (var x: number in range(0, 100)) {{ {body} }}").errors
+        assert any(f"a function called in the loop writes '{name}'" in e for e in errors), errors
+    runner = MiniparRunner()
+    runner.par_workers = 4
+    runner.run_source(helpers + """
+    var q: chan = channel(8)
+    par for (var x: number in range(0, 8)) { push(q, x) }
+    q.close()
+    var got: number = 0
+    for (var v: number in q) { got = got + 1 }
+    """)
+    assert runner.global_scope.get("got") == 8
+    print("  ✓ Writes through called functions rejected, chan parameters kept out of forks")
+
+    source = """
+    var total: number = 0
+    var best: number = 0
+    func score(n: number) -> number {
+        return n * n % 1000
+    }
+    par for (var x: number in range(0, 40000)) reduce(sum: total, max: best) {
+        var s: number = score(x)
+        if (s % 2 == 1) { continue }
+        total = total + s
+        if (s > best) { best = s }
+    }
+    print(total, best)
+    """
+    codegen = CodeGenerator()
+    codegen.generate(Parser(Lexer(source).tokenize()).parse())
+    c_code = CCodeGenerator().generate(codegen.code)
+    assert "#pragma omp parallel for reduction(+:total) reduction(max:best)" in c_code
+    plain = CodeGenerator()
+    plain.generate(Parser(Lexer("var x: number = 2\nprint(x * 3)").tokenize()).parse())
+    with tempfile.TemporaryDirectory() as tmp:
+        flags = []
+        for name, code in (("plain", CCodeGenerator().generate(plain.code)), ("parfor", c_code)):
+            with open(os.path.join(tmp, f"{name}.c"), "w") as f:
+                f.write(code)
+            flags.append(Backend.thread_flags(os.path.join(tmp, f"{name}.c")))
+    assert flags == [[], ["-fopenmp"]], flags
+    print("  ✓ Backend adds -fopenmp only for code with par for loops")
+    gcc = shutil.which("gcc")
+    if gcc:
+        with tempfile.TemporaryDirectory() as tmp:
+            c_file = os.path.join(tmp, "parfor.c")
+            exe = os.path.join(tmp, "parfor")
+            with open(c_file, "w") as f:
+                f.write(c_code)
+            subprocess.run([gcc, "-O2", "-fopenmp", c_file, "-o", exe], check=True)
+            out = subprocess.run([exe], capture_output=True, text=True, timeout=10).stdout
+            assert out.split() == ["9800000", "996"], out
+        print("  ✓ C backend: OpenMP loop with reductions")
+    else:
+        print("  ✓ C backend: OpenMP loop generated (gcc not found, not run)")
+
+    print("✅ Parallel for tests passed!\n")
+
+
+def test_work_stealing():
+    print("Testing Work-Stealing PAR Scheduler...")
+
+    scheduler = WorkStealingScheduler(2)
+
+    def fib(n: int) -> int:
+        if n < 2:
+            return n
+        return sum(scheduler.run_all([lambda: fib(n - 1), lambda: fib(n - 2)]))
+
+    assert fib(15) == 610
+    assert len(scheduler.threads) == 2 and scheduler.tasks > 1000
+    try:
+        scheduler.run_all([lambda: 1, lambda: 1 / 0])
+        assert False, "a failing task should fail run_all()"
+    except ZeroDivisionError:
+        pass
+    scheduler.shutdown()
+    print("  ✓ Nested fork-join runs on a fixed pool, errors re-raised")
+
+    import random
+    values = [random.randrange(1000) for _ in range(300)]
+    source = """
+    func qsort(xs: list) -> list {
+        if (len(xs) < 2) { return xs }
+        var pivot: number = xs[0]
+        var lo: list = []
+        var hi: list = []
+        for (var x: number in xs[1:]) {
+            if (x < pivot) { lo.append(x) } else { hi.append(x) }
+        }
+        var a: list = []
+        var b: list = []
+        par {
+            a = qsort(lo)
+            b = qsort(hi)
+        }
+        return a + [pivot] + b
+    }
+    var sorted: list = qsort(%s)
+    """ % values
+    runner = MiniparRunner()
+    runner.scheduler = WorkStealingScheduler(3)
+    baseline = threading.active_count()
+    peak = [baseline]
+    running = threading.Event()
+    running.set()
+
+    def sample():
+        while running.is_set():
+            peak[0] = max(peak[0], threading.active_count())
+            time.sleep(0.001)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    runner.run_source(source)
+    running.clear()
+    sampler.join()
+    assert runner.global_scope.get("sorted") == sorted(values)
+    assert peak[0] <= baseline + 1 + 3, f"{peak[0] - baseline - 1} threads for nested PAR"
+    runner.scheduler.shutdown()
+    print(f"  ✓ Recursive PAR quicksort on 3 workers ({runner.scheduler.steals} steals)")
+
+    # Stages get their channels as parameters; queued behind one another on
+    # a single worker they would wait on each other forever
+    runner = MiniparRunner()
+    runner.scheduler = WorkStealingScheduler(1)
+    done = []
+    pipeline = threading.Thread(target=lambda: done.append(runner.run_source("""
+    var c1: chan = channel(1)
+    var c2: chan = channel(1)
+    var total: number = 0
+    func produce(out: chan) -> void {
+        for (var i: number in range(0, 20)) { out.put(i) }
+        out.close()
+    }
+    func relay(src: chan, dst: chan) -> void {
+        for (var v: number in src) { dst.put(v * 2) }
+        dst.close()
+    }
+    func consume(src: chan) -> number {
+        var sum: number = 0
+        for (var v: number in src) { sum = sum + v }
+        return sum
+    }
+    par {
+        produce(c1)
+        relay(c1, c2)
+        total = consume(c2)
+    }
+    """)), daemon=True)
+    pipeline.start()
+    pipeline.join(20)
+    assert done, "pipeline stages passed channels as parameters deadlocked on one worker"
+    assert runner.global_scope.get("total") == 2 * sum(range(20))
+    runner.scheduler.shutdown()
+    print("  ✓ Channel pipeline through parameters runs on a single worker")
+
+    # Every print() line of concurrent branches comes out whole, on a real
+    # stdout where the interpreter lock can switch threads mid-print
+    with tempfile.NamedTemporaryFile('w', suffix='.minipar', delete=False) as f:
+        f.write("""
+        func say(tag: string) -> void {
+            var i: number = 0
+            while (i < 2000) {
+                print(tag, "line", i, "=", i * 2)
+                i = i + 1
+            }
+        }
+        par {
+            say("left")
+            say("right")
+            say("middle")
+        }
+        """)
+    runner_py = os.path.join(os.path.dirname(__file__), '..', 'src', 'runner.py')
+    try:
+        out = subprocess.run([sys.executable, runner_py, f.name], capture_output=True,
+                             text=True, timeout=120).stdout
+    finally:
+        os.unlink(f.name)
+    lines = [line for line in out.splitlines() if "line" in line or "=" in line]
+    expected = {f"{tag} line {i} = {i * 2}"
+                for tag in ("left", "right", "middle") for i in range(2000)}
+    assert set(lines) <= expected | {"=" * 60} and len(set(lines) & expected) == 6000, \
+        "print() lines of PAR branches mixed"
+    print("  ✓ print() lines of concurrent branches stay intact")
+
+    print("✅ Work-stealing tests passed!\n")
+
+
+def start_par_worker(port: int) -> subprocess.Popen:
+    """Start a PAR worker daemon process on localhost:port and wait until it listens"""
+    runner_py = os.path.join(os.path.dirname(__file__), '..', 'src', 'runner.py')
+    worker = subprocess.Popen([sys.executable, runner_py, '--par-worker', f"localhost:{port}"],
+                              stdout=subprocess.PIPE, text=True)
+    line = worker.stdout.readline()
+    assert line.startswith("PAR worker listening"), f"worker did not start: {line!r}"
+    return worker
+
+
+def test_distributed_par():
+    print("Testing Distributed PAR Execution...")
+
+    configure_logging('off')
+    workers = [start_par_worker(port) for port in (free_port(), free_port(), free_port())]
+    try:
+        runner = MiniparRunner()
+        runner.cluster = DistributedScheduler([f"localhost:{w.args[-1].split(':')[1]}"
+                                               for w in workers])
+        fib = """
+        func fib(n: number) -> number {
+            if (n < 2) { return n }
+            return fib(n - 1) + fib(n - 2)
+        }
+        """
+        source = fib + """
+        var a: number = 0
+        var b: number = 0
+        var c: number = 0
+        var xs: list = [1]
+        var alias: list = xs
+        par {
+            a = fib(15)
+            b = fib(16)
+            { c = fib(17)  print("c done") }
+            { xs.append(fib(10)) }
+        }
+        """
+        out = io.StringIO()
+        sys.stdout, saved = out, sys.stdout
+        try:
+            runner.run_source(source)
+        finally:
+            sys.stdout = saved
+        assert [runner.global_scope.get(n) for n in "abc"] == [610, 987, 1597]
+        assert runner.global_scope.get("alias") == [1, 55], "list updated in place"
+        assert out.getvalue() == "c done\n"
+        assert runner.cluster.shipped == 4
+        print("  ✓ Branches, their functions and captured values shipped to 3 workers")
+
+        try:
+            runner.run_source("var z: number = 0\nvar w: number = 0\n"
+                              "par {\n z = 1 / 0\n w = 1\n}")
+            assert False, "a branch's error should be raised by the PAR block"
+        except ZeroDivisionError:
+            pass
+        print("  ✓ Errors raised on a worker re-raised by the PAR block")
+
+        workers[0].kill()
+        workers[0].wait()
+        cluster = runner.cluster
+        for n in range(3):
+            changes, _, error = cluster.run(runner.functions,
+                                            Assignment("a", FuncCall("fib", [NumberLiteral(12 + n)])),
+                                            {"a": 0})
+            assert error is None and changes == {"a": [144, 233, 377][n]}
+        assert cluster.retries >= 1 and cluster.fallbacks == 0
+        assert sum(not w['up'] for w in cluster.stats()['workers']) == 1
+        print(f"  ✓ Dead worker ejected, its branch retried ({cluster.retries} retries)")
+
+        for worker in workers[1:]:
+            worker.kill()
+            worker.wait()
+        runner.run_source(fib + "var d: number = 0\nvar e: number = 0\n"
+                                "par {\n d = fib(11)\n e = fib(12)\n}")
+        assert runner.global_scope.get("d") == 89 and runner.global_scope.get("e") == 144
+        assert cluster.fallbacks == 2
+        print("  ✓ Branches run locally once no worker is left")
+
+        # A worker that never answers is given up on instead of blocking the block
+        assert DistributedScheduler().config.recv_timeout > 0
+        listener = create_listener("tcp", ("localhost", 0), 16)
+        hang = threading.Event()
+        server = SelectorServer(listener, "hung", lambda payload: hang.wait(10) and "",
+                                ServerMetrics(), workers=1)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        hung = DistributedScheduler([f"localhost:{listener.getsockname()[1]}"], attempts=1,
+                                    config=ClientConfig(pool=False, recv_timeout=0.2))
+        started = time.monotonic()
+        assert hung.run(runner.functions, Assignment("a", NumberLiteral(1)), {"a": 0}) is None
+        assert time.monotonic() - started < 5
+        assert hung.stats()['retries'] == 1 and hung.stats()['fallbacks'] == 1
+        hang.set()
+        hung.close()
+        listener.close()
+        print("  ✓ Hung worker times out and its branch runs locally")
+        runner.cleanup()
+    finally:
+        for worker in workers:
+            if worker.poll() is None:
+                worker.kill()
+            worker.wait()
+        configure_logging('warning')
+
+    print("✅ Distributed PAR tests passed!\n")
+
+
+def test_green_threads():
+    print("Testing Green-Thread PAR Scheduler...")
+
+    runner = MiniparRunner()
+    start = time.perf_counter()
+    runner.run_source("sleep(0.05)")
+    assert time.perf_counter() - start >= 0.05
+    print("  ✓ sleep() pauses the runner")
+
+    def green_runner() -> MiniparRunner:
+        runner = MiniparRunner()
+        runner.green = GreenScheduler()
+        return runner
+
+    runner = green_runner()
+    tasks = 10000
+    source = ("var count: number = 0\n"
+              "func tick() -> void {\n sleep(0.2)\n count = count + 1\n}\n"
+              "par {\n" + "tick()\n" * tasks + "}\n")
+    threads = threading.active_count()
+    peak = [threads]
+    running = threading.Event()
+    running.set()
+
+    def sample():
+        while running.is_set():
+            peak[0] = max(peak[0], threading.active_count())
+            time.sleep(0.01)
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    start = time.perf_counter()
+    runner.run_source(source)
+    elapsed = time.perf_counter() - start
+    running.clear()
+    sampler.join()
+    assert runner.global_scope.get("count") == tasks
+    assert peak[0] <= threads + 1, "green tasks should not start threads"
+    assert elapsed < 10, f"{tasks} sleeping tasks took {elapsed:.1f}s"
+    print(f"  ✓ {tasks} sleeping PAR tasks on one thread in {elapsed:.2f}s")
+
+    runner = green_runner()
+    runner.run_source("""
+    var q: chan = channel(2)
+    var total: number = 0
+    func produce(x: number) -> void {
+        sleep(0.001)
+        q.put(x)
+    }
+    par {
+        {
+            for (var i: number in range(0, 10)) {
+                par { produce(i)  produce(i + 100) }
+            }
+            q.close()
+        }
+        { for (var x: number in q) { total = total + x } }
+    }
+    """)
+    assert runner.global_scope.get("total") == sum(range(10)) + sum(range(100, 110))
+    print("  ✓ Channel put/get, close and nested PAR yield to other tasks")
+
+    runner = green_runner()
+    runner.run_source("""
+    var order: list = []
+    par {
+        { var i: number = 0  while (i < 50) { order.append(1)  i = i + 1 } }
+        { var j: number = 0  while (j < 50) { order.append(2)  j = j + 1 } }
+    }
+    """)
+    order = runner.global_scope.get("order")
+    assert sorted(order) == [1] * 50 + [2] * 50 and order[:2] == [1, 2], "loops take turns"
+    print("  ✓ Busy loops yield at back-edges")
+
+    runner = green_runner()
+    try:
+        runner.run_source("var q: chan = channel(1)\npar {\n q.get()\n q.get()\n}")
+        assert False, "tasks waiting on a channel nothing uses should fail"
+    except RuntimeError as e:
+        assert "deadlock" in str(e)
+    print("  ✓ Deadlocked tasks reported instead of hanging")
+
+    # Each request takes 0.3s on the server; waiting for them must not stop
+    # the other tasks, so four requests take about as long as one
+    port = free_port()
+    runner = green_runner()
+    start = time.perf_counter()
+    runner.run_source(f"""
+    func slow(n: number) -> number {{
+        sleep(0.3)
+        return n * 2
+    }}
+    s_channel green_server {{slow, "slow doubler", "localhost", {port}}}
+    c_channel a {{"localhost", {port}, {{"pool": false}}}}
+    c_channel b {{"localhost", {port}, {{"pool": false}}}}
+    c_channel c {{"localhost", {port}, {{"pool": false}}}}
+    var ra: any = 0
+    var rb: any = 0
+    var rc: any = 0
+    var ticks: number = 0
+    par {{
+        ra = a.send(1)
+        rb = b.send(2)
+        rc = await(c.send_async(3)) + c.send(4)
+        {{ var i: number = 0  while (i < 5) {{ sleep(0.02)  ticks = ticks + 1  i = i + 1 }} }}
+    }}
+    """)
+    elapsed = time.perf_counter() - start
+    runner.cleanup()
+    assert [runner.global_scope.get(name) for name in ("ra", "rb", "rc")] == [2, 4, 6 + 8]
+    assert runner.global_scope.get("ticks") == 5
+    assert elapsed < 0.3 * 4, f"requests ran one after another ({elapsed:.2f}s)"
+    print(f"  ✓ Network requests and await() let other tasks run ({elapsed:.2f}s)")
+
+    print("✅ Green-thread tests passed!\n")
+
+
+def test_effect_analysis():
+    print("Testing PAR Race and Effect Analysis...")
+
+    def analyze(source: str):
+        ast = Parser(Lexer(source).tokenize()).parse()
+        analyzer = SemanticAnalyzer()
+        assert analyzer.analyze(ast), analyzer.errors
+        blocks = [node for node in ast.declarations if type(node).__name__ == "ParBlock"]
+        return ast, analyzer, blocks
+
+    _, analyzer, (racy, clean, talking) = analyze("""
+    func add(xs: list, v: number) -> void { xs.append(v) }
+    func first(xs: list) -> list { return xs }
+    func fib(n: number) -> number {
+        if (n < 2) { return n }
+        return fib(n - 1) + fib(n - 2)
+    }
+    var a: list = []
+    var b: list = []
+    var total: number = 0
+    var x: number = 0
+    par {
+        add(a, 1)
+        { var alias: list = first(b)  alias.append(2) }
+        { total = total + fib(5) }
+        { x = len(b) + total }
+    }
+    par {
+        add(a, 1)
+        add(b, 2)
+        x = fib(10)
+    }
+    var q: chan = channel(2)
+    par {
+        q.put(1)
+        { var y: number = q.get()  print(y) }
+    }
+    """)
+    assert racy.races == {"b": [1, 3], "total": [2, 3]} and not racy.independent
+    assert len(analyzer.warnings) == 2
+    assert "branches 2, 4 race on 'b' (written by 2)" in analyzer.warnings[0]
+    assert clean.races == {} and clean.independent
+    assert talking.races == {} and talking.communicates and not talking.independent
+    print("  ✓ Races found through parameters, return values and local aliases")
+
+    _, analyzer, (passed, stored, held) = analyze("""
+    func add(items: list, v: number) -> void { items.append(v) }
+    var log: list = []
+    var keep: list = []
+    func stash(items: list) -> void { keep = items }
+    var seen: list = []
+    var other: list = []
+    var spare: list = []
+    var ref: any = seen
+    var count: number = 0
+    var copy: number = count
+    par {
+        add(ref, 1)
+        print(len(seen))
+        { copy = 1 }
+        print(count)
+    }
+    stash(log)
+    par {
+        add(keep, 2)
+        print(log)
+        add(other, 3)
+    }
+    var both: list = [spare, other]
+    par {
+        { for (var inner: list in both) { add(inner, 4) } }
+        print(other)
+    }
+    """)
+    assert passed.races == {"ref": [0, 1], "seen": [0, 1]}, passed.races
+    assert stored.races == {"keep": [0, 1], "log": [0, 1]}, stored.races
+    assert held.races == {"both": [0, 1], "other": [0, 1], "spare": [0, 1]}, held.races
+    assert analyzer.shared_objects()["seen"] == {"ref", "seen"}
+    assert "count" not in analyzer.shared_objects()
+    print("  ✓ Writes through globals aliasing the same list reach all of them")
+
+    ast, analyzer, (block,) = analyze("""
+    var hits: number = 0
+    var total: number = 0
+    par {
+        { hits = hits + 1  total = total + 1 }
+        { hits = hits + 2 }
+    }
+    print(hits)
+    """)
+    assert block.races == {"hits": [0, 1]} and not block.communicates
+    codegen = CodeGenerator()
+    codegen.generate(ast)
+    c_code = CCodeGenerator().generate(codegen.code)
+    assert "pthread_create" not in c_code and "sequential execution" in c_code
+    print("  ✓ C backend runs racing branches in order instead of on threads")
+
+    print("✅ Effect analysis tests passed!\n")
+
+
+def main():
+    print("=" * 60)
+    print("Minipar Channel Runtime Test Suite")
+    print("=" * 60)
+    print()
+
+    try:
+        test_server_config()
+        test_framing()
+        test_worker_pool()
+        test_selector_server()
+        test_client_pool()
+        test_pipelined_sends()
+        test_channel_logging()
+        test_concurrent_handlers()
+        test_local_transports()
+        test_load_balancing()
+        test_prefork_server()
+        test_channel_telemetry()
+        test_load_generator()
+        test_server_readiness()
+        test_response_cache()
+        test_timeouts_and_deadlines()
+        test_streaming()
+        test_multiplexed_rpc()
+        test_local_channels()
+        test_parallel_for()
+        test_work_stealing()
+        test_distributed_par()
+        test_green_threads()
+        test_effect_analysis()
+
+        print("=" * 60)
+        print("✅ All channel tests passed successfully!")
+        print("=" * 60)
+
+    except AssertionError as e:
+        print(f"\n❌ Test failed: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n❌ Unexpected error: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
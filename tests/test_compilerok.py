@@ -70,6 +70,27 @@ def test_lexer():
     assert TokenType.NUMBER in token_types
     print("  ✓ Comments handled")
     
+    # Test 5: Master-pattern and character scanners agree
+    def scan(source, mode):
+        try:
+            return [(t.type, t.value, t.line, t.column) for t in Lexer(source, mode).tokenize()]
+        except Exception as e:
+            return (type(e).__name__, str(e))
+    
+    examples_dir = os.path.join(os.path.dirname(__file__), '..', 'examples')
+    sources = [
+        'x = "a\\tb\\"c\\\\" -> 1.5.2 && y || !z # note\n\r\n\tw /* a\n b */ 7.',
+        'número = 12٣ + x²;', 'a & b', '"open', '/* open', 'a /b */ c', '',
+    ]
+    for filename in sorted(os.listdir(examples_dir)):
+        if filename.endswith('.minipar'):
+            with open(os.path.join(examples_dir, filename), 'r', encoding='utf-8') as f:
+                sources.append(f.read())
+    for source in sources:
+        assert scan(source, 'regex') == scan(source, 'chars'), source[:40]
+    assert scan('a\n  "x"', 'regex')[1] == (TokenType.STRING_LITERAL, 'x', 2, 3)
+    print("  ✓ Master-pattern lexer matches the character scanner")
+    
     print("✅ Lexer tests passed!\n")
 
 
@@ -126,6 +147,22 @@ def test_parser():
     assert len(ast.declarations) == 1
     print("  ✓ While loop parsed")
     
+    # Test 5: Streamed tokens, pulled only a few ahead of the parser
+    source = "func f(a: number) -> number { return a * 2 }\n" + "".join(
+        f"var x{i}: number = f({i}) + x{i - 1}[0]\n" for i in range(1, 200))
+    parser = None
+    ahead = []
+    
+    def stream():
+        for pulled, token in enumerate(Lexer(source).iter_tokens()):
+            ahead.append(pulled - parser.pos)
+            yield token
+    
+    parser = Parser(stream())
+    assert parser.parse() == Parser(Lexer(source).tokenize()).parse()
+    assert len(ahead) > 2000 and max(ahead) <= 3
+    print("  ✓ Streamed tokens parsed with a bounded lookahead")
+    
     print("✅ Parser tests passed!\n")
 
 